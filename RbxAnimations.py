@@ -27,95 +27,670 @@
 #   To blender: A bunch of extra meshes whose names encode metadata (they are numbered, the contents are together encoded in base32)
 #   From blender: Base64-encoded string (after compression)
 #
+# The bake math itself lives in RbxAnimationsCore.py (no bpy), which has to be installed next to this file.
+#
 
 import bpy, math, re, json, bpy_extras
+import os, sys, argparse
+import fnmatch
+import hashlib
+import subprocess
+import tempfile
+import time
+import cProfile
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from itertools import chain
-from mathutils import Vector, Matrix
-import zlib
-import base64
-from bpy_extras.io_utils import ImportHelper
+from mathutils import Vector, Matrix, Euler
+import numpy as np
+from bpy_extras.io_utils import ImportHelper, ExportHelper
 from bpy.props import *
 
+# Blender only puts the add-ons folder on sys.path, not the folder of a script run with --python (headless baking, the
+#   parallel bake workers), and ignores PYTHONPATH unless started with --python-use-system-env
+addon_dir = os.path.dirname(os.path.abspath(__file__))
+if addon_dir not in sys.path:
+    sys.path.insert(0, addon_dir)
+try:
+    import RbxAnimationsCore as core
+except ImportError as e:
+    raise ImportError('RbxAnimationsCore.py was not found next to RbxAnimations.py in {}. The add-on is made of two files: '
+        'zip RbxAnimations.py and RbxAnimationsCore.py together and install the zip, or copy both files into the add-ons folder.'.format(addon_dir)) from e
+
 transform_to_blender = bpy_extras.io_utils.axis_conversion(from_forward='Z', from_up='Y', to_forward='-Y', to_up='Z').to_4x4() # transformation matrix from Y-up to Z-up
-identity_cf = [0,0,0,1,0,0,0,1,0,0,0,1] # identity CF components matrix
-cf_round = False # round cframes before exporting? (reduce size)
-cf_round_fac = 4 # round to how many decimals?
 
 # y-up cf -> y-up mat
 def cf_to_mat(cf):
-    mat = Matrix.Translation((cf[0], cf[1], cf[2]))
-    mat[0][0:3] = (cf[3], cf[4], cf[5])
-    mat[1][0:3] = (cf[6], cf[7], cf[8])
-    mat[2][0:3] = (cf[9], cf[10], cf[11])
+    return Matrix(core.cf_to_mat(cf).tolist())
+
+# links objects to bones with the transformation equal to the current(!) transformation between the bone and object
+# links: [(object, bone name, bone matrix)], the first CHILD_OF constraint of an object is re-targeted, others are removed
+def link_objects_to_bones_rigid(ao, links):
+    for obj, bone_name, bone_matrix in links:
+        constraints = [c for c in obj.constraints if c.type == 'CHILD_OF']
+        for constraint in constraints[1:]:
+            obj.constraints.remove(constraint)
+        
+        constraint = constraints[0] if constraints else obj.constraints.new(type = 'CHILD_OF')
+        constraint.target = ao
+        constraint.subtarget = bone_name
+        constraint.inverse_matrix = (ao.matrix_world @ bone_matrix).inverted()
+
+## MATRIX CACHE ##
+
+# rest matrices of rig bones, read from the bones (and their custom properties) and inverted once instead of for every
+#   bone of every frame: {(armature data pointer, bone name, kind): read-only numpy matrix}
+# cleared when a rig is (re)built or removed and when an armature leaves edit mode (see on_depsgraph_update), custom
+#   property edits by hand are not noticed, rebuild the rig after those
+matrix_cache = {}
+matrix_cache_stats = {'hits': 0, 'misses': 0}
+
+# how every kind of cached matrix is read from a bpy.types.Bone, '<kind>_inv' kinds are the inverses of these
+bone_matrix_readers = {
+    'rest': lambda bone: np.array(bone.matrix_local),
+    'transform': lambda bone: np.array(Matrix(bone['transform'])), # C0 side, straight from the import cfs
+    'transform1': lambda bone: np.array(Matrix(bone['transform1'])), # C1 side
+    'nicetransform': lambda bone: np.array(Matrix(bone['nicetransform'])), # joint matrix -> bone matrix
+    'parent_offset': lambda bone: get_bone_matrix(bone.parent, 'rest_inv') @ get_bone_matrix(bone, 'rest') if bone.parent else get_bone_matrix(bone, 'rest'),
+}
+
+# the cached matrix of a bone (bpy.types.Bone) of the given kind, see bone_matrix_readers
+def get_bone_matrix(bone, kind):
+    key = (bone.id_data.as_pointer(), bone.name, kind)
+    mat = matrix_cache.get(key)
+    if mat is not None:
+        matrix_cache_stats['hits'] += 1
+        return mat
+    
+    matrix_cache_stats['misses'] += 1
+    if kind.endswith('_inv'):
+        mat = np.linalg.inv(get_bone_matrix(bone, kind[:-len('_inv')]))
+    else:
+        mat = bone_matrix_readers[kind](bone)
+    mat.setflags(write=False)
+    matrix_cache[key] = mat
     return mat
 
-# y-up mat -> y-up cf
-def mat_to_cf(mat):
-    r_mat = [mat[0][3], mat[1][3], mat[2][3],
-        mat[0][0], mat[0][1], mat[0][2],
-        mat[1][0], mat[1][1], mat[1][2],
-        mat[2][0], mat[2][1], mat[2][2]
-    ]
-    return r_mat
-
-# links the passed object to the bone with the transformation equal to the current(!) transformation between the bone and object
-def link_object_to_bone_rigid(obj, ao, bone):
-    # remove existing
-    for constraint in [c for c in obj.constraints if c.type == 'CHILD_OF']:
-        obj.constraints.remove(constraint)
-
-    # create new
-    constraint = obj.constraints.new(type = 'CHILD_OF')
-    constraint.target = ao
-    constraint.subtarget = bone.name
-    constraint.inverse_matrix = (ao.matrix_world @ bone.matrix).inverted()
+# drops the cached matrices of an armature (bpy.types.Armature), or all of them
+def invalidate_matrix_cache(armature=None):
+    if armature is None:
+        matrix_cache.clear()
+        return
+    pointer = armature.as_pointer()
+    for key in [key for key in matrix_cache if key[0] == pointer]:
+        del matrix_cache[key]
+
+# {'hits', 'misses', 'entries'} of the matrix cache, counted since it was created
+def get_matrix_cache_stats():
+    return dict(matrix_cache_stats, entries=len(matrix_cache))
+
+# rigs are namespaced by the rigName of their metadata: the empty __RigMeta_<rigName> holds the metadata and the generated
+#   rig is __Rig_<rigName> (armature data __RigArm_<rigName>), files of older versions have one rig without the suffix
+rig_prefixes = ('__RigMeta', '__RigArm', '__Rig') # longest first, all start with '__Rig'
+
+# the namespace suffix ('_<rigName>' or '') of a rig metadata object, generated rig or rig armature
+def get_rig_suffix(obj):
+    for prefix in rig_prefixes:
+        if obj.name.startswith(prefix):
+            return obj.name[len(prefix):]
+    return ''
+
+# all rig metadata objects, sorted by name
+def get_rig_metas():
+    return sorted([obj for obj in bpy.data.objects if (obj.name == '__RigMeta' or obj.name.startswith('__RigMeta_')) and 'RigMeta' in obj],
+        key=lambda obj: obj.name)
+
+# name of the rig metadata object of a rigName (see rig_prefixes), the generated rig gets the same suffix
+def get_rig_meta_name(rig_name):
+    return '__RigMeta_' + rig_name
+
+def get_rig_meta_object(ao):
+    return bpy.data.objects.get('__RigMeta' + get_rig_suffix(ao))
+
+def get_rig_object(meta_obj):
+    return bpy.data.objects.get('__Rig' + get_rig_suffix(meta_obj))
+
+# all generated rigs (of every rig metadata object)
+def get_rigs():
+    return [ao for ao in (get_rig_object(meta_obj) for meta_obj in get_rig_metas()) if ao]
+
+# the metadata object of the rig chosen in the panel (see RbxAnimationsSettings.rig), or the first one
+def get_active_rig_meta(context):
+    settings = getattr(context.scene, 'rbxanims_settings', None)
+    meta_obj = bpy.data.objects.get(settings.rig) if settings and settings.rig != 'NONE' else None
+    if meta_obj is None or 'RigMeta' not in meta_obj:
+        metas = get_rig_metas()
+        meta_obj = metas[0] if metas else None
+    return meta_obj
+
+# the generated rig chosen in the panel, None if it was not generated yet
+def get_active_rig(context):
+    meta_obj = get_active_rig_meta(context)
+    return get_rig_object(meta_obj) if meta_obj else None
+
+# hash of the rig metadata, export plans built from other metadata are stale
+def get_rig_meta_hash(ao):
+    meta_obj = get_rig_meta_object(ao)
+    if not meta_obj or 'RigMeta' not in meta_obj:
+        return ''
+    return hashlib.sha1(meta_obj['RigMeta'].encode()).hexdigest()
 
-# serializes the current bone state to a dict
-def serialize_animation_state(ao):
-    state = {}
+# compiles the export plan of a rig (see RbxAnimationsCore.compile_export_plan) and stores it on the armature (json, like the rig meta)
+def build_export_plan(ao):
+    rest_bones = []
     for bone in ao.pose.bones:
-        if 'is_transformable' in bone.bone:
-            # original matrices, straight from the import cfs
-            # this is always the true baseline
-            orig_mat = Matrix(bone.bone['transform'])
-            orig_mat_tr1 = Matrix(bone.bone['transform1'])
-            parent_orig_mat = Matrix(bone.parent.bone['transform'])
-            parent_orig_mat_tr1 = Matrix(bone.parent.bone['transform1'])
-
-            # get the bone neutral transform
-            extr_transform = Matrix(bone.bone['nicetransform']).inverted()
-            parent_extr_transform = Matrix(bone.parent.bone['nicetransform']).inverted()
-            
-            # z-up -> y-up transform matrix
-            back_trans = transform_to_blender.inverted()
+        if 'transform' in bone.bone:
+            rest_bones.append({
+                'name': bone.name,
+                'parent': bone.parent.name if bone.parent else None,
+                'is_transformable': 'is_transformable' in bone.bone,
+                'transform': get_bone_matrix(bone.bone, 'transform').tolist(),
+                'transform1': get_bone_matrix(bone.bone, 'transform1').tolist(),
+                'nicetransform': get_bone_matrix(bone.bone, 'nicetransform').tolist(),
+            })
+    
+    plan = core.compile_export_plan(rest_bones)
+    plan['meta_hash'] = get_rig_meta_hash(ao)
+    ao.data['ExportPlan'] = json.dumps(plan, separators=(',',':'))
+    return plan
 
-            # get the real bone transform
-            cur_obj_transform = back_trans @ (bone.matrix @ extr_transform)
-            parent_obj_transform = back_trans @ (bone.parent.matrix @ parent_extr_transform)
-            
-            # compute neutrals after applying C1/transform1
-            orig_base_mat = back_trans @ (orig_mat @ orig_mat_tr1)
-            parent_orig_base_mat = back_trans @ (parent_orig_mat @ parent_orig_mat_tr1)
-            
-            # compute y-up bone transform (transformation between C0 and C1)
-            orig_transform = parent_orig_base_mat.inverted() @ orig_base_mat
-            cur_transform = parent_obj_transform.inverted() @ cur_obj_transform
-            bone_transform = orig_transform.inverted() @ cur_transform
-
-            statel = mat_to_cf(bone_transform)
-            if cf_round:
-                statel = list(map(lambda x: round(x, cf_round_fac), statel)) # compresses result
-            
-            # flatten, compresses the resulting json too
-            for i in range(len(statel)):
-                if int(statel[i]) ==  statel[i]:
-                    statel[i] = int(statel[i])
-            
-            # only store if not identity, compresses the resulting json
-            if statel != identity_cf:
-                state[bone.name] = statel
+# returns the export plan of a rig, rebuilt if missing or stale
+def get_export_plan(ao):
+    if 'ExportPlan' in ao.data:
+        plan = json.loads(ao.data['ExportPlan'])
+        if plan['meta_hash'] == get_rig_meta_hash(ao) and all(name in ao.pose.bones for name in plan['bones']):
+            return plan
+    return build_export_plan(ao)
+
+# samples the pose matrices of the plan bones for the given frames, (frames x plan bones x 4 x 4)
+def sample_pose_matrices(ao, frames, plan):
+    empty = np.empty((0, len(plan['bones']), 4, 4))
+    return next(iter_pose_batches(ao, frames, plan, max(len(frames), 1)), empty)
+
+# sample_pose_matrices in batches of at most batch_size frames, for streaming exports
+# rigs that only depend on their own action are sampled from the F-curves (see sample_pose_matrices_from_action),
+#   everything else goes through scene.frame_set, the path taken is stored in last_sampling
+def iter_pose_batches(ao, frames, plan, batch_size=256):
+    for mats, in iter_rigs_pose_batches([(ao, plan)], frames, batch_size):
+        yield mats
+
+# iter_pose_batches for several rigs at once, rigs: [(rig, plan)], yields [(frames x plan bones x 4 x 4) per rig]
+# the rigs that need scene evaluation share one frame_set per frame, each rig is read after every frame change
+def iter_rigs_pose_batches(rigs, frames, batch_size=256):
+    scene = bpy.context.scene
+    
+    # rigs in baked IK mode are read from their cache (solving the frames it misses first)
+    cached = [ao.name in ik_cache for ao, plan in rigs]
+    for (ao, plan), is_cached in zip(rigs, cached):
+        if is_cached:
+            ensure_ik_cache(ao, frames)
+    
+    blockers = [None if is_cached else get_action_sampling_blocker(ao) for (ao, plan), is_cached in zip(rigs, cached)]
+    last_sampling['path'] = 'SCENE' if any(blocker is not None for blocker in blockers) else 'IK_CACHE' if any(cached) else 'ACTION'
+    last_sampling['blocker'] = next((blocker for blocker in blockers if blocker is not None), None)
+    
+    sample_idx = []
+    for ao, plan in rigs:
+        index_of = {bone.name: i for i, bone in enumerate(ao.pose.bones)}
+        sample_idx.append([index_of[name] for name in plan['bones']])
+    swept = [n for n, blocker in enumerate(blockers) if blocker is not None]
+    
+    for start in range(0, len(frames), batch_size):
+        batch = frames[start:start+batch_size]
+        bufs = {n: np.empty((len(batch), len(rigs[n][0].pose.bones) * 16), dtype=np.float32) for n in swept}
+        if swept:
+            for f, i in enumerate(batch):
+                with core.timed('frame_eval'):
+                    scene.frame_set(i)
+                    bpy.context.evaluated_depsgraph_get().update()
+                with core.timed('pose_read'):
+                    for n in swept:
+                        rigs[n][0].pose.bones.foreach_get('matrix', bufs[n][f])
+        
+        batch_mats = []
+        for n, (ao, plan) in enumerate(rigs):
+            if cached[n]:
+                with core.timed('ik_cache'):
+                    batch_mats.append(sample_pose_matrices_from_ik_cache(ao, batch, plan))
+                continue
+            if n not in bufs:
+                with core.timed('action_eval'):
+                    batch_mats.append(sample_pose_matrices_from_action(ao, batch, plan))
+                continue
+            # foreach_get flattens column-major
+            with core.timed('pose_read'):
+                mats = bufs[n].reshape(len(batch), len(ao.pose.bones), 4, 4).transpose(0, 1, 3, 2)
+                batch_mats.append(mats[:, sample_idx[n]].astype(np.float64))
+        yield batch_mats
+
+last_sampling = {'path': None, 'blocker': None} # how the last batch of frames was sampled, see iter_pose_batches
+
+# returns why the pose of a rig can't be computed from its action alone, None if it can
+def get_action_sampling_blocker(ao):
+    anim = ao.animation_data
+    if anim:
+        if len(anim.drivers) > 0:
+            return 'drivers'
+        if any(not track.mute for track in anim.nla_tracks):
+            return 'NLA tracks'
+        if anim.action_influence != 1 or anim.action_blend_type != 'REPLACE':
+            return 'action blending'
+    
+    for bone in ao.pose.bones:
+        if len(bone.constraints) > 0:
+            return 'constraints on {}'.format(bone.name)
+        if not bone.bone.use_inherit_rotation or bone.bone.inherit_scale != 'FULL' or not bone.bone.use_local_location:
+            return 'non-default parenting of {}'.format(bone.name)
+    return None
+
+# computes the pose matrices of the plan bones straight from the action's F-curves (no scene evaluation),
+#   only valid if get_action_sampling_blocker returns None, (frames x plan bones x 4 x 4)
+def sample_pose_matrices_from_action(ao, frames, plan):
+    action = ao.animation_data.action if ao.animation_data else None
+    channels = {}
+    if action:
+        for fcurve in action.fcurves:
+            match = re.match(r'^pose\.bones\["(.+)"\]\.(\w+)$', fcurve.data_path)
+            if match and not fcurve.mute:
+                channels[(match.group(1), match.group(2), fcurve.array_index)] = fcurve
+    
+    # keyed channels are evaluated, the others keep their current value
+    def channel_values(bone, prop, size):
+        values = np.empty((len(frames), size))
+        current = getattr(bone, prop)
+        for i in range(size):
+            fcurve = channels.get((bone.name, prop, i))
+            values[:, i] = [fcurve.evaluate(frame) for frame in frames] if fcurve else current[i]
+        return values
+    
+    def basis(bone):
+        if bone.rotation_mode == 'QUATERNION':
+            quats = channel_values(bone, 'rotation_quaternion', 4)
+            rots = core.quats_to_mats(quats / np.linalg.norm(quats, axis=-1, keepdims=True))
+        elif bone.rotation_mode == 'AXIS_ANGLE':
+            rots = core.quats_to_mats(core.axis_angles_to_quats(channel_values(bone, 'rotation_axis_angle', 4)))
+        else:
+            rots = core.eulers_to_mats(channel_values(bone, 'rotation_euler', 3), bone.rotation_mode)
+        return core.compose_mats(channel_values(bone, 'location', 3), rots, channel_values(bone, 'scale', 3))
     
-    return state
+    return chain_pose_matrices(ao, plan['bones'], basis)
+
+# pose matrices of the named bones from the basis matrices of them and their ancestors (get_basis(pose bone) -> frames x 4 x 4),
+#   without constraints, (frames x bones x 4 x 4)
+def chain_pose_matrices(ao, names, get_basis):
+    # the bones and their ancestors, parents first
+    needed = {}
+    for name in names:
+        bone = ao.pose.bones[name]
+        for chain_bone in [bone] + list(bone.parent_recursive):
+            needed[chain_bone.name] = chain_bone
+    
+    mats = {}
+    for bone in sorted(needed.values(), key=lambda bone: len(bone.parent_recursive)):
+        if bone.parent:
+            mats[bone.name] = mats[bone.parent.name] @ get_bone_matrix(bone.bone, 'parent_offset') @ get_basis(bone)
+        else:
+            mats[bone.name] = get_bone_matrix(bone.bone, 'rest') @ get_basis(bone)
+    
+    return np.stack([mats[name] for name in names], axis=1)
+
+# pose samples of previous bakes per rig, so the next bake only re-samples frames whose animation changed
+#   {rig name: {'plan': export plan json, 'frames': {frame: plan bone matrices}, 'keys': action keyframe snapshots,
+#               'assignments': object -> action names, 'fingerprint': see get_bake_fingerprint,
+#               'touched': actions updated since the last bake (see on_depsgraph_update), 'resampled': frames sampled by the last bake}}
+bake_cache = {}
+transform_channels = ('location', 'rotation_quaternion', 'rotation_euler', 'rotation_axis_angle', 'scale')
+
+# objects whose animation the constraints of a rig depend on, the rig included
+def get_constraint_targets(ao):
+    targets = {ao.name: ao}
+    for bone in ao.pose.bones:
+        for constraint in bone.constraints:
+            for target in (getattr(constraint, 'target', None), getattr(constraint, 'pole_target', None)):
+                if target:
+                    targets[target.name] = target
+    return list(targets.values())
+
+# editable settings of a constraint, pointers by name
+def get_constraint_settings(constraint):
+    settings = []
+    for prop in constraint.bl_rna.properties:
+        if prop.is_readonly or prop.identifier == 'show_expanded' or prop.type not in {'BOOLEAN', 'INT', 'FLOAT', 'STRING', 'ENUM', 'POINTER'}:
+            continue
+        value = getattr(constraint, prop.identifier)
+        if prop.type == 'POINTER':
+            value = getattr(value, 'name', None)
+        elif isinstance(value, set):
+            value = tuple(sorted(value))
+        elif not isinstance(value, (bool, int, float, str)):
+            value = tuple(value)
+        settings.append((prop.identifier, value))
+    return settings
+
+# what the samples of a rig depend on besides its keyframes: the unkeyed transform channels and the constraints of the
+#   rig, its bones and its constraint targets, the bake cache is dropped when it changes (see get_bake_cache)
+# None if the rig can't be tracked, drivers can read anything
+def get_bake_fingerprint(ao):
+    if ao.name in ik_cache:
+        # the IK cache poses the rig and mutes its constraints, it tracks its own inputs
+        return 'IK_CACHE'
+    objects = get_constraint_targets(ao)
+    if any(obj.animation_data and len(obj.animation_data.drivers) > 0 for obj in objects):
+        return None
+    
+    fingerprint = []
+    for obj in objects:
+        keyed = {fcurve.data_path for fcurve in obj.animation_data.action.fcurves} if obj.animation_data and obj.animation_data.action else set()
+        for owner in [obj] + (list(obj.pose.bones) if obj.pose else []):
+            for prop in transform_channels:
+                path = owner.path_from_id(prop)
+                if path not in keyed:
+                    fingerprint.append((obj.name, path, tuple(getattr(owner, prop))))
+            for constraint in owner.constraints:
+                fingerprint.append((obj.name, owner.path_from_id(), constraint.name, get_constraint_settings(constraint)))
+    return fingerprint
+
+@bpy.app.handlers.persistent
+def on_depsgraph_update(scene, depsgraph):
+    for update in depsgraph.updates:
+        if isinstance(update.id, bpy.types.Action):
+            for cache in bake_cache.values():
+                cache['touched'].add(update.id.name)
+            for cache in ik_cache.values():
+                if update.id.name in cache['keys']:
+                    cache['touched'].add(update.id.name)
+        elif isinstance(update.id, bpy.types.Armature):
+            # rig edits (rest pose, bones, ...) invalidate the samples of the rigs depending on the armature,
+            #   rest matrices change when leaving edit mode
+            for name in list(bake_cache):
+                obj = bpy.data.objects.get(name)
+                if obj is None or obj.type != 'ARMATURE' or any(target.data == update.id.original for target in get_constraint_targets(obj)):
+                    del bake_cache[name]
+            if not update.id.original.is_editmode:
+                invalidate_matrix_cache(update.id.original)
+
+# snapshot of an action's keyframes, {(data_path, index): (keys x 8) array}, see RbxAnimationsCore.keyframe_dirty_range
+def snapshot_action_keys(action):
+    keys = {}
+    for fcurve in action.fcurves:
+        count = len(fcurve.keyframe_points)
+        co = np.empty(count * 2)
+        handle_left = np.empty(count * 2)
+        handle_right = np.empty(count * 2)
+        interpolation = np.empty(count)
+        fcurve.keyframe_points.foreach_get('co', co)
+        fcurve.keyframe_points.foreach_get('handle_left', handle_left)
+        fcurve.keyframe_points.foreach_get('handle_right', handle_right)
+        fcurve.keyframe_points.foreach_get('interpolation', interpolation)
+        keys[(fcurve.data_path, fcurve.array_index)] = np.column_stack((co.reshape(-1, 2), handle_left.reshape(-1, 2), handle_right.reshape(-1, 2), interpolation,
+            np.full(count, fcurve.mute or len(fcurve.modifiers) > 0 or fcurve.extrapolation != 'CONSTANT')))
+    return keys
+
+# frame ranges changed in an action since its snapshot, None if the whole timeline may have changed
+def get_action_dirty_ranges(action, old_keys):
+    new_keys = snapshot_action_keys(action)
+    if set(new_keys) != set(old_keys):
+        return None, new_keys
+    
+    ranges = []
+    for channel, keys in new_keys.items():
+        dirty = core.keyframe_dirty_range(old_keys[channel], keys)
+        if dirty:
+            ranges.append(dirty)
+    return ranges, new_keys
+
+# the bake cache of a rig without the samples of frames whose animation changed since the last bake, see bake_cache
+def get_bake_cache(ao):
+    cache = bake_cache.get(ao.name)
+    assignments = {obj.name: obj.animation_data.action.name for obj in bpy.data.objects if obj.animation_data and obj.animation_data.action}
+    fingerprint = get_bake_fingerprint(ao)
+    if cache is None or cache['plan'] != ao.data['ExportPlan'] or cache['assignments'] != assignments or fingerprint is None or cache['fingerprint'] != fingerprint:
+        cache = {'plan': ao.data['ExportPlan'], 'frames': {}, 'keys': {}, 'assignments': assignments, 'fingerprint': fingerprint, 'touched': set()}
+        bake_cache[ao.name] = cache
+    
+    # drop samples inside the keyframe ranges touched since the last bake
+    dirty = []
+    for name in cache['touched']:
+        action = bpy.data.actions.get(name)
+        if action is None or name not in cache['keys']:
+            dirty = None
+            break
+        ranges, cache['keys'][name] = get_action_dirty_ranges(action, cache['keys'][name])
+        if ranges is None:
+            dirty = None
+            break
+        dirty += ranges
+    cache['touched'].clear()
+    
+    if dirty is None:
+        cache['frames'].clear()
+    else:
+        for i in [i for i in cache['frames'] if any(lo <= i <= hi for lo, hi in dirty)]:
+            del cache['frames'][i]
+    if not cache['frames']:
+        cache['keys'] = {action.name: snapshot_action_keys(action) for action in bpy.data.actions}
+    return cache
+
+## IK CACHE ##
+
+# solved local (basis) transforms of the rigs in baked IK mode, so exports and playback read the IK/constraint result
+#   instead of solving the constraints again: {rig name: {
+#     'frames': (frames) sorted frame numbers, 'bones': bone names (pose bone order),
+#     'rotations': (frames x bones x 4) quaternions, 'locations', 'scales': (frames x bones x 3), all float32,
+#     'valid': (frames) False for frames whose keyframes changed since they were solved (re-solved by ensure_ik_cache),
+#     'keys': snapshots of the rig and constraint target actions, 'assignments': object -> action names, 'touched': actions
+#       updated since (see on_depsgraph_update), 'muted': (bone, constraint) names muted while the cache poses the rig,
+#     'channels': values of the unkeyed pose channels before the cache posed the rig, restored when the constraints are back on}}
+# while the cached frames are valid the constraints of the rig are muted and on_frame_change poses the rig from the cache,
+#   other frames are solved live, target edits without keyframes are not noticed (bake again)
+ik_cache = {}
+ik_cache_state = {'solving': False} # set while the constraints are solved for the cache, see solve_ik_frames
+
+def get_ik_cache_assignments(ao):
+    return {obj.name: obj.animation_data.action.name for obj in get_constraint_targets(ao) if obj.animation_data and obj.animation_data.action}
+
+# solves the constraints of a rig (live, current frame not restored) at the given frames, returns the solved basis transforms
+#   of all bones as (frames x bones x 4) quaternions and (frames x bones x 3) locations and scales
+def solve_ik_frames(ao, frames):
+    scene = bpy.context.scene
+    bones = ao.pose.bones
+    pose_mats = np.empty((len(frames), len(bones) * 16), dtype=np.float32)
+    ik_cache_state['solving'] = True
+    try:
+        for f, i in enumerate(frames):
+            with core.timed('frame_eval'):
+                scene.frame_set(i)
+                bpy.context.evaluated_depsgraph_get().update()
+            with core.timed('pose_read'):
+                bones.foreach_get('matrix', pose_mats[f])
+    finally:
+        ik_cache_state['solving'] = False
+    
+    with core.timed('matrix_math'):
+        # foreach_get flattens column-major
+        mats = pose_mats.reshape(len(frames), len(bones), 4, 4).transpose(0, 1, 3, 2).astype(np.float64)
+        index_of = {bone.name: n for n, bone in enumerate(bones)}
+        parents = np.tile(np.identity(4), (len(frames), len(bones), 1, 1))
+        for n, bone in enumerate(bones):
+            if bone.parent:
+                parents[:, n] = mats[:, index_of[bone.parent.name]]
+        offsets_inv = np.array([get_bone_matrix(bone.bone, 'parent_offset_inv') for bone in bones])
+        bases = offsets_inv @ np.linalg.inv(parents) @ mats
+        
+        scales = np.linalg.norm(bases[..., :3, :3], axis=-2)
+        rotations = core.mats_to_quats(bases[..., :3, :3] / scales[..., None, :])
+        return rotations.astype(np.float32), bases[..., :3, 3].astype(np.float32), scales.astype(np.float32)
+
+# cached basis matrices of the given rows (frame indices) for the given bones, (rows x bones x 4 x 4)
+def get_ik_cache_bases(cache, rows, bone_idx):
+    rotations = cache['rotations'][rows][:, bone_idx].astype(np.float64)
+    return core.compose_mats(cache['locations'][rows][:, bone_idx], core.quats_to_mats(rotations), cache['scales'][rows][:, bone_idx])
+
+# index of a frame in the cache, None if it is not cached or stale
+def get_ik_cache_row(cache, frame):
+    row = int(np.searchsorted(cache['frames'], frame))
+    if row < len(cache['frames']) and cache['frames'][row] == frame and cache['valid'][row]:
+        return row
+    return None
+
+# marks the frames affected by keyframe changes of the rig or its constraint targets as stale
+def refresh_ik_cache(ao):
+    cache = ik_cache[ao.name]
+    assignments = get_ik_cache_assignments(ao)
+    if assignments != cache['assignments']:
+        cache['valid'][:] = False
+        cache['assignments'] = assignments
+        cache['keys'] = {name: snapshot_action_keys(bpy.data.actions[name]) for name in set(assignments.values())}
+        cache['touched'].clear()
+    
+    for name in cache['touched']:
+        action = bpy.data.actions.get(name)
+        if action is None or name not in cache['keys']:
+            cache['valid'][:] = False
+            continue
+        ranges, cache['keys'][name] = get_action_dirty_ranges(action, cache['keys'][name])
+        if ranges is None:
+            cache['valid'][:] = False
+            continue
+        for lo, hi in ranges:
+            cache['valid'][(cache['frames'] >= lo) & (cache['frames'] <= hi)] = False
+    cache['touched'].clear()
+
+# mutes the constraints of a rig so the cache can pose it (see apply_ik_cache), or turns them back on
+# the mute state is also stored on the rig (IKCacheMuted), so a saved file gets its constraints back on load
+def set_ik_cache_muted(ao, muted):
+    cache = ik_cache[ao.name]
+    if muted == bool(cache['muted']):
+        return
+    
+    if muted:
+        keyed = {fcurve.data_path for fcurve in ao.animation_data.action.fcurves} if ao.animation_data and ao.animation_data.action else set()
+        cache['channels'] = {(bone.name, prop): tuple(getattr(bone, prop)) for bone in ao.pose.bones for prop in transform_channels
+            if bone.path_from_id(prop) not in keyed}
+        cache['muted'] = [(bone.name, constraint.name) for bone in ao.pose.bones for constraint in bone.constraints if not constraint.mute]
+        for bone_name, constraint_name in cache['muted']:
+            ao.pose.bones[bone_name].constraints[constraint_name].mute = True
+        ao['IKCacheMuted'] = json.dumps(cache['muted'])
+        return
+    
+    restore_ik_constraints(ao, cache['muted'])
+    for (bone_name, prop), value in cache['channels'].items():
+        if bone_name in ao.pose.bones:
+            setattr(ao.pose.bones[bone_name], prop, value)
+    cache['muted'] = []
+
+def restore_ik_constraints(ao, muted):
+    for bone_name, constraint_name in muted:
+        bone = ao.pose.bones.get(bone_name)
+        constraint = bone.constraints.get(constraint_name) if bone else None
+        if constraint:
+            constraint.mute = False
+    if 'IKCacheMuted' in ao:
+        del ao['IKCacheMuted']
+
+# poses a rig (constraints muted) from the cache at a frame, returns False if the frame is not cached or stale
+def apply_ik_cache(ao, frame):
+    cache = ik_cache[ao.name]
+    row = get_ik_cache_row(cache, frame)
+    if row is None:
+        return False
+    bases = get_ik_cache_bases(cache, [row], slice(None))[0]
+    for bone, basis in zip(ao.pose.bones, bases):
+        bone.matrix_basis = Matrix(basis.tolist())
+    return True
+
+# makes sure the cache of a rig in baked IK mode holds valid solves of the given frames, re-solving missing and stale ones,
+#   and poses the rig from the cache at the current frame
+def ensure_ik_cache(ao, frames):
+    refresh_ik_cache(ao)
+    cache = ik_cache[ao.name]
+    scene = bpy.context.scene
+    missing = sorted(set(frames) - set(cache['frames'][cache['valid']].tolist()))
+    if missing:
+        set_ik_cache_muted(ao, False)
+        cur_frame = scene.frame_current
+        try:
+            solved = solve_ik_frames(ao, missing)
+        finally:
+            scene.frame_set(cur_frame)
+        
+        # merge with the still valid frames
+        keep = cache['valid'] & ~np.isin(cache['frames'], missing)
+        all_frames = np.concatenate((cache['frames'][keep], missing)).astype(np.int64)
+        order = np.argsort(all_frames, kind='stable')
+        cache['frames'] = all_frames[order]
+        cache['valid'] = np.ones(len(all_frames), dtype=bool)
+        for key, values in zip(('rotations', 'locations', 'scales'), solved):
+            cache[key] = np.concatenate((cache[key][keep], values))[order]
+    
+    set_ik_cache_muted(ao, True)
+    apply_ik_cache(ao, scene.frame_current)
+    return cache
+
+# switches a rig to baked IK mode: solves its constraints over the scene frame range once, see ik_cache
+def bake_ik_cache(ao):
+    clear_ik_cache(ao)
+    scene = bpy.context.scene
+    assignments = get_ik_cache_assignments(ao)
+    ik_cache[ao.name] = {
+        'frames': np.empty(0, dtype=np.int64),
+        'bones': [bone.name for bone in ao.pose.bones],
+        'rotations': np.empty((0, len(ao.pose.bones), 4), dtype=np.float32),
+        'locations': np.empty((0, len(ao.pose.bones), 3), dtype=np.float32),
+        'scales': np.empty((0, len(ao.pose.bones), 3), dtype=np.float32),
+        'valid': np.empty(0, dtype=bool),
+        'keys': {name: snapshot_action_keys(bpy.data.actions[name]) for name in set(assignments.values())},
+        'assignments': assignments,
+        'touched': set(),
+        'muted': [],
+        'channels': {},
+    }
+    return ensure_ik_cache(ao, range(scene.frame_start, scene.frame_end+1))
+
+# leaves baked IK mode, the constraints solve the rig again
+def clear_ik_cache(ao):
+    if ao.name in ik_cache:
+        set_ik_cache_muted(ao, False)
+        del ik_cache[ao.name]
+        # the keyed channels still hold the cached pose
+        bpy.context.scene.frame_set(bpy.context.scene.frame_current)
+
+# pose matrices of the plan bones from the cache of a rig in baked IK mode (see ensure_ik_cache), (frames x plan bones x 4 x 4)
+def sample_pose_matrices_from_ik_cache(ao, frames, plan):
+    cache = ik_cache[ao.name]
+    rows = np.searchsorted(cache['frames'], frames)
+    index_of = {name: n for n, name in enumerate(cache['bones'])}
+    bases = get_ik_cache_bases(cache, rows, slice(None))
+    return chain_pose_matrices(ao, plan['bones'], lambda bone: bases[:, index_of[bone.name]])
+
+@bpy.app.handlers.persistent
+def on_frame_change(scene, depsgraph=None):
+    if ik_cache_state['solving']:
+        return
+    for name in list(ik_cache):
+        ao = bpy.data.objects.get(name)
+        if ao is None or ao.type != 'ARMATURE':
+            del ik_cache[name]
+            continue
+        
+        # outside the cached frames and after keyframe changes the constraints solve the rig
+        refresh_ik_cache(ao)
+        cached = get_ik_cache_row(ik_cache[name], scene.frame_current) is not None
+        set_ik_cache_muted(ao, cached)
+        if cached:
+            apply_ik_cache(ao, scene.frame_current)
+
+# turns the constraints muted by the cache of a saved file back on, the cache itself is not saved
+# files opened without the add-on registered (bake workers, the command line) have to call this themselves
+def restore_saved_ik_constraints():
+    for obj in bpy.data.objects:
+        if 'IKCacheMuted' in obj and obj.type == 'ARMATURE':
+            restore_ik_constraints(obj, json.loads(obj['IKCacheMuted']))
+
+@bpy.app.handlers.persistent
+def on_load(*args):
+    ik_cache.clear()
+    restore_saved_ik_constraints()
 
 # removes all IK stuff from a bone
 def remove_ik_config(ao, tail_bone):
@@ -186,180 +761,489 @@ def create_ik_config(ao, tail_bone, chain_count, create_pose_bone, lock_tail):
         constraint.pole_angle = math.pi * -.5
     constraint.chain_count = chain_count
 
-# loads a (child) rig bone
-def load_rigbone(ao, rigging_type, rigsubdef, parent_bone):
-    amt = ao.data
-    bone = amt.edit_bones.new(rigsubdef['jname'])
-    
-    mat = cf_to_mat(rigsubdef['transform'])
-    bone["transform"] = mat
-    bone_dir = (transform_to_blender @ mat).to_3x3().to_4x4() @ Vector((0, 0, 1))
-    
-    if 'jointtransform0' not in rigsubdef:
-        # Rig root
-        bone.head = (transform_to_blender @ mat).to_translation()
-        bone.tail = (transform_to_blender @ mat) @ Vector((0, .01, 0))
-        bone["transform0"] = Matrix()
-        bone["transform1"] = Matrix()
-        bone['nicetransform'] = Matrix()
-        bone.align_roll(bone_dir)
-        bone.hide_select = True
-        pre_mat = bone.matrix
-        o_trans = transform_to_blender @ mat
-    else:
-        mat0 = cf_to_mat(rigsubdef['jointtransform0'])
-        mat1 = cf_to_mat(rigsubdef['jointtransform1'])
-        bone["transform0"] = mat0
-        bone["transform1"] = mat1
-        bone["is_transformable"] = True
-        
-        bone.parent = parent_bone
-        o_trans = transform_to_blender @ (mat @ mat1)
-        bone.head = o_trans.to_translation()
-        real_tail = o_trans @ Vector((0, .25, 0))
-        
-        neutral_pos = (transform_to_blender @ mat).to_translation()
-        bone.tail = real_tail
-        bone.align_roll(bone_dir)
-        
-        # store neutral matrix
-        pre_mat = bone.matrix
-        
-        if rigging_type != 'RAW': # If so, apply some transform
-            if len(rigsubdef['children']) == 1:
-                nextmat = cf_to_mat(rigsubdef['children'][0]['transform'])
-                nextmat1 = cf_to_mat(rigsubdef['children'][0]['jointtransform1'])
-                next_joint_pos = (transform_to_blender @ (nextmat @ nextmat1)).to_translation()
-                    
-                if rigging_type == 'CONNECT': # Instantly connect
-                    bone.tail = next_joint_pos
-                else:
-                    axis = 'y'
-                    if rigging_type == 'LOCAL_AXIS_EXTEND': # Allow non-Y too
-                        invtrf = pre_mat.inverted() * next_joint_pos
-                        bestdist = abs(invtrf.y)
-                        for paxis in ['x', 'z']:
-                            dist = abs(getattr(invtrf, paxis))
-                            if dist > bestdist:
-                                bestdist = dist
-                                axis = paxis
-                    
-                    next_connect_to_parent = True
-                    
-                    ppd_nr_dir = real_tail - bone.head
-                    ppd_nr_dir.normalize()
-                    proj = ppd_nr_dir.dot(next_joint_pos - bone.head)
-                    vis_world_root = ppd_nr_dir * proj
-                    bone.tail = bone.head + vis_world_root
-                
-            else:
-                bone.tail = bone.head + (bone.head - neutral_pos) * -2
-        
-            if (bone.tail - bone.head).length < .01:
-                # just reset, no "nice" config can be found
-                bone.tail = real_tail
-                bone.align_roll(bone_dir)
-    
-    # fix roll
-    bone.align_roll(bone_dir)
+# creates the bones of a rig definition in one go (rig in edit mode), the layout is computed up front by
+#   RbxAnimationsCore.layout_rig_bones, returns the layout with the names of the created bones
+def load_rig_bones(ao, rigging_type, rig):
+    layout = core.layout_rig_bones(rig, rigging_type, np.array(transform_to_blender))
+    edit_bones = ao.data.edit_bones
     
-    post_mat = bone.matrix
+    bones = []
+    for i, parent in enumerate(layout['parents']):
+        bone = edit_bones.new(layout['names'][i])
+        bone.head = layout['heads'][i]
+        bone.tail = layout['tails'][i]
+        bone.roll = layout['rolls'][i]
+        bone['transform'] = Matrix(layout['transforms'][i].tolist())
+        bone['transform0'] = Matrix(layout['transforms0'][i].tolist())
+        bone['transform1'] = Matrix(layout['transforms1'][i].tolist())
+        # this value stores the transform between the "proper" matrix and the "nice" matrix where bones are oriented in a more friendly way
+        bone['nicetransform'] = Matrix(layout['nicetransforms'][i].tolist())
+        if parent < 0:
+            # Rig root
+            bone.hide_select = True
+        else:
+            bone['is_transformable'] = True
+            bone.parent = bones[parent]
+        bones.append(bone)
     
-    # this value stores the transform between the "proper" matrix and the "nice" matrix where bones are oriented in a more friendly way
-    bone['nicetransform'] = o_trans.inverted() @ post_mat
+    layout['names'] = [bone.name for bone in bones]
+    return layout
 
-    # link objects to bone
-    for aux in rigsubdef['aux']:
-        if aux and aux in bpy.data.objects:
-            obj = bpy.data.objects[aux]
-            link_object_to_bone_rigid(obj, ao, bone)
-    
-    # handle child bones
-    for child in rigsubdef['children']:
-        load_rigbone(ao, rigging_type, child, bone)
+# links the parts of a rig to their bones, layout from load_rig_bones
+# parts: {part name: object name} of the imported parts, aux names that are not in it are looked up as object names
+def link_rig_parts(ao, layout, parts={}):
+    links = []
+    for name, aux, matrix in zip(layout['names'], layout['aux'], layout['matrices']):
+        for part in aux:
+            if part and parts.get(part, part) in bpy.data.objects:
+                links.append((bpy.data.objects[parts.get(part, part)], name, Matrix(matrix.tolist())))
+    link_objects_to_bones_rigid(ao, links)
 
 # renames parts to whatever the metadata defines, mostly just for user-friendlyness (not required)
-def autoname_parts(partnames, basename):
-    indexmatcher = re.compile(basename + '(\d+)1(\.\d+)?', re.IGNORECASE)
-    for object in bpy.data.objects:
-        match = indexmatcher.match(object.name.lower())
+# parts are imported as <basename><part index>1, they are indexed first as renaming reorders bpy.data.objects
+# returns {part name: object name}, the object names differ if another rig already has parts with these names
+def autoname_parts(partnames, basename, objects=None):
+    indexmatcher = re.compile(re.escape(basename) + r'(\d+)1(\.\d+)?', re.IGNORECASE)
+    parts_at = {}
+    for object in (bpy.data.objects if objects is None else objects):
+        match = indexmatcher.match(object.name)
         if match:
-            index = int(match.group(1))
-            object.name = partnames[index - 1]
+            parts_at.setdefault(int(match.group(1)), []).append(object)
+    
+    parts = {}
+    for index, part_objects in parts_at.items():
+        if 1 <= index <= len(partnames):
+            for object in part_objects:
+                object.name = partnames[index - 1]
+                parts[partnames[index - 1]] = object.name
+    return parts
+
+# removes the generated rig of a rig metadata object
+def remove_rig(meta_obj):
+    ao = get_rig_object(meta_obj)
+    if ao:
+        bake_cache.pop(ao.name, None)
+        ik_cache.pop(ao.name, None)
+        invalidate_matrix_cache(ao.data)
+        amt = ao.data
+        bpy.data.objects.remove(ao)
+        if amt.users == 0:
+            bpy.data.armatures.remove(amt)
 
-# removes existing rig if it exists, then builds a new one using the stored metadata
-def create_rig(rigging_type):
+# removes existing rig if it exists, then builds a new one using the stored metadata, returns the rig
+# meta_obj: rig metadata object (default: the rig chosen in the panel), other rigs are left alone
+def create_rig(rigging_type, meta_obj=None):
+    meta_obj = meta_obj or get_active_rig_meta(bpy.context)
+    suffix = get_rig_suffix(meta_obj)
+    
     bpy.ops.object.mode_set(mode='OBJECT')
-    if '__Rig' in bpy.data.objects:
-        bpy.data.objects['__Rig'].select_set(True)
-        bpy.ops.object.delete()
+    remove_rig(meta_obj)
         
-    meta_loaded = json.loads(bpy.data.objects['__RigMeta']['RigMeta'])
+    meta_loaded = json.loads(meta_obj['RigMeta'])
+    parts = json.loads(meta_obj['RigParts']) if 'RigParts' in meta_obj else {}
     
-    bpy.ops.object.add(type='ARMATURE', enter_editmode=True, location=(0,0,0))
-    ao = bpy.context.object
-    ao.show_in_front = True
-    ao.name = '__Rig'
-    amt = ao.data
-    amt.name = '__RigArm'
-    amt.show_axes = True
-    amt.show_names = True
+    with core.timed('rig_build'):
+        bpy.ops.object.add(type='ARMATURE', enter_editmode=True, location=(0,0,0))
+        ao = bpy.context.object
+        ao.show_in_front = True
+        ao.name = '__Rig' + suffix
+        amt = ao.data
+        amt.name = '__RigArm' + suffix
+        amt.show_axes = True
+        amt.show_names = True
+        
+        bpy.ops.object.mode_set(mode='EDIT')
+        layout = load_rig_bones(ao, rigging_type, meta_loaded['rig'])
+        
+        bpy.ops.object.mode_set(mode='OBJECT')
+        link_rig_parts(ao, layout, parts)
+        
+        # precompute everything the exporter needs from the rest pose (the data pointer may be one of a removed rig)
+        invalidate_matrix_cache(amt)
+        build_export_plan(ao)
+    return ao
+
+
+# samples the pose matrices of the plan bones over the scene frame range, returns the keyword arguments of RbxAnimationsCore.bake
+# incremental: reuse the samples of the previous bake where the animation did not change (see bake_cache)
+# ao: the rig (default: the rig chosen in the panel), same for the other bake functions
+def sample_animation(incremental=False, ao=None):
+    return run_steps(iter_sample_animation(incremental, ao))
+
+# sample_animation in steps: yields (sampled frames, frames to sample) after every batch of at most batch_size frames
+#   (default: all at once) and returns the samples, see run_steps
+# the current frame is restored at the end, also when the steps are stopped early (closed)
+def iter_sample_animation(incremental=False, ao=None, batch_size=None):
+    ctx = bpy.context
+    ao = ao or get_active_rig(ctx)
+    bake_jump = ctx.scene.frame_step
     
-    bpy.ops.object.mode_set(mode='EDIT')
-    load_rigbone(ao, rigging_type, meta_loaded['rig'], None)
+    cur_frame = ctx.scene.frame_current
+    sampled_frames = range(ctx.scene.frame_start, ctx.scene.frame_end+1, bake_jump)
     
-    bpy.ops.object.mode_set(mode='OBJECT')
+    plan = get_export_plan(ao)
+    cache = get_bake_cache(ao) if incremental else None
+    if cache is None:
+        bake_cache.pop(ao.name, None)
+    missing = [i for i in sampled_frames if cache is None or i not in cache['frames']]
+    
+    batches = []
+    try:
+        for mats in iter_pose_batches(ao, missing, plan, batch_size or max(len(missing), 1)):
+            batches.append(mats)
+            yield sum(len(batch) for batch in batches), len(missing)
+    finally:
+        ctx.scene.frame_set(cur_frame)
+    
+    pose_mats = np.concatenate(batches) if batches else np.empty((0, len(plan['bones']), 4, 4))
+    if cache is not None:
+        cache['frames'].update(zip(missing, pose_mats))
+        cache['resampled'] = len(missing)
+        pose_mats = np.array([cache['frames'][i] for i in sampled_frames]).reshape(-1, len(plan['bones']), 4, 4)
+    
+    return {
+        'plan': plan,
+        'pose_mats': pose_mats,
+        'frames': list(sampled_frames),
+        'frame_start': ctx.scene.frame_start,
+        'frame_end': ctx.scene.frame_end,
+        'fps': ctx.scene.render.fps,
+    }
 
+# runs steps (a generator, see iter_sample_animation) to the end, returns their result
+def run_steps(steps):
+    while True:
+        try:
+            next(steps)
+        except StopIteration as e:
+            return e.value
 
-# export the entire animation to the clipboard (serialized), returns animation time
-def serialize():
-    ao = bpy.data.objects['__Rig']
+# bakes and encodes samples (see sample_animation) for the clipboard, returns (animation, encoded text, quantization error
+#   or None, see RbxAnimationsCore.compare_animations), touches no Blender data so it can run on a worker thread
+def encode_samples(samples, reduce_tolerance=None, export_format='JSON', precision=None):
+    anim = core.bake(**samples, reduce_tolerance=reduce_tolerance)
+    encoded = core.encode_animation(anim, export_format, precision)
+    error = core.compare_animations(anim, core.decode_animation(encoded)) if export_format == 'QUANTIZED' else None
+    return anim, encoded, error
+
+# export the entire animation to a file (or numbered segment files) while sampling, returns the written paths
+# unlike serialize, the animation is never held in memory as a whole
+# precision: quantization rules of the QUANTIZED format (see get_quantize_precision), same for the other export functions
+def serialize_to_file(filepath, export_format='JSON', segment_size=0, ao=None, precision=None):
     ctx = bpy.context
+    ao = ao or get_active_rig(ctx)
     bake_jump = ctx.scene.frame_step
     
-    collected = []
-    frames = ctx.scene.frame_end+1 - ctx.scene.frame_start
     cur_frame = ctx.scene.frame_current
-    for i in range(ctx.scene.frame_start, ctx.scene.frame_end+1, bake_jump):
-        ctx.scene.frame_set(i)
-        bpy.context.evaluated_depsgraph_get().update()
+    sampled_frames = range(ctx.scene.frame_start, ctx.scene.frame_end+1, bake_jump)
     
-        state = serialize_animation_state(ao)
-        collected.append({'t': (i - ctx.scene.frame_start) / ctx.scene.render.fps, 'kf': state})
+    plan = get_export_plan(ao)
+    try:
+        return core.stream_bake(filepath, plan, iter_pose_batches(ao, sampled_frames, plan), sampled_frames,
+            ctx.scene.frame_start, ctx.scene.frame_end, ctx.scene.render.fps, export_format, segment_size, precision)
+    finally:
+        ctx.scene.frame_set(cur_frame)
+
+# the Pose tree of a generated rig, see RbxAnimationsCore.pose_tree
+def get_pose_tree(ao):
+    return core.pose_tree(json.loads(get_rig_meta_object(ao)['RigMeta'])['rig'])
+
+# export the entire animation as a KeyframeSequence model file (.rbxmx, streamed while sampling, or .rbxm)
+# reduced animations are baked as a whole first, see RbxAnimationsCore.fill_pose_parents
+def serialize_to_keyframe_sequence(filepath, name, loop=False, priority=core.animation_priorities['Action'], reduce_tolerance=None, ao=None):
+    ctx = bpy.context
+    ao = ao or get_active_rig(ctx)
+    tree = get_pose_tree(ao)
+    if reduce_tolerance is not None:
+        anim = core.fill_pose_parents(serialize(reduce_tolerance, ao), tree)
+        core.write_keyframe_sequence(filepath, [anim], tree, name, loop, priority)
+        return
     
-    ctx.scene.frame_set(cur_frame)
+    cur_frame = ctx.scene.frame_current
+    sampled_frames = range(ctx.scene.frame_start, ctx.scene.frame_end+1, ctx.scene.frame_step)
     
-    result = {
-        't': (frames-1) / ctx.scene.render.fps,
-        'kfs': collected
-    }
+    plan = get_export_plan(ao)
+    try:
+        kf_batches = core.iter_bake(plan, iter_pose_batches(ao, sampled_frames, plan), sampled_frames, ctx.scene.frame_start, ctx.scene.render.fps)
+        core.write_keyframe_sequence(filepath, kf_batches, tree, name, loop, priority)
+    finally:
+        ctx.scene.frame_set(cur_frame)
+
+# export the entire animation to the clipboard (serialized), returns animation time
+# reduce_tolerance: optional (studs, degrees) tolerance for dropping keyframes, see RbxAnimationsCore.reduce_keyframes
+def serialize(reduce_tolerance=None, ao=None):
+    return core.bake(**sample_animation(ao=ao), reduce_tolerance=reduce_tolerance)
+
+# bakes every generated rig (or the given ones) over the scene frame range, returns {rig: animation}
+# all rigs are sampled in the same sweep over the frames (see iter_rigs_pose_batches)
+def serialize_rigs(reduce_tolerance=None, aos=None):
+    ctx = bpy.context
+    aos = aos or get_rigs()
+    cur_frame = ctx.scene.frame_current
+    sampled_frames = range(ctx.scene.frame_start, ctx.scene.frame_end+1, ctx.scene.frame_step)
+    
+    rigs = [(ao, get_export_plan(ao)) for ao in aos]
+    try:
+        empty = [np.empty((0, len(plan['bones']), 4, 4)) for ao, plan in rigs]
+        pose_mats = next(iter_rigs_pose_batches(rigs, sampled_frames, max(len(sampled_frames), 1)), empty)
+    finally:
+        ctx.scene.frame_set(cur_frame)
     
-    return result
+    return {ao: core.bake(plan, mats, list(sampled_frames), ctx.scene.frame_start, ctx.scene.frame_end, ctx.scene.render.fps, reduce_tolerance)
+        for (ao, plan), mats in zip(rigs, pose_mats)}
 
-def copy_anim_state_bone(target, source, bone):
-    # get transform mat of the bone in the source ao
-    bpy.context.view_layer.objects.active = source
-    t_mat = source.pose.bones[bone.name].matrix
+## BATCH BAKING ##
 
-    bpy.context.view_layer.objects.active = target
+parallel_bake_min_frames = 1000 # frames per worker process below which starting the process costs more than it saves
+
+# bakes the given frames of an action (None = the assigned one) on the rig, times are relative to frame_start
+# the previously assigned action is restored, the current frame is not
+def bake_action_frames(ao, plan, action_name, frames, frame_start, frame_end, fps, reduce_tolerance=None):
+    anim_data = ao.animation_data or ao.animation_data_create()
+    prev_action = anim_data.action
+    if action_name is not None:
+        anim_data.action = bpy.data.actions[action_name]
+    try:
+        pose_mats = sample_pose_matrices(ao, frames, plan)
+    finally:
+        anim_data.action = prev_action
+    return core.bake(plan, pose_mats, frames, frame_start, frame_end, fps, reduce_tolerance)
+
+# command line of a background process running run_bake_worker
+def get_bake_worker_command(blend_path, tasks_path, result_path):
+    script = os.path.abspath(__file__)
+    if bpy.app.binary_path:
+        return [bpy.app.binary_path, '-b', '--factory-startup', '--python', script, '--', 'bake-worker', blend_path, tasks_path, result_path]
+    # bpy running as a python module
+    return [sys.executable, script, 'bake-worker', blend_path, tasks_path, result_path]
+
+# bakes the shards listed in a tasks file (see parallel_bake) from a copy of the blend file,
+#   writes the encoded animation of every shard to the result file
+def run_bake_worker(blend_path, tasks_path, result_path):
+    bpy.ops.wm.open_mainfile(filepath=blend_path)
+    restore_saved_ik_constraints()
+    with open(tasks_path) as f:
+        tasks = json.load(f)
+    
+    ao = bpy.data.objects[tasks['rig']]
+    results = []
+    for n, frames in tasks['shards']:
+        job = tasks['jobs'][n]
+        anim = bake_action_frames(ao, tasks['plan'], job['action'], frames, job['frame_start'], job['frame_end'], tasks['fps'], tasks['reduce_tolerance'])
+        results.append((n, core.encode_animation(anim)))
+    
+    with open(result_path, 'w') as f:
+        json.dump(results, f)
+
+# bakes several actions and/or frame ranges of the rig, returns the animation of every job
+# jobs: [{'action': action name (None = the assigned action), 'frame_start', 'frame_end', 'frame_step'}]
+# the frames are sharded over workers background processes (0 = one per cpu core, see RbxAnimationsCore.shard_frames),
+#   every process bakes whole actions or frame ranges of them from a saved copy of the file, the shards are merged again
+#   in timestamp order (with reduce_tolerance, shard boundaries are always kept)
+# with a single worker, or too few frames to keep more than one busy (min_shard_frames), everything is baked in this process
+def parallel_bake(jobs, workers=0, reduce_tolerance=None, min_shard_frames=0, ao=None):
+    ctx = bpy.context
+    ao = ao or get_active_rig(ctx)
+    plan = get_export_plan(ao)
+    fps = ctx.scene.render.fps
+    frame_lists = [range(job['frame_start'], job['frame_end']+1, job.get('frame_step', 1)) for job in jobs]
+    worker_shards = core.shard_frames(frame_lists, workers or os.cpu_count() or 1, min_shard_frames or parallel_bake_min_frames)
+    
+    parts = [[] for job in jobs]
+    if len(worker_shards) <= 1:
+        cur_frame = ctx.scene.frame_current
+        try:
+            for n, frames in chain.from_iterable(worker_shards):
+                job = jobs[n]
+                parts[n].append(bake_action_frames(ao, plan, job['action'], frames, job['frame_start'], job['frame_end'], fps, reduce_tolerance))
+        finally:
+            ctx.scene.frame_set(cur_frame)
+    else:
+        with tempfile.TemporaryDirectory(prefix='rbxanims') as tmp:
+            blend_path = os.path.join(tmp, 'bake.blend')
+            with core.timed('file_io'):
+                bpy.ops.wm.save_as_mainfile(filepath=blend_path, copy=True)
+            
+            def run_worker(i):
+                tasks_path = os.path.join(tmp, 'tasks{:d}.json'.format(i))
+                result_path = os.path.join(tmp, 'result{:d}.json'.format(i))
+                with open(tasks_path, 'w') as f:
+                    json.dump({'rig': ao.name, 'plan': plan, 'fps': fps, 'reduce_tolerance': reduce_tolerance, 'jobs': jobs, 'shards': worker_shards[i]}, f)
+                proc = subprocess.run(get_bake_worker_command(blend_path, tasks_path, result_path),
+                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+                if proc.returncode != 0 or not os.path.exists(result_path):
+                    raise RuntimeError('Bake worker {:d} failed:\n{}'.format(i, proc.stderr.decode('utf-8', 'replace')[-2000:]))
+                with open(result_path) as f:
+                    return json.load(f)
+            
+            with core.timed('workers'), ThreadPoolExecutor(len(worker_shards)) as pool:
+                for results in pool.map(run_worker, range(len(worker_shards))):
+                    for n, text in results:
+                        parts[n].append(core.decode_animation(text))
+    
+    return [core.merge_animations(p) for p in parts]
+
+# actions that animate pose bones and whose name matches a glob pattern (case insensitive), sorted by name
+def get_batch_export_actions(name_filter='*'):
+    return sorted([action for action in bpy.data.actions if fnmatch.fnmatch(action.name.lower(), name_filter.lower())
+        and any(fcurve.data_path.startswith('pose.bones[') for fcurve in action.fcurves)], key=lambda action: action.name)
+
+# bakes every matching action over its own frame range (Action.frame_range) to a file per action in directory,
+#   along with a manifest.json listing the files, returns the manifest
+# all actions share the export plan of the rig, see parallel_bake for workers
+def batch_export(directory, name_filter='*', export_format='JSON', workers=0, reduce_tolerance=None, ao=None, precision=None):
+    scene = bpy.context.scene
+    ao = ao or get_active_rig(bpy.context)
+    actions = get_batch_export_actions(name_filter)
+    jobs = [{'action': action.name, 'frame_start': math.floor(action.frame_range[0]), 'frame_end': math.ceil(action.frame_range[1]),
+        'frame_step': scene.frame_step} for action in actions]
+    
+    manifest = {
+        'rig': json.loads(get_rig_meta_object(ao)['RigMeta']).get('rigName'),
+        'format': export_format,
+        'fps': scene.render.fps,
+        'animations': [],
+    }
+    os.makedirs(directory, exist_ok=True)
+    used_names = set()
+    for job, anim in zip(jobs, parallel_bake(jobs, workers, reduce_tolerance, ao=ao)):
+        encoded = core.encode_animation(anim, export_format, precision)
         
-    # root bone transform is ignored, this is carried to child bones (keeps HRP static)
-    if bone.parent:
-        # apply transform w.r.t. the current parent bone transform
-        r_mat = bone.bone.matrix_local
-        p_mat = bone.parent.matrix
-        p_r_mat = bone.parent.bone.matrix_local
-        bone.matrix_basis = (p_r_mat.inverted() @ r_mat).inverted() @ (p_mat.inverted() @ t_mat)
-
-    # update properties (hacky :p)
-    bpy.ops.anim.keyframe_insert()
-    bpy.context.scene.frame_set(bpy.context.scene.frame_current)
-
-    # now apply on children (which use the parents transform)
-    for ch in bone.children:
-        copy_anim_state_bone(target, source, ch)
-    
-def copy_anim_state(target, source):
+        # action names can clash once cleaned up for the file system
+        name = bpy.path.clean_name(job['action'])
+        while name.lower() in used_names:
+            name += '_'
+        used_names.add(name.lower())
+        
+        filename = name + '.txt'
+        with core.timed('file_io'), open(os.path.join(directory, filename), 'w') as f:
+            f.write(encoded)
+        manifest['animations'].append({
+            'action': job['action'],
+            'file': filename,
+            'frame_start': job['frame_start'],
+            'frame_end': job['frame_end'],
+            'duration': anim['t'],
+            'keyframes': len(anim['kfs']),
+            'poses': core.count_poses(anim),
+            'payload_size': len(encoded),
+        })
+    
+    with core.timed('file_io'), open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+# keyframe point properties kept when write_fcurve_keys merges keys, (name, values per key, foreach dtype)
+keyframe_attributes = (('co', 2, np.float32), ('handle_left', 2, np.float32), ('handle_right', 2, np.float32),
+    ('handle_left_type', 1, np.int32), ('handle_right_type', 1, np.int32), ('interpolation', 1, np.int32), ('easing', 1, np.int32),
+    ('type', 1, np.int32), ('back', 1, np.float32), ('amplitude', 1, np.float32), ('period', 1, np.float32))
+
+# {property: (keys x n) array} of the keyframe points of an F-curve, see keyframe_attributes
+def read_keyframe_attributes(points):
+    attributes = {}
+    for name, size, dtype in keyframe_attributes:
+        values = np.empty(len(points) * size, dtype=dtype)
+        points.foreach_get(name, values)
+        attributes[name] = values.reshape(-1, size)
+    return attributes
+
+# writes keyframes for one F-curve in bulk, existing keys at the same frames are replaced (keeping their handle types,
+#   interpolation, ...), the other existing keys are kept
+def write_fcurve_keys(action, data_path, index, group, frames, values):
+    fcurve = action.fcurves.find(data_path, index=index)
+    if fcurve is None:
+        fcurve = action.fcurves.new(data_path, index=index, action_group=group)
+    points = fcurve.keyframe_points
+    frames = np.asarray(frames, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    
+    # existing keys within the keyframe insert threshold of a new key are replaced by it
+    old = read_keyframe_attributes(points)
+    replaced = core.match_keyframes(old['co'][:, 0], frames)
+    kept = np.setdiff1d(np.arange(len(points)), replaced)
+    
+    # new keys get the defaults of freshly added points, replaced keys their old settings with the handles moved along
+    # (KeyframePoints.clear is missing in older Blender versions)
+    if hasattr(points, 'clear'):
+        points.clear()
+    else:
+        while len(points):
+            points.remove(points[-1], fast=True)
+    points.add(len(kept) + len(frames))
+    attributes = read_keyframe_attributes(points)
+    for name in attributes:
+        attributes[name][:len(kept)] = old[name][kept]
+        attributes[name][len(kept):][replaced >= 0] = old[name][replaced[replaced >= 0]]
+    co = np.column_stack((frames, values))
+    shift = np.zeros_like(co)
+    shift[replaced >= 0] = co[replaced >= 0] - old['co'][replaced[replaced >= 0]]
+    for handle in ('handle_left', 'handle_right'):
+        new_handles = attributes[handle][len(kept):]
+        new_handles[:] = np.where((replaced >= 0)[:, None], new_handles + shift, co)
+    attributes['co'][len(kept):] = co
+    
+    order = np.argsort(attributes['co'][:, 0], kind='stable')
+    for name, values in attributes.items():
+        points.foreach_set(name, values[order].ravel())
+    fcurve.update()
+
+# splits basis matrices into the channels of a pose bone (following its rotation mode), {property: (frames x n) array}
+# mats: (frames x 4 x 4), matrices or arrays
+def decompose_basis_matrices(bone, mats):
+    mats = np.asarray(mats, dtype=np.float64).reshape(-1, 4, 4)
+    rotation_prop = {'QUATERNION': 'rotation_quaternion', 'AXIS_ANGLE': 'rotation_axis_angle'}.get(bone.rotation_mode, 'rotation_euler')
+    
+    locations, rots, scales = core.decompose_mats(mats)
+    if bone.rotation_mode == 'QUATERNION':
+        # avoid sign flips between keys
+        rotations = core.continuous_quats(core.mats_to_quats(rots))
+    else:
+        rotations = []
+        prev_rot = None
+        for rot in rots:
+            quat = Matrix(rot.tolist()).to_quaternion()
+            if bone.rotation_mode == 'AXIS_ANGLE':
+                axis, angle = quat.to_axis_angle()
+                rot = (angle, axis[0], axis[1], axis[2])
+            else:
+                rot = quat.to_euler(bone.rotation_mode, prev_rot) if prev_rot is not None else quat.to_euler(bone.rotation_mode)
+                prev_rot = rot
+            rotations.append(rot[:])
+    
+    return {
+        'location': locations,
+        rotation_prop: np.array(rotations).reshape(len(mats), -1),
+        'scale': scales,
+    }
+
+# keys pose bones from their basis matrices in bulk, bases: {bone name: basis matrix per frame (frames x 4 x 4)}
+def write_pose_keyframes(ao, frames, bases):
+    if not ao.animation_data:
+        ao.animation_data_create()
+    if not ao.animation_data.action:
+        ao.animation_data.action = bpy.data.actions.new(ao.name + 'Action')
+    action = ao.animation_data.action
+    
+    for name, mats in bases.items():
+        with core.timed('matrix_math'):
+            channels = decompose_basis_matrices(ao.pose.bones[name], mats)
+        with core.timed('keyframe_write'):
+            for prop, values in channels.items():
+                data_path = 'pose.bones["{}"].{}'.format(name, prop)
+                for index in range(values.shape[1]):
+                    write_fcurve_keys(action, data_path, index, name, frames, values[:, index])
+
+# keys the target rig so every mapped bone below its root matches the pose of its source bone over the scene frame range,
+#   the root keeps its current pose (keeps HRP static), unmapped bones are left alone
+# bone_map: {target bone: source bone} (default: same names, see resolve_bone_mapping), corrections: {target bone: matrix}
+#   applied to the source pose (rest offset correction)
+# a target bone with the source pose S under a parent posed P gets the basis inv(inv(parent rest) @ rest) @ inv(P) @ S,
+#   this is solved bone by bone in depth order for all frames at once from the sampled source poses
+def copy_anim_state(target, source, bone_map=None, corrections=None):
+    if bone_map is None:
+        bone_map = resolve_bone_mapping(target, source)[0]
+    corrections = corrections or {}
+    
     # to pose mode
     bpy.context.view_layer.objects.active = source
     bpy.ops.object.mode_set(mode='POSE')
@@ -367,48 +1251,80 @@ def copy_anim_state(target, source):
     bpy.context.view_layer.objects.active = target
     bpy.ops.object.mode_set(mode='POSE')
 
+    # root bone transform is ignored, this is carried to child bones (keeps HRP static)
     root = target.pose.bones['HumanoidRootPart']
- 
-    for i in range(bpy.context.scene.frame_start, bpy.context.scene.frame_end+1):
-        bpy.context.scene.frame_set(i)
-        copy_anim_state_bone(target, source, root)
-        bpy.ops.anim.keyframe_insert()
+    
+    # bones below the root, parents first, their parent index counts the root as 0
+    bones = sorted([bone for bone in target.pose.bones if root in bone.parent_recursive], key=lambda bone: len(bone.parent_recursive))
+    index_of = {bone.name: n + 1 for n, bone in enumerate(bones)}
+    parent_idx = [index_of.get(bone.parent.name, 0) for bone in bones]
+    mapped = [bone.name for bone in bones if bone.name in bone_map]
+    
+    # rest offsets to the parent bones and their inverses
+    offsets = [get_bone_matrix(bone.bone, 'parent_offset') for bone in bones]
+    offsets_inv = [get_bone_matrix(bone.bone, 'parent_offset_inv') for bone in bones]
+    
+    cur_frame = bpy.context.scene.frame_current
+    frames = range(bpy.context.scene.frame_start, bpy.context.scene.frame_end+1)
+    source_mats = sample_pose_matrices(source, frames, {'bones': [bone_map[name] for name in mapped]})
+    bpy.context.scene.frame_set(cur_frame)
+    source_idx = {name: n for n, name in enumerate(mapped)}
+    
+    with core.timed('matrix_math'):
+        poses = np.empty((len(frames), len(bones) + 1, 4, 4))
+        poses[:, 0] = np.array(root.matrix)
+        bases = {}
+        for n, bone in enumerate(bones):
+            parent_pose = poses[:, parent_idx[n]]
+            if bone.name in source_idx:
+                poses[:, n + 1] = source_mats[:, source_idx[bone.name]] @ corrections.get(bone.name, np.identity(4))
+                bases[bone.name] = offsets_inv[n] @ np.linalg.inv(parent_pose) @ poses[:, n + 1]
+            else:
+                poses[:, n + 1] = parent_pose @ offsets[n] @ np.array(bone.matrix_basis)
+    
+    write_pose_keyframes(target, frames, bases)
 
-def prepare_for_kf_map():
+def prepare_for_kf_map(ao=None):
+    ao = ao or get_active_rig(bpy.context)
+    
     # clear anim data from target rig
-    bpy.data.objects['__Rig'].animation_data_clear()
+    ao.animation_data_clear()
     
     # select all pose bones in the target rig (simply generate kfs for everything)
-    bpy.context.view_layer.objects.active = bpy.data.objects['__Rig']
+    bpy.context.view_layer.objects.active = ao
     bpy.ops.object.mode_set(mode='POSE')
-    for bone in bpy.data.objects['__Rig'].pose.bones:
+    for bone in ao.pose.bones:
         bone.bone.select = not not bone.parent
 
-def get_mapping_error_bones(target, source):
-    return [bone.name for bone in target.data.bones if bone.name not in [bone2.name for bone2 in source.data.bones]]
-    
-# apply ao transforms to the root PoseBone
+# returns the animated (transformable) target bones without a source bone in bone_map
+def get_mapping_error_bones(target, bone_map):
+    return [bone.name for bone in target.data.bones if 'is_transformable' in bone and bone.name not in bone_map]
+
+# apply ao transforms to the root PoseBones over the scene frame range (the ao itself may be animated too)
 # + clear ao animation tracks (root only, not Pose anim data) + reset ao transform to identity
 def apply_ao_transform(ao):
     bpy.context.view_layer.objects.active = ao
     bpy.ops.object.mode_set(mode='POSE')
     
-    # select only root bones
-    for bone in ao.pose.bones:
-        bone.bone.select = not bone.parent
+    scene = bpy.context.scene
+    cur_frame = scene.frame_current
+    frames = range(scene.frame_start, scene.frame_end+1)
+    roots = [bone for bone in ao.pose.bones if not bone.parent]
     
-    for root in [bone for bone in ao.pose.bones if not bone.parent]:
-        # collect initial root matrices (if they do not exist yet, this will prevent interpolation from keyframes that are being set in the next loop)
-        root_matrix_at = {}
-        for i in range(bpy.context.scene.frame_start, bpy.context.scene.frame_end+1):
-            bpy.context.scene.frame_set(i)
-            root_matrix_at[i] = root.matrix.copy()
-        
-        # apply world space transform to root bone
-        for i in range(bpy.context.scene.frame_start, bpy.context.scene.frame_end+1):
-            bpy.context.scene.frame_set(i)
-            root.matrix = ao.matrix_world @ root_matrix_at[i]
-            bpy.ops.anim.keyframe_insert()
+    # one sweep collects the ao world matrix and the root matrices, before any root keyframe changes their interpolation
+    world_mats = np.empty((len(frames), 1, 4, 4))
+    root_mats = np.empty((len(frames), len(roots), 4, 4))
+    for n, i in enumerate(frames):
+        with core.timed('frame_eval'):
+            scene.frame_set(i)
+        with core.timed('pose_read'):
+            world_mats[n, 0] = ao.matrix_world
+            root_mats[n] = [root.matrix for root in roots]
+    
+    # root bones have no parent, so their basis is inv(rest) @ pose
+    rests_inv = np.array([get_bone_matrix(root.bone, 'rest_inv') for root in roots])
+    bases = rests_inv @ world_mats @ root_mats
+    write_pose_keyframes(ao, frames, {root.name: bases[:, n] for n, root in enumerate(roots)})
 
     # clear non-pose fcurves
     fcurves = ao.animation_data.action.fcurves
@@ -417,10 +1333,216 @@ def apply_ao_transform(ao):
         
     # reset ao transform
     ao.matrix_basis = Matrix.Identity(4)
+    scene.frame_set(cur_frame)
     bpy.context.evaluated_depsgraph_get().update()
 
+## BONE MAPPING ##
+
+mapping_presets_subdir = os.path.join('presets', 'rbxanims_mapping') # saved presets (json), in the user scripts directory
+
+# presets map source bones to rig bones: {'bones': {source bone: rig bone}, 'auto_match': also auto match unmapped bones,
+#   'rest_correction': retarget relative to the rest poses (for sources whose bone axes differ from the rig),
+#   'offsets': {rig bone: [x, y, z] degrees, extra (euler) rotation of the source pose}}
+# source bone names may leave out namespaces ('mixamorig:Hips' matches 'Hips')
+builtin_mapping_presets = {
+    'Mixamo': {
+        'bones': {
+            'Hips': 'LowerTorso', 'Spine2': 'UpperTorso', 'Head': 'Head',
+            'LeftArm': 'LeftUpperArm', 'LeftForeArm': 'LeftLowerArm', 'LeftHand': 'LeftHand',
+            'RightArm': 'RightUpperArm', 'RightForeArm': 'RightLowerArm', 'RightHand': 'RightHand',
+            'LeftUpLeg': 'LeftUpperLeg', 'LeftLeg': 'LeftLowerLeg', 'LeftFoot': 'LeftFoot',
+            'RightUpLeg': 'RightUpperLeg', 'RightLeg': 'RightLowerLeg', 'RightFoot': 'RightFoot',
+        },
+        'auto_match': True,
+        'rest_correction': True,
+        'offsets': {},
+    },
+}
+
+# maps the bones of a target rig to source bones, returns ({target bone: source bone}, {target bone: correction matrix})
+# preset: None (same names only), 'AUTO' (same names, then RbxAnimationsCore.auto_match_bones) or a preset (see builtin_mapping_presets),
+#   preset bones go first, then same names, then auto matches (if enabled)
+def resolve_bone_mapping(target, source, preset=None):
+    source_bones = source.data.bones
+    target_bones = target.data.bones
+    source_names = {}
+    for bone in source_bones:
+        source_names.setdefault(re.split(r'[:|]', bone.name)[-1], bone.name)
+    for bone in source_bones:
+        source_names[bone.name] = bone.name
+    
+    bone_map = {}
+    if isinstance(preset, dict):
+        for source_name, target_name in preset.get('bones', {}).items():
+            if source_name in source_names and target_name in target_bones:
+                bone_map[target_name] = source_names[source_name]
+    for bone in target_bones:
+        if bone.name not in bone_map and bone.name in source_bones:
+            bone_map[bone.name] = bone.name
+    if preset == 'AUTO' or (isinstance(preset, dict) and preset.get('auto_match')):
+        used = set(bone_map.values())
+        bone_map.update(core.auto_match_bones([bone.name for bone in target_bones if bone.name not in bone_map and 'is_transformable' in bone],
+            [bone.name for bone in source_bones if bone.name not in used]))
+    
+    corrections = {}
+    if isinstance(preset, dict):
+        offsets = preset.get('offsets', {})
+        for target_name, source_name in bone_map.items():
+            correction = np.identity(4)
+            if preset.get('rest_correction'):
+                correction = get_bone_matrix(source_bones[source_name], 'rest_inv') @ get_bone_matrix(target_bones[target_name], 'rest')
+            if target_name in offsets:
+                correction = correction @ np.array(Euler([math.radians(angle) for angle in offsets[target_name]]).to_matrix().to_4x4())
+            if not np.array_equal(correction, np.identity(4)):
+                corrections[target_name] = correction
+    return bone_map, corrections
+
+def get_mapping_presets_dir(create=False):
+    return bpy.utils.user_resource('SCRIPTS', path=mapping_presets_subdir, create=create)
+
+# all mapping presets by name, saved presets override built-in ones
+def get_mapping_presets():
+    presets = dict(builtin_mapping_presets)
+    directory = get_mapping_presets_dir()
+    if directory and os.path.isdir(directory):
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith('.json'):
+                with open(os.path.join(directory, filename)) as f:
+                    presets[filename[:-len('.json')]] = json.load(f)
+    return presets
+
+# saves a mapping preset (json) to the user presets, returns the file path
+def save_mapping_preset(name, preset):
+    path = os.path.join(get_mapping_presets_dir(create=True), bpy.path.clean_name(name) + '.json')
+    with open(path, 'w') as f:
+        json.dump(preset, f, indent=1)
+    return path
+
+# the preset argument of resolve_bone_mapping for the mapping chosen in the settings
+def get_selected_mapping_preset(context):
+    name = context.scene.rbxanims_settings.mapping_preset
+    if name == 'NAMES':
+        return None
+    if name == 'AUTO':
+        return name
+    return get_mapping_presets().get(name)
+
 ## UI/OPERATOR STUFF ##
 
+## PROFILING ##
+
+last_profile = {} # report of the last operator run (see profiled), shown in the panel
+
+# wraps an operator's execute: the scopes timed during the run (RbxAnimationsCore.timed) end up in last_profile,
+#   along with the matrix cache hits/misses and the slowest functions when "Profile Python" is enabled in the panel (cProfile)
+def profiled(execute):
+    @functools.wraps(execute)
+    def wrapper(self, context):
+        settings = getattr(context.scene, 'rbxanims_settings', None)
+        profile = start_profile(settings and settings.profile_python)
+        try:
+            return execute(self, context)
+        finally:
+            finish_profile(self.bl_label, profile)
+    return wrapper
+
+# starts timing a run (see profiled), returns what finish_profile needs
+def start_profile(profile_python=False):
+    core.timings.clear()
+    profile = {'cache_stats': get_matrix_cache_stats(), 'profiler': cProfile.Profile() if profile_python else None, 'start': time.perf_counter()}
+    if profile['profiler']:
+        profile['profiler'].enable()
+    return profile
+
+# stores the report of a run in last_profile
+def finish_profile(operator, profile):
+    if profile['profiler']:
+        profile['profiler'].disable()
+    last_profile.clear()
+    last_profile['operator'] = operator
+    last_profile.update(core.get_timings_report(time.perf_counter() - profile['start'], profile['profiler']))
+    
+    # hits and misses of the run, entries after it
+    stats = get_matrix_cache_stats()
+    cache_stats = profile['cache_stats']
+    last_profile['matrix_cache'] = dict(stats, hits=stats['hits'] - cache_stats['hits'], misses=stats['misses'] - cache_stats['misses'])
+
+## BACKGROUND BAKING ##
+
+modal_bake_slice = .05 # seconds of sampling per timer event of a background bake, the UI stays responsive in between
+modal_bake_batch_size = 4 # frames sampled per step of a background bake
+bake_progress = {} # the running background bake (see OBJECT_OT_Bake.invoke): stage, done/total frames, start time, shown in the panel
+
+def redraw_panels(context):
+    for area in context.screen.areas if context.screen else []:
+        if area.type == 'VIEW_3D':
+            area.tag_redraw()
+
+# progress (0-1) and text of the running background bake, with the remaining time of the sampling
+def get_bake_progress():
+    if bake_progress['stage'] == 'Encoding':
+        return 1., 'Encoding...'
+    done, total = bake_progress['done'], bake_progress['total']
+    if not done:
+        return 0., 'Sampling...'
+    remaining = (bake_progress['sampled'] - bake_progress['start']) / done * (total - done)
+    return done / total, 'Sampling {:d}/{:d} frames, {:.0f} s left'.format(done, total, remaining)
+
+# describes how the last bake sampled the rig, for operator reports
+def get_sampling_message():
+    if last_sampling['path'] == 'ACTION':
+        return 'Sampled from the action F-curves.'
+    if last_sampling['path'] == 'IK_CACHE':
+        return 'Sampled from the baked IK.'
+    if last_sampling['path'] == 'SCENE':
+        return 'Sampled by scene evaluation ({}).'.format(last_sampling['blocker'])
+    return ''
+
+# items of the mapping preset setting, kept around as Blender does not hold on to them
+mapping_preset_items = []
+
+def get_mapping_preset_items(self, context):
+    mapping_preset_items[:] = [
+        ('AUTO', 'Auto match', 'Same bone names, other bones are matched by known spellings (Mixamo, UE, ...)'),
+        ('NAMES', 'Same bone names', 'Only map bones with the same names'),
+    ] + [(name, name, 'Mapping preset') for name in sorted(get_mapping_presets())]
+    return mapping_preset_items
+
+rig_items = [] # keeps the enum strings alive, see get_rig_items
+
+def get_rig_items(self, context):
+    rig_items[:] = [(meta_obj.name, json.loads(meta_obj['RigMeta']).get('rigName') or meta_obj.name, 'Rig metadata ' + meta_obj.name)
+        for meta_obj in get_rig_metas()] or [('NONE', 'No rig', 'Import rig data first')]
+    return rig_items
+
+# quantization rules of the QUANTIZED format from the panel settings, see RbxAnimationsCore.quantize_precision
+def get_quantize_precision(settings):
+    return [(group.pattern, group.rotation_bits, group.position_step) for group in settings.precision_groups] + [
+        ('*', settings.quantize_rotation_bits, settings.quantize_position_step)]
+
+class RbxAnimationsPrecisionGroup(bpy.types.PropertyGroup):
+    pattern: bpy.props.StringProperty(name="Bones", description="Bones of the group (* and ? wildcards, case sensitive), the first matching group counts", default="*Hand")
+    rotation_bits: bpy.props.IntProperty(name="Rotation bits", description="Precision of the quantized rotations, every bit halves the rotation error", default=14, min=8, max=16)
+    position_step: bpy.props.FloatProperty(name="Position step", description="Precision of the quantized positions (studs)", default=.001, min=1e-6, precision=4)
+
+class RbxAnimationsSettings(bpy.types.PropertyGroup):
+    rig: bpy.props.EnumProperty(items=get_rig_items, name="Rig", description="The rig that is rebuilt, animated and exported")
+    export_format: bpy.props.EnumProperty(items=[
+        ('JSON', 'JSON', 'Compressed json, supported by every importer version'),
+        ('BINARY32', 'Binary', 'Compact binary keyframes (float32 positions)'),
+        ('BINARY16', 'Binary (half precision)', 'Compact binary keyframes (float16 positions, ~0.001 stud precision near the origin)'),
+        ('QUANTIZED', 'Quantized', 'Smallest binary keyframes, quantized rotations and fixed-point positions stored as changes to the previous keyframe (precision below)'),
+    ], name="Format", default='JSON')
+    quantize_rotation_bits: bpy.props.IntProperty(name="Rotation bits", description="Precision of the quantized rotations of bones outside the precision groups, every bit halves the rotation error", default=14, min=8, max=16)
+    quantize_position_step: bpy.props.FloatProperty(name="Position step", description="Precision of the quantized positions of bones outside the precision groups (studs)", default=.001, min=1e-6, precision=4)
+    precision_groups: bpy.props.CollectionProperty(type=RbxAnimationsPrecisionGroup)
+    reduce_keyframes: bpy.props.BoolProperty(name="Reduce keyframes", description="Drop keyframes that can be interpolated from their neighbours", default=False)
+    reduce_pos_tolerance: bpy.props.FloatProperty(name="Position tolerance", description="Maximum position error of a dropped keyframe (studs)", default=.001, min=0, precision=4)
+    reduce_angle_tolerance: bpy.props.FloatProperty(name="Angle tolerance", description="Maximum rotation error of a dropped keyframe (degrees)", default=.1, min=0, precision=3)
+    mapping_preset: bpy.props.EnumProperty(items=get_mapping_preset_items, name="Bone mapping", description="How the bones of imported animations are mapped onto the rig")
+    profile_python: bpy.props.BoolProperty(name="Profile Python", description="Also profile every Python function during operator runs (cProfile, slows them down), the slowest ones end up in the saved profile", default=False)
+    incremental_bake: bpy.props.BoolProperty(name="Incremental bake", description="Only re-sample the frames affected by keyframe changes since the last export (any other change of the rig, its constraints or their targets re-samples everything, rigs with drivers are always fully sampled)", default=True)
+
 class OBJECT_OT_ImportModel(bpy.types.Operator, ImportHelper):
     bl_label = "Import rig data (.obj)"
     bl_idname = "object.rbxanims_importmodel"
@@ -430,38 +1552,43 @@ class OBJECT_OT_ImportModel(bpy.types.Operator, ImportHelper):
     filter_glob: bpy.props.StringProperty(default="*.obj", options={'HIDDEN'})
     filepath: bpy.props.StringProperty(name="File Path", maxlen=1024, default="")
  
+    @profiled
     def execute(self, context):
-        # clear objects first
-        for obj in bpy.data.objects:
-            obj.select_set(obj.type == 'MESH' or obj.type == 'ARMATURE' or obj.name.startswith('__RigMeta'))
-        bpy.ops.object.delete()
-        
-        bpy.ops.import_scene.obj(filepath=self.properties.filepath, use_split_groups=True)
+        # import and keep track of what is imported, other rigs in the scene are kept
+        objnames_before_import = set(obj.name for obj in bpy.data.objects)
+        with core.timed('obj_import'):
+            bpy.ops.import_scene.obj(filepath=self.properties.filepath, use_split_groups=True)
+        imported = [obj for obj in bpy.data.objects if obj.name not in objnames_before_import]
         
         # Extract meta...
-        encodedmeta = ''
-        partial = {}
-        for obj in bpy.data.objects:
-            match = re.search(r'^Meta(\d+)q1(.*?)q1\d*(\.\d+)?$', obj.name)
-            if match:
-                partial[int(match.group(1))] = match.group(2)
-            
-            obj.select_set(not not match)
-        bpy.ops.object.delete() # delete meta objects
+        try:
+            meta, meta_names = core.extract_rig_meta([obj.name for obj in imported])
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+            for obj in imported:
+                bpy.data.objects.remove(obj)
+            return {'FINISHED'}
+        for name in meta_names:
+            bpy.data.objects.remove(bpy.data.objects[name]) # delete meta objects
+        imported = [obj for obj in bpy.data.objects if obj.name not in objnames_before_import]
         
-        for i in range(1, len(partial)+1):
-            encodedmeta += partial[i]
-        encodedmeta = encodedmeta.replace('0', '=')
-        meta = base64.b32decode(encodedmeta, True).decode('utf-8')
+        # a re-import replaces the previous import of the same rig
+        meta_loaded = json.loads(meta)
+        for meta_obj in get_rig_metas():
+            if json.loads(meta_obj['RigMeta']).get('rigName') == meta_loaded['rigName']:
+                remove_rig(meta_obj)
+                for name in json.loads(meta_obj['RigParts']).values() if 'RigParts' in meta_obj else []:
+                    if name in bpy.data.objects:
+                        bpy.data.objects.remove(bpy.data.objects[name])
+                bpy.data.objects.remove(meta_obj)
         
         # store meta in an empty
         bpy.ops.object.add(type='EMPTY', location=(0,0,0))
         ob = bpy.context.object
-        ob.name = '__RigMeta'
+        ob.name = get_rig_meta_name(meta_loaded['rigName'])
         ob['RigMeta'] = meta
-        
-        meta_loaded = json.loads(meta)
-        autoname_parts(meta_loaded['parts'], meta_loaded['rigName'])
+        ob['RigParts'] = json.dumps(autoname_parts(meta_loaded['parts'], meta_loaded['rigName'], imported))
+        context.scene.rbxanims_settings.rig = ob.name
         
         return {'FINISHED'}    
  
@@ -480,15 +1607,18 @@ class OBJECT_OT_GenRig(bpy.types.Operator):
         ('LOCAL_YAXIS_EXTEND', 'Local Y-axis aligned bones', ''),
         ('CONNECT', 'Connect', '')
     ], name="Rigging type");
+    pr_all_rigs: bpy.props.BoolProperty(name="All rigs", description="Rebuild the rigs of every imported rig data, not only the chosen rig")
  
     @classmethod
     def poll(cls, context):
-        meta_obj = bpy.data.objects.get('__RigMeta')
-        return meta_obj and 'RigMeta' in meta_obj
+        return get_active_rig_meta(context)
  
+    @profiled
     def execute(self, context):
-        create_rig(self.pr_rigging_type)
-        self.report({'INFO'}, "Rig rebuilt.")
+        meta_objs = get_rig_metas() if self.pr_all_rigs else [get_active_rig_meta(context)]
+        for meta_obj in meta_objs:
+            create_rig(self.pr_rigging_type, meta_obj)
+        self.report({'INFO'}, "Rebuilt {:d} rig(s).".format(len(meta_objs)))
         return {'FINISHED'}
     
     def invoke(self, context, event):
@@ -512,9 +1642,11 @@ class OBJECT_OT_GenIK(bpy.types.Operator):
         premise = premise and context.active_object and context.active_object.type == 'ARMATURE'
         return context.active_object and context.active_object.mode == 'POSE' and len([x for x in context.active_object.pose.bones if x.bone.select]) > 0
 
+    @profiled
     def execute(self, context):
         
         to_apply = [b for b in context.active_object.pose.bones if b.bone.select]
+        clear_ik_cache(context.active_object)
         
         for bone in to_apply:
             create_ik_config(context.active_object, bone, self.pr_chain_count, self.pr_create_pose_bone, self.pr_lock_tail_bone)
@@ -552,14 +1684,46 @@ class OBJECT_OT_RemoveIK(bpy.types.Operator):
         premise = premise and context.active_object
         return context.active_object and context.active_object.mode == 'POSE' and len([x for x in context.active_object.pose.bones if x.bone.select]) > 0
 
+    @profiled
     def execute(self, context):
         to_apply = [b for b in context.active_object.pose.bones if b.bone.select]
+        clear_ik_cache(context.active_object)
         
         for bone in to_apply:
             remove_ik_config(context.active_object, bone)
             
         return {'FINISHED'}
 
+class OBJECT_OT_BakeIKCache(bpy.types.Operator):
+    bl_label = "Bake IK"
+    bl_idname = "object.rbxanims_bakeikcache"
+    bl_description = "Solve the IK and other constraints of the rig once over the scene frame range and pose the rig from the result (exports and playback), until the keyframes of the rig or its IK targets change"
+    
+    @classmethod
+    def poll(cls, context):
+        return get_active_rig(context)
+    
+    @profiled
+    def execute(self, context):
+        ao = get_active_rig(context)
+        cache = bake_ik_cache(ao)
+        self.report({'INFO'}, "Baked the constraints of {:d} frame(s).".format(len(cache['frames'])))
+        return {'FINISHED'}
+
+class OBJECT_OT_ClearIKCache(bpy.types.Operator):
+    bl_label = "Clear baked IK"
+    bl_idname = "object.rbxanims_clearikcache"
+    bl_description = "Drop the baked IK, the constraints solve the rig again"
+    
+    @classmethod
+    def poll(cls, context):
+        ao = get_active_rig(context)
+        return ao and ao.name in ik_cache
+    
+    def execute(self, context):
+        clear_ik_cache(get_active_rig(context))
+        return {'FINISHED'}
+
 class OBJECT_OT_ImportFbxAnimation(bpy.types.Operator, ImportHelper):
     bl_label = "Import animation data (.fbx)"
     bl_idname = "object.rbxanims_importfbxanimation"
@@ -571,17 +1735,14 @@ class OBJECT_OT_ImportFbxAnimation(bpy.types.Operator, ImportHelper):
     
     @classmethod
     def poll(cls, context):
-        return bpy.data.objects.get('__Rig')
+        return get_active_rig(context)
  
+    @profiled
     def execute(self, context):
-        # check active keying set
-        if not bpy.context.scene.keying_sets.active:
-            self.report({'ERROR'}, 'There is no active keying set, this is required.')
-            return {'FINISHED'}
-        
         # import and keep track of what is imported
         objnames_before_import = [x.name for x in bpy.data.objects]
-        bpy.ops.import_scene.fbx(filepath=self.properties.filepath)
+        with core.timed('fbx_import'):
+            bpy.ops.import_scene.fbx(filepath=self.properties.filepath)
         objnames_imported = [x.name for x in bpy.data.objects if x.name not in objnames_before_import]
         
         def clear_imported():
@@ -598,14 +1759,15 @@ class OBJECT_OT_ImportFbxAnimation(bpy.types.Operator, ImportHelper):
             return {'FINISHED'}
         
         ao_imp = armatures_imported[0]
+        grig = get_active_rig(context)
         
-        err_mappings = get_mapping_error_bones(bpy.data.objects['__Rig'], ao_imp)
+        bone_map, corrections = resolve_bone_mapping(grig, ao_imp, get_selected_mapping_preset(context))
+        err_mappings = get_mapping_error_bones(grig, bone_map)
         if len(err_mappings) > 0:
             self.report({'ERROR'}, 'Cannot map rig, the following bones are missing from the source rig: {}.'.format(', '.join(err_mappings)))
             clear_imported()
             return {'FINISHED'}
         
-        print(dir(bpy.context.scene))
         bpy.context.view_layer.objects.active = ao_imp
         
         # check that the ao contains anim data
@@ -631,10 +1793,10 @@ class OBJECT_OT_ImportFbxAnimation(bpy.types.Operator, ImportHelper):
         # for the imported rig, apply ao transforms
         apply_ao_transform(ao_imp)
         
-        prepare_for_kf_map()
+        prepare_for_kf_map(grig)
         
         # actually copy state
-        copy_anim_state(bpy.data.objects['__Rig'], ao_imp)
+        copy_anim_state(grig, ao_imp, bone_map, corrections)
         
         clear_imported()
         return {'FINISHED'}    
@@ -650,14 +1812,11 @@ class OBJECT_OT_ApplyTransform(bpy.types.Operator):
 
     @classmethod
     def poll(cls, context):
-        grig = bpy.data.objects.get('__Rig')
+        grig = get_active_rig(context)
         return grig and bpy.context.active_object and bpy.context.active_object.animation_data
  
+    @profiled
     def execute(self, context):
-        if not bpy.context.scene.keying_sets.active:
-            self.report({'ERROR'}, 'There is no active keying set, this is required.')
-            return {'FINISHED'}
-        
         apply_ao_transform(bpy.context.view_layer.objects.active)
 
         return {'FINISHED'} 
@@ -665,41 +1824,355 @@ class OBJECT_OT_ApplyTransform(bpy.types.Operator):
 class OBJECT_OT_MapKeyframes(bpy.types.Operator):
     bl_label = "Map keyframes by bone name"
     bl_idname = "object.rbxanims_mapkeyframes"
-    bl_description = "Map keyframes by bone name --- From a selected armature, maps data (using a new keyframe per frame) onto the generated rig by name. Set frame ranges first!"
+    bl_description = "Map keyframes by bone name --- From a selected armature, maps data (using a new keyframe per frame) onto the generated rig by name (or the chosen bone mapping). Set frame ranges first!"
 
     @classmethod
     def poll(cls, context):
-        grig = bpy.data.objects.get('__Rig')
+        grig = get_active_rig(context)
         return grig and bpy.context.active_object and bpy.context.active_object != grig
  
+    @profiled
     def execute(self, context):
-        if not bpy.context.scene.keying_sets.active:
-            self.report({'ERROR'}, 'There is no active keying set, this is required.')
-            return {'FINISHED'}
+        ao_imp = context.view_layer.objects.active
+        grig = get_active_rig(context)
         
-        ao_imp = bpy.context.scene.objects.active
-        
-        err_mappings = get_mapping_error_bones(bpy.data.objects['__Rig'], ao_imp)
+        bone_map, corrections = resolve_bone_mapping(grig, ao_imp, get_selected_mapping_preset(context))
+        err_mappings = get_mapping_error_bones(grig, bone_map)
         if len(err_mappings) > 0:
             self.report({'ERROR'}, 'Cannot map rig, the following bones are missing from the source rig: {}.'.format(', '.join(err_mappings)))
             return {'FINISHED'}
         
-        prepare_for_kf_map()
+        prepare_for_kf_map(grig)
         
-        copy_anim_state(bpy.data.objects['__Rig'], ao_imp)
+        copy_anim_state(grig, ao_imp, bone_map, corrections)
 
         return {'FINISHED'} 
 
+class OBJECT_OT_SaveMappingPreset(bpy.types.Operator):
+    bl_label = "Save bone mapping preset"
+    bl_idname = "object.rbxanims_savemappingpreset"
+    bl_description = "Save bone mapping preset --- Saves how the bones of the selected armature are mapped onto the generated rig (with the chosen bone mapping) as a preset, the json file can be edited afterwards"
+
+    pr_name: bpy.props.StringProperty(name="Preset name", default="My mapping")
+    
+    @classmethod
+    def poll(cls, context):
+        grig = get_active_rig(context)
+        return grig and context.active_object and context.active_object != grig and context.active_object.type == 'ARMATURE'
+ 
+    @profiled
+    def execute(self, context):
+        preset = get_selected_mapping_preset(context)
+        bone_map = resolve_bone_mapping(get_active_rig(context), context.active_object, preset)[0]
+        saved = {
+            'bones': {source_name: target_name for target_name, source_name in sorted(bone_map.items())},
+            'auto_match': False,
+            'rest_correction': preset.get('rest_correction', False) if isinstance(preset, dict) else False,
+            'offsets': preset.get('offsets', {}) if isinstance(preset, dict) else {},
+        }
+        path = save_mapping_preset(self.pr_name, saved)
+        context.scene.rbxanims_settings.mapping_preset = bpy.path.clean_name(self.pr_name)
+        self.report({'INFO'}, 'Saved {:d} bone mappings to {}.'.format(len(bone_map), path))
+        return {'FINISHED'}
+    
+    def invoke(self, context, event):
+        wm = context.window_manager
+        return wm.invoke_props_dialog(self)
+
 class OBJECT_OT_Bake(bpy.types.Operator):
     bl_label = "Bake"
     bl_idname = "object.rbxanims_bake"
-    bl_description = "Bake animation for export"
+    bl_description = "Bake animation for export --- Runs in the background when started from the panel, Esc cancels"
+    
+    @classmethod
+    def poll(cls, context):
+        return get_active_rig(context)
  
+    @profiled
     def execute(self, context):
-        serialized = serialize()
-        encoded = json.dumps(serialized, separators=(',',':'))
-        bpy.context.window_manager.clipboard = (base64.b64encode(zlib.compress(encoded.encode(), 9))).decode('utf-8')
-        self.report({'INFO'}, 'Baked animation data exported to the system clipboard ({:d} keyframes, {:.2f} seconds).'.format(len(serialized['kfs']), serialized['t']))
+        settings = context.scene.rbxanims_settings
+        samples = sample_animation(settings.incremental_bake, get_active_rig(context))
+        self.finish(context, samples, *encode_samples(samples, self.get_reduce_tolerance(settings), settings.export_format, get_quantize_precision(settings)))
+        return {'FINISHED'}
+    
+    # samples in slices of modal_bake_slice seconds on a timer, then encodes on a worker thread, see bake_progress
+    def invoke(self, context, event):
+        if context.window is None:
+            return self.execute(context)
+        if bake_progress:
+            self.report({'WARNING'}, 'A bake is already running.')
+            return {'CANCELLED'}
+        
+        settings = context.scene.rbxanims_settings
+        self._steps = iter_sample_animation(settings.incremental_bake, get_active_rig(context), modal_bake_batch_size)
+        self._future = None
+        self._profile = start_profile(settings.profile_python)
+        self.pause_profile()
+        bake_progress.update(stage='Sampling', done=0, total=0, start=time.perf_counter())
+        self._timer = context.window_manager.event_timer_add(.01, window=context.window)
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+    
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.cancel(context)
+            self.report({'WARNING'}, 'Bake cancelled.')
+            return {'CANCELLED'}
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        
+        if self._profile['profiler']:
+            self._profile['profiler'].enable()
+        try:
+            if self._future is None:
+                self.sample_slice(context)
+            elif self._future.done():
+                samples = self._samples
+                self.end(context)
+                self.finish(context, samples, *self._future.result())
+                finish_profile(self.bl_label, self._profile)
+                return {'FINISHED'}
+        except Exception:
+            self.pause_profile()
+            self.cancel(context)
+            raise
+        
+        self.pause_profile()
+        redraw_panels(context)
+        return {'RUNNING_MODAL'}
+    
+    # the Python profiler (Profile Python) only runs during the timer events of the bake, not for the rest of the UI in between
+    def pause_profile(self):
+        if self._profile['profiler']:
+            self._profile['profiler'].disable()
+    
+    # samples frames until the slice is used up, hands the samples to a worker thread once all frames are sampled
+    def sample_slice(self, context):
+        deadline = time.perf_counter() + modal_bake_slice
+        try:
+            while time.perf_counter() < deadline:
+                bake_progress['done'], bake_progress['total'] = next(self._steps)
+                bake_progress['sampled'] = time.perf_counter()
+        except StopIteration as e:
+            settings = context.scene.rbxanims_settings
+            self._samples = e.value
+            pool = ThreadPoolExecutor(1)
+            self._future = pool.submit(encode_samples, e.value, self.get_reduce_tolerance(settings), settings.export_format, get_quantize_precision(settings))
+            pool.shutdown(wait=False)
+            bake_progress['stage'] = 'Encoding'
+    
+    # stops the bake (the current frame is restored), a running encode finishes on its own and is dropped
+    def cancel(self, context):
+        self._steps.close()
+        self.end(context)
+    
+    def end(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        self._samples = None
+        bake_progress.clear()
+        redraw_panels(context)
+    
+    def get_reduce_tolerance(self, settings):
+        if settings.reduce_keyframes:
+            return (settings.reduce_pos_tolerance, settings.reduce_angle_tolerance)
+        return None
+    
+    def finish(self, context, samples, serialized, encoded, error):
+        settings = context.scene.rbxanims_settings
+        with core.timed('clipboard'):
+            context.window_manager.clipboard = encoded
+        
+        message = 'Baked animation data exported to the system clipboard ({:d} keyframes, {:.2f} seconds).'.format(len(serialized['kfs']), serialized['t'])
+        if self.get_reduce_tolerance(settings):
+            dense_poses = len(samples['frames']) * samples['plan']['count']
+            kept_poses = core.count_poses(serialized)
+            message += ' Kept {:d} of {:d} poses ({:.1f}x reduction).'.format(kept_poses, dense_poses, dense_poses / max(kept_poses, 1))
+        if error:
+            message += ' {:d} characters, quantization error up to {:.4f} studs, {:.3f} degrees.'.format(len(encoded), error['position'], error['angle'])
+        ao = get_active_rig(context)
+        if settings.incremental_bake and ao and ao.name in bake_cache:
+            message += ' Re-sampled {:d} of {:d} frames.'.format(bake_cache[ao.name]['resampled'], len(samples['frames']))
+        message += ' ' + get_sampling_message()
+        self.report({'INFO'}, message)
+
+class OBJECT_OT_BakeToFile(bpy.types.Operator, ExportHelper):
+    bl_label = "Bake to file"
+    bl_idname = "object.rbxanims_baketofile"
+    bl_description = "Bake animation for export to a file --- Streams the animation while it is sampled, for animations that are too long for the clipboard"
+
+    filename_ext = ".txt"
+    filter_glob: bpy.props.StringProperty(default="*.txt", options={'HIDDEN'})
+    pr_segment_size: bpy.props.IntProperty(name="Segment size (0 = single file)", description="Split the output into numbered files of at most this many characters, to be concatenated by the importer", min=0, default=0)
+    
+    @classmethod
+    def poll(cls, context):
+        return get_active_rig(context)
+ 
+    @profiled
+    def execute(self, context):
+        settings = context.scene.rbxanims_settings
+        paths = serialize_to_file(self.properties.filepath, settings.export_format, self.pr_segment_size, precision=get_quantize_precision(settings))
+        if settings.reduce_keyframes:
+            self.report({'WARNING'}, 'Keyframe reduction is not applied when baking to a file.')
+        self.report({'INFO'}, 'Baked animation data exported to {:d} file(s): {}. {}'.format(len(paths), ', '.join(paths), get_sampling_message()))
+        return {'FINISHED'}
+
+class OBJECT_OT_ExportKeyframeSequence(bpy.types.Operator, ExportHelper):
+    bl_label = "Export KeyframeSequence"
+    bl_idname = "object.rbxanims_exportkeyframesequence"
+    bl_description = "Export KeyframeSequence --- Bakes the animation into a model file (.rbxmx/.rbxm) that can be inserted into Roblox Studio as is, without the plugin"
+
+    filename_ext = ".rbxmx"
+    filter_glob: bpy.props.StringProperty(default="*.rbxmx;*.rbxm", options={'HIDDEN'})
+    pr_binary: bpy.props.BoolProperty(name="Binary (.rbxm)", description="Write the binary model format instead of XML", default=False)
+    pr_name: bpy.props.StringProperty(name="Name", description="Name of the KeyframeSequence (default: the action name)", default="")
+    pr_loop: bpy.props.BoolProperty(name="Loop", description="Make the animation loop", default=False)
+    pr_priority: bpy.props.EnumProperty(items=[(priority, priority, "") for priority in core.animation_priorities], name="Priority", default='Action')
+    
+    @classmethod
+    def poll(cls, context):
+        return get_active_rig(context)
+ 
+    @profiled
+    def execute(self, context):
+        ao = get_active_rig(context)
+        settings = context.scene.rbxanims_settings
+        reduce_tolerance = None
+        if settings.reduce_keyframes:
+            reduce_tolerance = (settings.reduce_pos_tolerance, settings.reduce_angle_tolerance)
+        
+        filepath = bpy.path.ensure_ext(os.path.splitext(self.properties.filepath)[0], '.rbxm' if self.pr_binary else '.rbxmx')
+        action = ao.animation_data and ao.animation_data.action
+        name = self.pr_name or (action.name if action else 'Animation')
+        try:
+            serialize_to_keyframe_sequence(filepath, name, self.pr_loop, core.animation_priorities[self.pr_priority], reduce_tolerance, ao)
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        self.report({'INFO'}, 'KeyframeSequence "{}" exported to {}. {}'.format(name, filepath, get_sampling_message()))
+        return {'FINISHED'}
+
+class OBJECT_OT_BatchExport(bpy.types.Operator):
+    bl_label = "Export all actions"
+    bl_idname = "object.rbxanims_batchexport"
+    bl_description = "Export all actions --- Bakes every action matching the filter over its own frame range to a file per action, with a manifest.json"
+
+    directory: bpy.props.StringProperty(name="Directory", subtype='DIR_PATH')
+    pr_filter: bpy.props.StringProperty(name="Action filter", description="Only export actions whose name matches this pattern (* and ? wildcards)", default="*")
+    pr_workers: bpy.props.IntProperty(name="Worker processes (0 = all cores)", description="Bake in this many background Blender processes, long batches only", min=0, default=0)
+    
+    @classmethod
+    def poll(cls, context):
+        return get_active_rig(context)
+ 
+    @profiled
+    def execute(self, context):
+        if not get_batch_export_actions(self.pr_filter):
+            self.report({'ERROR'}, 'No pose actions match "{}".'.format(self.pr_filter))
+            return {'FINISHED'}
+        
+        settings = context.scene.rbxanims_settings
+        reduce_tolerance = None
+        if settings.reduce_keyframes:
+            reduce_tolerance = (settings.reduce_pos_tolerance, settings.reduce_angle_tolerance)
+        
+        manifest = batch_export(self.directory, self.pr_filter, settings.export_format, self.pr_workers, reduce_tolerance,
+            precision=get_quantize_precision(settings))
+        self.report({'INFO'}, 'Exported {:d} animations ({:d} keyframes) to {}.'.format(len(manifest['animations']),
+            sum(anim['keyframes'] for anim in manifest['animations']), self.directory))
+        return {'FINISHED'}
+ 
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+class OBJECT_OT_BakeAllRigs(bpy.types.Operator):
+    bl_label = "Export all rigs"
+    bl_idname = "object.rbxanims_bakeallrigs"
+    bl_description = "Export all rigs --- Bakes the animation of every generated rig over the scene frame range to <rig name>.txt, sampling all rigs in one pass over the frames"
+
+    directory: bpy.props.StringProperty(name="Directory", subtype='DIR_PATH')
+    
+    @classmethod
+    def poll(cls, context):
+        return get_rigs()
+ 
+    @profiled
+    def execute(self, context):
+        settings = context.scene.rbxanims_settings
+        reduce_tolerance = None
+        if settings.reduce_keyframes:
+            reduce_tolerance = (settings.reduce_pos_tolerance, settings.reduce_angle_tolerance)
+        
+        anims = serialize_rigs(reduce_tolerance)
+        for ao, anim in anims.items():
+            rig_name = json.loads(get_rig_meta_object(ao)['RigMeta']).get('rigName') or ao.name
+            encoded = core.encode_animation(anim, settings.export_format, get_quantize_precision(settings))
+            with core.timed('file_io'), open(os.path.join(self.directory, bpy.path.clean_name(rig_name) + '.txt'), 'w') as f:
+                f.write(encoded)
+        self.report({'INFO'}, 'Exported {:d} rigs to {}. {}'.format(len(anims), self.directory, get_sampling_message()))
+        return {'FINISHED'}
+ 
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+class OBJECT_OT_ExportSamples(bpy.types.Operator, ExportHelper):
+    bl_label = "Export bake samples (.npz)"
+    bl_idname = "object.rbxanims_exportsamples"
+    bl_description = "Export bake samples (.npz) --- Sampled pose data that can be baked without Blender using RbxAnimationsCore.py"
+
+    filename_ext = ".npz"
+    filter_glob: bpy.props.StringProperty(default="*.npz", options={'HIDDEN'})
+    
+    @classmethod
+    def poll(cls, context):
+        return get_active_rig(context)
+ 
+    @profiled
+    def execute(self, context):
+        samples = sample_animation(ao=get_active_rig(context))
+        with core.timed('file_io'):
+            core.save_samples(self.properties.filepath, **samples)
+        self.report({'INFO'}, 'Bake samples exported ({:d} frames).'.format(len(samples['frames'])))
+        return {'FINISHED'}
+
+class OBJECT_OT_AddPrecisionGroup(bpy.types.Operator):
+    bl_label = "Add precision group"
+    bl_idname = "object.rbxanims_addprecisiongroup"
+    bl_description = "Add precision group --- Bones matching the group get their own quantization precision (Quantized format)"
+ 
+    def execute(self, context):
+        context.scene.rbxanims_settings.precision_groups.add()
+        return {'FINISHED'}
+
+class OBJECT_OT_RemovePrecisionGroup(bpy.types.Operator):
+    bl_label = "Remove precision group"
+    bl_idname = "object.rbxanims_removeprecisiongroup"
+    bl_description = "Remove precision group"
+
+    pr_index: bpy.props.IntProperty(options={'HIDDEN'})
+ 
+    def execute(self, context):
+        context.scene.rbxanims_settings.precision_groups.remove(self.pr_index)
+        return {'FINISHED'}
+
+class OBJECT_OT_SaveProfile(bpy.types.Operator, ExportHelper):
+    bl_label = "Save profile (.json)"
+    bl_idname = "object.rbxanims_saveprofile"
+    bl_description = "Save profile (.json) --- Where the time of the last operator run went (frame evaluation, math, encoding, I/O, ...)"
+
+    filename_ext = ".json"
+    filter_glob: bpy.props.StringProperty(default="*.json", options={'HIDDEN'})
+    
+    @classmethod
+    def poll(cls, context):
+        return last_profile
+ 
+    def execute(self, context):
+        with open(self.properties.filepath, 'w') as f:
+            json.dump(last_profile, f, indent=1)
+        self.report({'INFO'}, 'Profile of "{}" saved to {}.'.format(last_profile['operator'], self.properties.filepath))
         return {'FINISHED'}
 
 class OBJECT_PT_RbxAnimations(bpy.types.Panel):
@@ -711,7 +2184,7 @@ class OBJECT_PT_RbxAnimations(bpy.types.Panel):
 
     @classmethod
     def poll(cls, context):
-        return bpy.data.objects.get('__RigMeta')
+        return get_rig_metas()
 
     def draw(self, context):
         layout = self.layout
@@ -719,16 +2192,68 @@ class OBJECT_PT_RbxAnimations(bpy.types.Panel):
         obj = context.object
 
         layout.label(text="Rigging:")
+        layout.prop(context.scene.rbxanims_settings, "rig")
         layout.operator("object.rbxanims_genrig", text="Rebuild rig")
         layout.label(text="Quick inverse kinematics:")
         layout.operator("object.rbxanims_genik", text="Create IK constraints")
         layout.operator("object.rbxanims_removeik", text="Remove IK constraints")
+        rig = get_active_rig(context)
+        cache = ik_cache.get(rig.name) if rig else None
+        if cache:
+            stale = int(np.count_nonzero(~cache['valid']))
+            layout.label(text="Baked IK: {:d} frames{}".format(len(cache['frames']), ", {:d} changed".format(stale) if stale else ""))
+            layout.operator("object.rbxanims_bakeikcache", text="Bake IK again")
+            layout.operator("object.rbxanims_clearikcache", text="Clear baked IK")
+        else:
+            layout.operator("object.rbxanims_bakeikcache", text="Bake IK")
         layout.label(text="Animation import:")
+        layout.prop(context.scene.rbxanims_settings, "mapping_preset")
         layout.operator("object.rbxanims_importfbxanimation", text="Import FBX")
         layout.operator("object.rbxanims_mapkeyframes", text="Map keyframes by bone name")
+        layout.operator("object.rbxanims_savemappingpreset", text="Save bone mapping preset")
         layout.operator("object.rbxanims_applytransform", text="Apply armature transform")
         layout.label(text="Export:")
-        layout.operator("object.rbxanims_bake", text="Export animation", icon='RENDER_ANIMATION')
+        settings = context.scene.rbxanims_settings
+        layout.prop(settings, "export_format")
+        if settings.export_format == 'QUANTIZED':
+            layout.prop(settings, "quantize_rotation_bits")
+            layout.prop(settings, "quantize_position_step")
+            for i, group in enumerate(settings.precision_groups):
+                box = layout.box()
+                row = box.row()
+                row.prop(group, "pattern")
+                row.operator("object.rbxanims_removeprecisiongroup", text="", icon='X').pr_index = i
+                box.prop(group, "rotation_bits")
+                box.prop(group, "position_step")
+            layout.operator("object.rbxanims_addprecisiongroup", text="Add precision group", icon='ADD')
+        layout.prop(settings, "incremental_bake")
+        layout.prop(settings, "reduce_keyframes")
+        if settings.reduce_keyframes:
+            layout.prop(settings, "reduce_pos_tolerance")
+            layout.prop(settings, "reduce_angle_tolerance")
+        if bake_progress:
+            factor, text = get_bake_progress()
+            if hasattr(layout, 'progress'):
+                layout.progress(factor=factor, type='BAR', text=text)
+            else:
+                layout.label(text='{} ({:.0%})'.format(text, factor))
+            layout.label(text="Esc cancels the export")
+        else:
+            layout.operator("object.rbxanims_bake", text="Export animation", icon='RENDER_ANIMATION')
+        layout.operator("object.rbxanims_baketofile", text="Export animation to file")
+        layout.operator("object.rbxanims_exportkeyframesequence", text="Export KeyframeSequence")
+        layout.operator("object.rbxanims_batchexport", text="Export all actions")
+        layout.operator("object.rbxanims_bakeallrigs", text="Export all rigs")
+        layout.operator("object.rbxanims_exportsamples", text="Export bake samples")
+        layout.label(text="Profiling:")
+        layout.prop(settings, "profile_python")
+        if last_profile:
+            box = layout.box()
+            box.label(text='{}: {:.3f} s'.format(last_profile['operator'], last_profile['seconds']))
+            for scope, timing in list(last_profile['scopes'].items())[:8]:
+                box.label(text='{}: {:.3f} s ({:.0%}, {:d}x)'.format(scope, timing['seconds'], timing['share'], timing['calls']))
+            box.label(text='Matrix cache: {hits:d} hits, {misses:d} misses'.format(**last_profile['matrix_cache']))
+        layout.operator("object.rbxanims_saveprofile", text="Save profile")
 
 def file_import_extend(self, context):
     self.layout.operator("object.rbxanims_importmodel", text="[Rbx Animations] Rig import (.obj)")
@@ -736,14 +2261,27 @@ def file_import_extend(self, context):
 bl_info = {"name": "Rbx Animations", "category": "Animation", "blender": (2, 80, 0)}
 
 module_classes = [
+    RbxAnimationsPrecisionGroup,
+    RbxAnimationsSettings,
     OBJECT_OT_ImportModel,
     OBJECT_OT_GenRig,
     OBJECT_OT_GenIK,
     OBJECT_OT_RemoveIK,
+    OBJECT_OT_BakeIKCache,
+    OBJECT_OT_ClearIKCache,
     OBJECT_OT_ImportFbxAnimation,
     OBJECT_OT_ApplyTransform,
     OBJECT_OT_MapKeyframes,
+    OBJECT_OT_SaveMappingPreset,
     OBJECT_OT_Bake,
+    OBJECT_OT_BakeToFile,
+    OBJECT_OT_ExportKeyframeSequence,
+    OBJECT_OT_BatchExport,
+    OBJECT_OT_BakeAllRigs,
+    OBJECT_OT_ExportSamples,
+    OBJECT_OT_AddPrecisionGroup,
+    OBJECT_OT_RemovePrecisionGroup,
+    OBJECT_OT_SaveProfile,
     OBJECT_PT_RbxAnimations,
 ]
 
@@ -751,11 +2289,98 @@ register_classes, unregister_classes = bpy.utils.register_classes_factory(module
 
 def register():
     register_classes()
+    bpy.types.Scene.rbxanims_settings = bpy.props.PointerProperty(type=RbxAnimationsSettings)
     bpy.types.TOPBAR_MT_file_import.append(file_import_extend)
+    bpy.app.handlers.depsgraph_update_post.append(on_depsgraph_update)
+    bpy.app.handlers.frame_change_post.append(on_frame_change)
+    bpy.app.handlers.load_post.append(on_load)
 
 def unregister():
+    bpy.app.handlers.depsgraph_update_post.remove(on_depsgraph_update)
+    bpy.app.handlers.frame_change_post.remove(on_frame_change)
+    bpy.app.handlers.load_post.remove(on_load)
+    del bpy.types.Scene.rbxanims_settings
     unregister_classes()
     bpy.types.TOPBAR_MT_file_import.remove(file_import_extend)
     
+## COMMAND LINE ##
+
+# the generated rig of the rig data named rig_name (its rigName), default: the first rig
+def find_rig(rig_name=None):
+    for meta_obj in get_rig_metas():
+        if rig_name is None or json.loads(meta_obj['RigMeta']).get('rigName') == rig_name:
+            ao = get_rig_object(meta_obj)
+            if ao:
+                return ao
+    raise SystemExit('No generated rig{} in {}.'.format(' named ' + rig_name if rig_name else '', bpy.data.filepath or 'the open file'))
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='RbxAnimations.py', description="Rbx Animations, headless baking (run with blender -b --python RbxAnimations.py -- ...).")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    bake_cmd = commands.add_parser('bake', help="bake actions of the rig in a blend file to encoded animation files")
+    bake_cmd.add_argument('blend', nargs='?', help="blend file (default: the open one)")
+    bake_cmd.add_argument('--rig', help="rigName of the rig to bake (default: the first generated rig)")
+    bake_cmd.add_argument('--action', action='append', help="action to bake, can be repeated (default: the assigned action)")
+    bake_cmd.add_argument('--workers', type=int, default=0, help="worker processes (default: one per cpu core)")
+    bake_cmd.add_argument('--format', choices=core.export_formats, default='JSON', help="encoding of the animations (default: %(default)s)")
+    bake_cmd.add_argument('--precision', action='append', type=core.parse_precision_rule, metavar='PATTERN:BITS:STEP', help="QUANTIZED precision of matching bones, see RbxAnimationsCore.py bake --help")
+    bake_cmd.add_argument('--keyframe-sequence', choices=('rbxmx', 'rbxm'), help="write KeyframeSequence model files of this type instead of encoded animations")
+    bake_cmd.add_argument('-o', '--output', default='.', help="output directory (default: current directory)")
+    
+    export_cmd = commands.add_parser('export', help="bake every (matching) action of the rig in a blend file over its own frame range, with a manifest")
+    export_cmd.add_argument('blend', nargs='?', help="blend file (default: the open one)")
+    export_cmd.add_argument('--rig', help="rigName of the rig to bake (default: the first generated rig)")
+    export_cmd.add_argument('--filter', default='*', help="only export actions whose name matches this pattern (default: all)")
+    export_cmd.add_argument('--workers', type=int, default=0, help="worker processes (default: one per cpu core)")
+    export_cmd.add_argument('--format', choices=core.export_formats, default='JSON', help="encoding of the animations (default: %(default)s)")
+    export_cmd.add_argument('--precision', action='append', type=core.parse_precision_rule, metavar='PATTERN:BITS:STEP', help="QUANTIZED precision of matching bones, see RbxAnimationsCore.py bake --help")
+    export_cmd.add_argument('-o', '--output', default='.', help="output directory (default: current directory)")
+    
+    worker_cmd = commands.add_parser('bake-worker', help="internal, see parallel_bake")
+    worker_cmd.add_argument('blend')
+    worker_cmd.add_argument('tasks')
+    worker_cmd.add_argument('result')
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == 'bake-worker':
+        run_bake_worker(args.blend, args.tasks, args.result)
+    
+    elif args.command == 'bake':
+        if args.blend:
+            bpy.ops.wm.open_mainfile(filepath=os.path.abspath(args.blend))
+            restore_saved_ik_constraints()
+        scene = bpy.context.scene
+        jobs = [{'action': action, 'frame_start': scene.frame_start, 'frame_end': scene.frame_end, 'frame_step': scene.frame_step} for action in args.action or [None]]
+        
+        os.makedirs(args.output, exist_ok=True)
+        ao = find_rig(args.rig)
+        for job, anim in zip(jobs, parallel_bake(jobs, args.workers, ao=ao)):
+            name = bpy.path.clean_name(job['action'] or 'animation')
+            if args.keyframe_sequence:
+                path = os.path.join(args.output, name + '.' + args.keyframe_sequence)
+                core.write_keyframe_sequence(path, [anim], get_pose_tree(ao), job['action'] or 'Animation')
+            else:
+                path = os.path.join(args.output, name + '.txt')
+                with open(path, 'w') as f:
+                    f.write(core.encode_animation(anim, args.format, args.precision))
+            print('Baked {:d} keyframes ({:.2f} seconds) to {}.'.format(len(anim['kfs']), anim['t'], path), file=sys.stderr)
+    
+    elif args.command == 'export':
+        if args.blend:
+            bpy.ops.wm.open_mainfile(filepath=os.path.abspath(args.blend))
+            restore_saved_ik_constraints()
+        manifest = batch_export(args.output, args.filter, args.format, args.workers, ao=find_rig(args.rig), precision=args.precision)
+        for anim in manifest['animations']:
+            print('Baked {} ({:d} keyframes, {:.2f} seconds, {:d} characters) to {}.'.format(anim['action'], anim['keyframes'], anim['duration'],
+                anim['payload_size'], os.path.join(args.output, anim['file'])), file=sys.stderr)
+    
+    return 0
+
 if __name__ == "__main__":
+    # blender passes script arguments after --, bpy as a python module gets them directly
+    argv = (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []) if bpy.app.binary_path else sys.argv[1:]
+    if argv:
+        sys.exit(main(argv))
     register()
\ No newline at end of file
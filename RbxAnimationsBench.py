@@ -0,0 +1,355 @@
+###
+# Copyright 2018 Den_S/@DennisRBLX
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+###
+#
+# Rbx Animations benchmarks
+#
+# Times the hot paths of the addon and the bake core and writes the results as json, so runs on
+#   different commits can be compared:
+#
+#   python RbxAnimationsBench.py core --bones 15,100 --frames 600,6000 -o core.json
+#   blender -b -P RbxAnimationsBench.py -- blender --blend Rig15ik.blend --bones 15,60 --frames 600 -o blender.json
+#   python RbxAnimationsBench.py compare old.json new.json
+#
+# For your information:
+#   'core' only needs NumPy and measures the math (cf conversion, C0/C1 solve, encoding, reduction) and
+#     the KeyframeSequence writers.
+#   'blender' needs bpy (run it through blender -b, or with the bpy module) and measures rig building,
+#     baking (also to files, of two rigs at once, from the IK cache and in background processes),
+#     keyframe mapping and armature transform application on synthetic rigs (a tree of the given bone
+#     count, built from generated rig metadata) and, with --blend, on the rig of that file.
+#   Times are the best of --repeat runs, peak memory (--memory) is measured in an extra run with
+#     tracemalloc (Python and NumPy allocations only, not Blender's own).
+#
+
+import os, sys, json, math, time, argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import RbxAnimationsCore as core
+
+results_version = 1
+
+# times fn (best of repeat runs, setup runs before every run and is not timed), returns a result record
+def run_stage(stage, fn, bones, frames, repeat=1, memory=False, setup=None):
+    best = math.inf
+    for i in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+    result = {
+        'stage': stage,
+        'bones': bones,
+        'frames': frames,
+        'seconds': best,
+        'per_frame_ms': best * 1000 / max(frames, 1),
+        'per_bone_frame_us': best * 1e6 / max(frames * bones, 1),
+        'peak_memory_mb': peak,
+    }
+    print('{:<36} {:>5d} bones {:>6d} frames {:>10.4f} s {:>10.4f} ms/frame{}'.format(stage, bones, frames, best, result['per_frame_ms'],
+        '' if peak is None else ' {:>8.2f} MB'.format(peak)), file=sys.stderr)
+    return result
+
+# records a stage that could not run
+def failed_stage(stage, bones, frames, error):
+    print('{:<36} {:>5d} bones {:>6d} frames FAILED: {}'.format(stage, bones, frames, error), file=sys.stderr)
+    return {'stage': stage, 'bones': bones, 'frames': frames, 'error': str(error)}
+
+# rest data of a synthetic rig for compile_export_plan, a root with 4 limbs of (bone_count / 4) bones
+def make_synthetic_rest_bones(bone_count):
+    rest_bones = [{'name': 'Root', 'parent': None, 'is_transformable': False,
+        'transform': np.identity(4).tolist(), 'transform1': np.identity(4).tolist(), 'nicetransform': np.identity(4).tolist()}]
+    for i in range(bone_count):
+        parent = rest_bones[0]['name'] if i < 4 else 'Bone{:d}'.format(i - 4)
+        transform = core.cf_to_mat([(i % 4) - 1.5, -(i // 4) * .5, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1])
+        rest_bones.append({'name': 'Bone{:d}'.format(i), 'parent': parent, 'is_transformable': True,
+            'transform': transform.tolist(), 'transform1': core.cf_to_mat([0, .25, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1]).tolist(),
+            'nicetransform': np.identity(4).tolist()})
+    return rest_bones
+
+# random, smoothly varying pose matrices for the plan bones, (frames x plan bones x 4 x 4)
+def make_synthetic_pose_mats(plan, frame_count, seed=0):
+    rng = np.random.default_rng(seed)
+    bone_count = len(plan['bones'])
+    t = np.arange(frame_count)[:, None] / 60
+    eulers = np.stack([np.sin(t * rng.uniform(.5, 3, bone_count) + rng.uniform(0, 6, bone_count)) for axis in range(3)], axis=-1)
+    locations = np.stack([np.cos(t * rng.uniform(.5, 3, bone_count)) * .1 for axis in range(3)], axis=-1)
+    return core.compose_mats(locations, core.eulers_to_mats(eulers), np.ones((frame_count, bone_count, 3)))
+
+## CORE BENCHMARKS (no bpy) ##
+
+def bench_core(bone_counts, frame_counts, repeat, memory):
+    results = []
+    for bone_count in bone_counts:
+        plan = core.compile_export_plan(make_synthetic_rest_bones(bone_count))
+        prepared = core.load_export_plan(plan)
+        for frame_count in frame_counts:
+            pose_mats = make_synthetic_pose_mats(plan, frame_count)
+            frames = list(range(frame_count))
+            solved = core.solve_animation_states(pose_mats, prepared)
+            cfs = core.mats_to_cfs(solved)
+            times = [i / 60 for i in frames]
+            anim = core.build_animation(prepared['names'], cfs, times, (frame_count - 1) / 60)
+
+            stage_args = (bone_count, frame_count, repeat, memory)
+            results.append(run_stage('core.cf_to_mat', lambda: [core.cf_to_mat(cf) for cf in cfs.reshape(-1, 12)], *stage_args))
+            results.append(run_stage('core.mat_to_cf', lambda: [core.mat_to_cf(mat) for mat in solved.reshape(-1, 4, 4)], *stage_args))
+            results.append(run_stage('core.solve_animation_states', lambda: core.solve_animation_states(pose_mats, prepared), *stage_args))
+            results.append(run_stage('core.mats_to_cfs', lambda: core.mats_to_cfs(solved), *stage_args))
+            results.append(run_stage('core.build_animation', lambda: core.build_animation(prepared['names'], cfs, times, 0), *stage_args))
+            results.append(run_stage('core.bake', lambda: core.bake(plan, pose_mats, frames, 0, frame_count - 1, 60), *stage_args))
+            results.append(run_stage('core.reduce_keyframes', lambda: core.reduce_keyframes(cfs, times, .001, .1), *stage_args))
+            for export_format in core.export_formats:
+                results.append(run_stage('core.encode.' + export_format, lambda: core.encode_animation(anim, export_format), *stage_args))
+
+            # KeyframeSequence writers, on the pose tree of the matching synthetic rig metadata
+            tree = core.pose_tree(make_synthetic_meta(bone_count)['rig'])
+            with tempfile.TemporaryDirectory(prefix='rbxbench') as tmp:
+                for ext in ('.rbxmx', '.rbxm'):
+                    filepath = os.path.join(tmp, 'Bench' + ext)
+                    results.append(run_stage('core.write_keyframe_sequence' + ext, lambda: core.write_keyframe_sequence(filepath, [anim], tree, 'Bench'), *stage_args))
+    return results
+
+## BLENDER BENCHMARKS ##
+
+# rig metadata (as stored on the rig metadata object) of a synthetic rig, a root with 4 limbs of (bone_count / 4) joints
+def make_synthetic_meta(bone_count, rig_name='Synthetic'):
+    def cf(x, y, z):
+        return [x, y, z, 1, 0, 0, 0, 1, 0, 0, 0, 1]
+
+    root = {'jname': 'HumanoidRootPart', 'transform': cf(0, 3, 0), 'aux': [], 'children': []}
+    limbs = [root] * 4
+    for i in range(bone_count):
+        limb = i % 4
+        depth = i // 4
+        joint = {'jname': 'Bone{:d}'.format(i), 'pname': 'Bone{:d}'.format(i), 'aux': [], 'children': [],
+            'transform': cf(limb - 1.5, 2.5 - depth * .5, 0), 'jointtransform0': cf(0, -.25, 0), 'jointtransform1': cf(0, .25, 0)}
+        limbs[limb]['children'].append(joint)
+        limbs[limb] = joint
+    return {'rigName': rig_name, 'parts': [], 'rig': root}
+
+# links a rig metadata object holding meta, named like the import does, returns it
+def add_rig_meta(bpy, addon, meta):
+    meta_obj = bpy.data.objects.new(addon.get_rig_meta_name(meta['rigName']), None)
+    bpy.context.scene.collection.objects.link(meta_obj)
+    meta_obj['RigMeta'] = json.dumps(meta)
+    return meta_obj
+
+# keys every transformable bone of the rig with smooth random rotations every 5 frames
+def animate_synthetic_rig(bpy, ao, frame_count, seed=0):
+    rng = np.random.default_rng(seed)
+    for bone in ao.pose.bones:
+        if 'is_transformable' not in bone.bone:
+            continue
+        bone.rotation_mode = 'XYZ'
+        for frame in range(1, frame_count + 1, 5):
+            bone.rotation_euler = rng.uniform(-.5, .5, 3)
+            bone.keyframe_insert('rotation_euler', frame=frame)
+
+def bench_blender(blend, bone_counts, frame_counts, repeat, memory):
+    import bpy
+    import RbxAnimations as addon
+
+    scene_setups = []
+    if blend:
+        scene_setups.append(('file', None))
+    for bone_count in bone_counts:
+        scene_setups.append(('synthetic', bone_count))
+
+    results = []
+    for kind, bone_count in scene_setups:
+        for frame_count in frame_counts:
+            prefix = 'blender.' + kind + '.'
+            if kind == 'file':
+                bpy.ops.wm.open_mainfile(filepath=blend)
+                meta_obj = addon.get_rig_metas()[0]
+            else:
+                bpy.ops.wm.read_factory_settings(use_empty=True)
+                meta_obj = add_rig_meta(bpy, addon, make_synthetic_meta(bone_count))
+            scene = bpy.context.scene
+            scene.frame_start = 1
+            scene.frame_end = frame_count
+            scene.frame_step = 1
+
+            # rig building
+            def rebuild():
+                bpy.context.view_layer.objects.active = meta_obj
+                addon.create_rig('LOCAL_YAXIS_EXTEND', meta_obj)
+            rig_bones = bone_count if bone_count else len(addon.get_rig_object(meta_obj).pose.bones)
+            if kind == 'synthetic':
+                results.append(run_stage(prefix + 'create_rig', rebuild, rig_bones, 1, repeat, memory))
+                animate_synthetic_rig(bpy, addon.get_rig_object(meta_obj), frame_count)
+            ao = addon.get_rig_object(meta_obj)
+            plan_bones = addon.get_export_plan(ao)['count']
+
+            # baking
+            results.append(run_stage(prefix + 'serialize', lambda: addon.serialize(ao=ao), plan_bones, frame_count, repeat, memory))
+            samples = addon.sample_animation(ao=ao)
+            results.append(run_stage(prefix + 'bake_from_samples', lambda: core.bake(**samples), plan_bones, frame_count, repeat, memory))
+
+            # writers, streamed while sampling
+            with tempfile.TemporaryDirectory(prefix='rbxbench') as tmp:
+                filepath = os.path.join(tmp, 'anim.txt')
+                for export_format in core.export_formats:
+                    results.append(run_stage(prefix + 'serialize_to_file.' + export_format, lambda: addon.serialize_to_file(filepath, export_format, ao=ao),
+                        plan_bones, frame_count, repeat, memory))
+                for ext in ('.rbxmx', '.rbxm'):
+                    filepath = os.path.join(tmp, 'Bench' + ext)
+                    results.append(run_stage(prefix + 'serialize_to_keyframe_sequence' + ext, lambda: addon.serialize_to_keyframe_sequence(filepath, 'Bench', ao=ao),
+                        plan_bones, frame_count, repeat, memory))
+
+            # a second rig of the same metadata (animated like the first one), both baked in the same frame sweep
+            meta = json.loads(meta_obj['RigMeta'])
+            meta['rigName'] += 'Copy'
+            copy_meta_obj = add_rig_meta(bpy, addon, meta)
+            bpy.context.view_layer.objects.active = copy_meta_obj
+            copy_ao = addon.create_rig('LOCAL_YAXIS_EXTEND', copy_meta_obj)
+            if ao.animation_data and ao.animation_data.action:
+                copy_ao.animation_data_create().action = ao.animation_data.action
+            results.append(run_stage(prefix + 'serialize_rigs', lambda: addon.serialize_rigs(aos=[ao, copy_ao]), plan_bones * 2, frame_count, repeat, memory))
+            addon.remove_rig(copy_meta_obj)
+            bpy.data.objects.remove(copy_meta_obj)
+
+            # baked IK mode, solving the constraints into the cache and baking from it
+            results.append(run_stage(prefix + 'bake_ik_cache', lambda: addon.bake_ik_cache(ao), len(ao.pose.bones), frame_count, repeat, memory))
+            results.append(run_stage(prefix + 'serialize.ik_cache', lambda: addon.serialize(ao=ao), plan_bones, frame_count, repeat, memory))
+            addon.clear_ik_cache(ao)
+
+            # background bake processes, sharded over two workers from a saved copy of the file
+            jobs = [{'action': None, 'frame_start': scene.frame_start, 'frame_end': scene.frame_end}]
+            try:
+                results.append(run_stage(prefix + 'parallel_bake.2_workers', lambda: addon.parallel_bake(jobs, 2, min_shard_frames=1, ao=ao),
+                    plan_bones, frame_count, repeat, memory))
+            except Exception as e:
+                results.append(failed_stage(prefix + 'parallel_bake.2_workers', plan_bones, frame_count, e))
+
+            # keyframe mapping, from an animated copy of the rig onto the rig
+            source = ao.copy()
+            source.data = ao.data.copy()
+            source.name = '__BenchSource'
+            if ao.animation_data and ao.animation_data.action:
+                source.animation_data.action = ao.animation_data.action.copy()
+            scene.collection.objects.link(source)
+            try:
+                results.append(run_stage(prefix + 'copy_anim_state', lambda: addon.copy_anim_state(ao, source), len(ao.pose.bones), frame_count, repeat, memory,
+                    setup=lambda: addon.prepare_for_kf_map(ao)))
+            except Exception as e:
+                results.append(failed_stage(prefix + 'copy_anim_state', len(ao.pose.bones), frame_count, e))
+
+            # armature transform application, on the animated source moving along x
+            try:
+                bpy.context.view_layer.objects.active = source
+                bpy.ops.object.mode_set(mode='OBJECT')
+                for frame in (1, frame_count):
+                    source.location = (frame * .01, 0, 0)
+                    source.keyframe_insert('location', frame=frame)
+                results.append(run_stage(prefix + 'apply_ao_transform', lambda: addon.apply_ao_transform(source), len(source.pose.bones), frame_count, 1, memory))
+            except Exception as e:
+                results.append(failed_stage(prefix + 'apply_ao_transform', len(source.pose.bones), frame_count, e))
+
+            # the rig of the file is only rebuilt once everything else was measured on it
+            if kind == 'file':
+                results.append(run_stage(prefix + 'create_rig', rebuild, rig_bones, 1, repeat, memory))
+
+    return results
+
+## RESULTS ##
+
+def get_environment():
+    environment = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'blender': None,
+        'commit': None,
+    }
+    if 'bpy' in sys.modules:
+        environment['blender'] = sys.modules['bpy'].app.version_string
+    try:
+        environment['commit'] = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return environment
+
+# prints the time ratio of every stage in both result files (new / old)
+def compare_results(old, new):
+    old_by_key = {(r['stage'], r['bones'], r['frames']): r for r in old['results'] if 'seconds' in r}
+    print('{:<36} {:>6} {:>7} {:>10} {:>10} {:>7}'.format('stage', 'bones', 'frames', 'old (s)', 'new (s)', 'ratio'))
+    for r in new['results']:
+        key = (r['stage'], r['bones'], r['frames'])
+        if 'seconds' not in r or key not in old_by_key:
+            continue
+        old_seconds = old_by_key[key]['seconds']
+        print('{:<36} {:>6d} {:>7d} {:>10.4f} {:>10.4f} {:>6.2f}x'.format(r['stage'], r['bones'], r['frames'], old_seconds, r['seconds'],
+            r['seconds'] / old_seconds if old_seconds else math.inf))
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:]
+
+    def int_list(value):
+        return [int(x) for x in value.split(',')]
+
+    parser = argparse.ArgumentParser(description="Rbx Animations benchmarks.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, default_frames in (('core', '600,6000'), ('blender', '600')):
+        cmd = commands.add_parser(name, help="benchmark the {} hot paths".format(name))
+        cmd.add_argument('--bones', type=int_list, default=[15, 60], help="bone counts of the synthetic rigs (default: 15,60)")
+        cmd.add_argument('--frames', type=int_list, default=int_list(default_frames), help="frame counts (default: {})".format(default_frames))
+        cmd.add_argument('--repeat', type=int, default=3 if name == 'core' else 1, help="runs per stage, the best one is kept")
+        cmd.add_argument('--memory', action='store_true', help="also measure peak memory (extra run per stage)")
+        cmd.add_argument('-o', '--output', help="results file (default: stdout)")
+        if name == 'blender':
+            cmd.add_argument('--blend', help="also benchmark the rig in this .blend file (e.g. Rig15ik.blend)")
+    compare_cmd = commands.add_parser('compare', help="compare two results files")
+    compare_cmd.add_argument('old')
+    compare_cmd.add_argument('new')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        compare_results(old, new)
+        return 0
+
+    if args.command == 'core':
+        results = bench_core(args.bones, args.frames, args.repeat, args.memory)
+    else:
+        results = bench_blender(os.path.abspath(args.blend) if args.blend else None, args.bones, args.frames, args.repeat, args.memory)
+
+    document = {'version': results_version, 'environment': get_environment(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=1)
+    else:
+        json.dump(document, sys.stdout, indent=1)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
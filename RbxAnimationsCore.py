@@ -0,0 +1,1703 @@
+###
+# Copyright 2018 Den_S/@DennisRBLX
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+###
+#
+# Rbx Animations bake core
+#
+# The CFrame math and encoding behind the Bake operator, without any bpy/mathutils dependency.
+# The addon (RbxAnimations.py) samples pose matrices inside Blender and hands them to this module,
+#   this module can also bake previously saved samples on its own:
+#
+#   python RbxAnimationsCore.py bake samples.npz -o animation.txt
+#
+# The baked animation can also be written as a ready-to-insert KeyframeSequence model file (.rbxmx/.rbxm), see
+#   write_keyframe_sequence, with the Poses nested like the parts of the rig (see pose_tree):
+#
+#   python RbxAnimationsCore.py keyframes samples.npz --meta rig.json -o animation.rbxmx
+#
+# It also reads the rig metadata that the rig exporter encodes in the object names of its .obj files
+#   (Meta<index>q1<base32 chunk>q1), see extract_rig_meta, lays out the bones of the generated rig
+#   (see layout_rig_bones) and matches the bone names of other rigs to it (see auto_match_bones).
+#
+# For your information:
+#   Matrices are NumPy arrays indexed mat[row][col], same as mathutils.
+#   Pose matrices are the Blender (z-up) PoseBone.matrix values, the export plan (see compile_export_plan)
+#     has everything needed to turn them into y-up C0/C1-relative CFrames.
+#   Animations are AnimationBuffers (keyframe times, a keyframes x bones x 12 cf block and a mask of the stored poses),
+#     anim['t'] and anim['kfs'] read like the exported json ({'t', 'kfs': [{'t', 'kf': {bone: cf}}]}).
+#   Samples files (.npz) hold the export plan (json), the pose matrices of the plan bones for every
+#     sampled frame, the sampled frame numbers, the scene frame range and the fps.
+#
+# Binary format (alternative to the json, same zlib + base64 transport), little-endian:
+#   header:    'RBXA', u8 version (1), u8 flags (1 = float16 positions), f32 duration
+#   bones:     u16 count, per bone: u8 name length + utf-8 name
+#   keyframes: u32 count, per keyframe: f32 time, bone mask (1 bit per bone, ceil(bones / 8) bytes),
+#              then per bone in the mask (in bone order): 4 x f32 quaternion (w, x, y, z), 3 x f32/f16 position
+#
+# Quantized binary format (QUANTIZED), same as the binary format with version 2 and flags 0, except:
+#   bones:     after every name: u8 rotation bits, f32 position step (studs), see quantize_precision
+#   keyframes: after the mask, for the n bones in the mask (in bone order): n x u8 index of the dropped quaternion
+#              component, n x 3 x i16 remaining components, n x 3 x i32 position (in position steps)
+#   Rotations are smallest-three quaternions, the largest component is dropped (and made positive), the others are
+#   scaled by (2^(bits-1) - 1) * sqrt(2). Both are stored as the wrapping difference to the previous pose of the same
+#   bone, rotations only if that pose dropped the same component (otherwise as is), see pack_quantized_keyframes.
+#
+
+import os, sys, re, math, json, argparse
+import fnmatch
+import difflib
+import time
+import contextlib
+import pstats
+import struct
+import zlib
+import base64
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape as xml_escape
+import numpy as np
+
+identity_cf = [0,0,0,1,0,0,0,1,0,0,0,1] # identity CF components matrix
+export_formats = ('JSON', 'BINARY32', 'BINARY16', 'QUANTIZED') # encodings supported by encode_animation
+
+binary_magic = b'RBXA'
+binary_version = 1
+binary_flag_half_positions = 1
+binary_version_quantized = 2
+quantize_default_precision = (14, .001) # rotation bits, position step (studs) of bones without a precision rule
+quantized_zlib_level = 6 # the quantized deltas are so repetitive that level 9 takes ~10x longer for ~1.5% less
+cf_round = False # round cframes before exporting? (reduce size)
+cf_round_fac = 4 # round to how many decimals?
+
+meta_name_pattern = re.compile(r'^Meta(\d+)q1(.*?)q1\d*(\.\d+)?$') # names of the objects carrying the rig metadata
+obj_name_pattern = re.compile(rb'^[og] +(.+?)\r?$', re.MULTILINE) # object/group lines of a .obj file
+
+animation_priorities = {'Core': 1000, 'Idle': 0, 'Movement': 1, 'Action': 2, 'Action2': 3, 'Action3': 4, 'Action4': 5} # Enum.AnimationPriority values
+rbxmx_cframe_tags = ('X', 'Y', 'Z', 'R00', 'R01', 'R02', 'R10', 'R11', 'R12', 'R20', 'R21', 'R22') # CoordinateFrame elements, in cf order
+rbxm_magic = b'<roblox!\x89\xff\r\n\x1a\n'
+
+timings = {} # {scope: [calls, seconds]}, see timed
+
+# y-up cf -> y-up mat
+def cf_to_mat(cf):
+    mat = np.identity(4)
+    mat[0:3, 3] = cf[0:3]
+    mat[0:3, 0:3] = np.reshape(cf[3:12], (3, 3))
+    return mat
+
+# y-up mat -> y-up cf
+def mat_to_cf(mat):
+    r_mat = [mat[0][3], mat[1][3], mat[2][3],
+        mat[0][0], mat[0][1], mat[0][2],
+        mat[1][0], mat[1][1], mat[1][2],
+        mat[2][0], mat[2][1], mat[2][2]
+    ]
+    return r_mat
+
+# batched cf_to_mat, (... x 12) -> (... x 4 x 4)
+def cfs_to_mats(cfs):
+    cfs = np.asarray(cfs, dtype=np.float64)
+    mats = np.zeros(cfs.shape[:-1] + (4, 4))
+    mats[..., :3, 3] = cfs[..., :3]
+    mats[..., :3, :3] = cfs[..., 3:12].reshape(cfs.shape[:-1] + (3, 3))
+    mats[..., 3, 3] = 1
+    return mats
+
+# batched mat_to_cf, (... x 4 x 4) -> (... x 12)
+def mats_to_cfs(mats):
+    return np.concatenate((mats[..., :3, 3], mats[..., :3, :3].reshape(mats.shape[:-2] + (9,))), axis=-1)
+
+# rotation matrices -> unit quaternions (w, x, y, z), (... x 3 x 3) -> (... x 4)
+def mats_to_quats(rots):
+    rots = np.asarray(rots, dtype=np.float64)
+    m00, m11, m22 = rots[..., 0, 0], rots[..., 1, 1], rots[..., 2, 2]
+
+    # pick the numerically stable branch per matrix (largest of w, x, y, z)
+    quats = np.stack((
+        1 + m00 + m11 + m22,
+        1 + m00 - m11 - m22,
+        1 - m00 + m11 - m22,
+        1 - m00 - m11 + m22,
+    ), axis=-1)
+    branch = np.argmax(quats, axis=-1)
+    diag = np.sqrt(np.maximum(np.take_along_axis(quats, branch[..., None], axis=-1)[..., 0], 1e-12)) * 2
+
+    d21 = rots[..., 2, 1] - rots[..., 1, 2]
+    d02 = rots[..., 0, 2] - rots[..., 2, 0]
+    d10 = rots[..., 1, 0] - rots[..., 0, 1]
+    s21 = rots[..., 2, 1] + rots[..., 1, 2]
+    s02 = rots[..., 0, 2] + rots[..., 2, 0]
+    s10 = rots[..., 1, 0] + rots[..., 0, 1]
+
+    candidates = np.stack((
+        np.stack((diag * diag / 4, d21, d02, d10), axis=-1),
+        np.stack((d21, diag * diag / 4, s10, s02), axis=-1),
+        np.stack((d02, s10, diag * diag / 4, s21), axis=-1),
+        np.stack((d10, s02, s21, diag * diag / 4), axis=-1),
+    ), axis=-2)
+    quats = np.take_along_axis(candidates, branch[..., None, None], axis=-2)[..., 0, :] / diag[..., None]
+    return quats / np.linalg.norm(quats, axis=-1, keepdims=True)
+
+# unit quaternions (w, x, y, z) -> rotation matrices, (... x 4) -> (... x 3 x 3)
+def quats_to_mats(quats):
+    w, x, y, z = np.moveaxis(np.asarray(quats, dtype=np.float64), -1, 0)
+    return np.stack((
+        np.stack((1 - 2*(y*y + z*z), 2*(x*y - z*w), 2*(x*z + y*w)), axis=-1),
+        np.stack((2*(x*y + z*w), 1 - 2*(x*x + z*z), 2*(y*z - x*w)), axis=-1),
+        np.stack((2*(x*z - y*w), 2*(y*z + x*w), 1 - 2*(x*x + y*y)), axis=-1),
+    ), axis=-2)
+
+# euler angles (radians) -> rotation matrices for a Blender rotation order ('XYZ', 'ZXY', ...), (... x 3) -> (... x 3 x 3)
+# the first axis of the order is applied first, so 'XYZ' is Rz @ Ry @ Rx
+def eulers_to_mats(eulers, order='XYZ'):
+    eulers = np.asarray(eulers, dtype=np.float64)
+    mats = np.broadcast_to(np.identity(3), eulers.shape[:-1] + (3, 3))
+    for axis_name in order:
+        axis = 'XYZ'.index(axis_name)
+        c = np.cos(eulers[..., axis])
+        s = np.sin(eulers[..., axis])
+        a, b = [i for i in range(3) if i != axis]
+        rot = np.zeros(eulers.shape[:-1] + (3, 3))
+        rot[..., axis, axis] = 1
+        rot[..., a, a] = c
+        rot[..., b, b] = c
+        # y rotates the other way around in the a/b plane (z -> x)
+        rot[..., a, b] = s if axis == 1 else -s
+        rot[..., b, a] = -s if axis == 1 else s
+        mats = rot @ mats
+    return mats
+
+# axis angles (angle, x, y, z) -> unit quaternions (w, x, y, z), (... x 4) -> (... x 4)
+def axis_angles_to_quats(axis_angles):
+    axis_angles = np.asarray(axis_angles, dtype=np.float64)
+    axes = axis_angles[..., 1:4]
+    norms = np.linalg.norm(axes, axis=-1, keepdims=True)
+    axes = np.where(norms > 0, axes / np.where(norms > 0, norms, 1), [0, 1, 0])
+    half = axis_angles[..., 0:1] * .5
+    return np.concatenate((np.cos(half), axes * np.sin(half)), axis=-1)
+
+# location, rotation matrix and scale -> 4x4 (basis) matrices, translation @ rotation @ scale
+def compose_mats(locations, rots, scales):
+    mats = np.zeros(np.shape(locations)[:-1] + (4, 4))
+    mats[..., :3, :3] = rots * np.asarray(scales)[..., None, :]
+    mats[..., :3, 3] = locations
+    mats[..., 3, 3] = 1
+    return mats
+
+# 4x4 (basis) matrices -> location, rotation matrix and scale, reverses compose_mats like Matrix.decompose splits them
+#   (a mirroring matrix gets negative scales), (... x 4 x 4) -> (... x 3), (... x 3 x 3), (... x 3)
+def decompose_mats(mats):
+    mats = np.asarray(mats, dtype=np.float64)
+    scales = np.linalg.norm(mats[..., :3, :3], axis=-2)
+    rots = mats[..., :3, :3] / np.where(scales > 0, scales, 1)[..., None, :]
+    mirrored = np.linalg.det(rots) < 0
+    rots[mirrored] *= -1
+    scales[mirrored] *= -1
+    return mats[..., :3, 3], rots, scales
+
+# quaternions of consecutive keys with the signs picked so that every key is on the near side of the previous one
+#   (interpolating the short way), (keys x 4)
+def continuous_quats(quats):
+    quats = np.array(quats, dtype=np.float64)
+    flips = np.sum(quats[1:] * quats[:-1], axis=-1) < 0
+    quats[1:] *= np.cumprod(np.where(flips, -1, 1))[:, None]
+    return quats
+
+# for every new key frame, the index of the existing key it replaces (the nearest one closer than threshold frames,
+#   like keyframe_insert does), -1 if none, old_frames in any order
+def match_keyframes(old_frames, frames, threshold=.01):
+    old_frames = np.asarray(old_frames, dtype=np.float64)
+    frames = np.asarray(frames, dtype=np.float64)
+    if not len(old_frames):
+        return np.full(len(frames), -1)
+    old_order = np.argsort(old_frames, kind='stable')
+    sorted_frames = old_frames[old_order]
+    right = np.clip(np.searchsorted(sorted_frames, frames), 0, len(sorted_frames) - 1)
+    left = np.clip(right - 1, 0, len(sorted_frames) - 1)
+    nearest = np.where(np.abs(sorted_frames[left] - frames) < np.abs(sorted_frames[right] - frames), left, right)
+    return np.where(np.abs(sorted_frames[nearest] - frames) < threshold, old_order[nearest], -1)
+
+# slerps from quaternion q0 to q1 for every factor in alphas, (n) -> (n x 4)
+def slerp_quats(q0, q1, alphas):
+    alphas = np.asarray(alphas, dtype=np.float64)[:, None]
+    dot = float(np.dot(q0, q1))
+    if dot < 0: # take the short way around
+        q1 = -q1
+        dot = -dot
+
+    if dot > 0.9995: # (nearly) the same rotation, lerp is accurate enough
+        quats = q0 + (q1 - q0) * alphas
+        return quats / np.linalg.norm(quats, axis=-1, keepdims=True)
+
+    theta = math.acos(dot)
+    return (np.sin((1 - alphas) * theta) * q0 + np.sin(alphas * theta) * q1) / math.sin(theta)
+
+# angles (radians) between the rotations of two sets of quaternions
+def quat_angles(q0, q1):
+    return 2 * np.arccos(np.clip(np.abs(np.sum(q0 * q1, axis=-1)), 0, 1))
+
+# finds the keyframes to keep per bone, (frames x bones x 12) cfs -> (frames x bones) mask
+# a keyframe is dropped if lerping the position and slerping the rotation between the kept neighbours
+#   reproduces it within the tolerances (studs, degrees), the first and last keyframe are always kept
+def reduce_keyframes(cfs, times, pos_tolerance, angle_tolerance):
+    cfs = np.asarray(cfs, dtype=np.float64)
+    times = np.asarray(times, dtype=np.float64)
+    frame_count, bone_count = cfs.shape[:2]
+
+    keep = np.zeros((frame_count, bone_count), dtype=bool)
+    if frame_count == 0:
+        return keep
+    keep[0] = keep[-1] = True
+
+    positions = cfs[..., 0:3]
+    quats = mats_to_quats(cfs[..., 3:12].reshape(frame_count, bone_count, 3, 3))
+    pos_tolerance = max(pos_tolerance, 1e-9)
+    angle_tolerance = max(math.radians(angle_tolerance), 1e-9)
+
+    # Ramer-Douglas-Peucker, split each segment at its worst keyframe until everything is within tolerance
+    for b in range(bone_count):
+        segments = [(0, frame_count - 1)]
+        while segments:
+            first, last = segments.pop()
+            if last - first < 2:
+                continue
+
+            alphas = (times[first+1:last] - times[first]) / (times[last] - times[first])
+            lerped = positions[first, b] + (positions[last, b] - positions[first, b]) * alphas[:, None]
+            pos_err = np.linalg.norm(lerped - positions[first+1:last, b], axis=-1)
+            angle_err = quat_angles(slerp_quats(quats[first, b], quats[last, b], alphas), quats[first+1:last, b])
+
+            err = np.maximum(pos_err / pos_tolerance, angle_err / angle_tolerance)
+            worst = int(np.argmax(err))
+            if err[worst] > 1:
+                split = first + 1 + worst
+                keep[split, b] = True
+                segments.append((first, split))
+                segments.append((split, last))
+
+    return keep
+
+# frame range affected by the changes between two versions of an F-curve's keyframes, None if nothing changed
+# keys are (keys x n) arrays with the keyframe frame and value in the first two columns (any other columns, like
+#   handles, are compared too), a changed key affects everything between its neighbouring keys, the (constant)
+#   extrapolation before the first/after the last key only changes if that key moved (-inf/inf)
+def keyframe_dirty_range(old_keys, new_keys):
+    old_keys = np.asarray(old_keys)
+    new_keys = np.asarray(new_keys)
+    if old_keys.shape == new_keys.shape and np.array_equal(old_keys, new_keys):
+        return None
+    if len(old_keys) == 0 or len(new_keys) == 0:
+        return (-math.inf, math.inf)
+
+    # skip the unchanged keys at both ends
+    common = min(len(old_keys), len(new_keys))
+    same = np.all(old_keys[:common] == new_keys[:common], axis=-1)
+    first = int(np.argmin(same)) if not np.all(same) else common
+    same = np.all(old_keys[len(old_keys)-common:][::-1] == new_keys[len(new_keys)-common:][::-1], axis=-1)
+    tail = int(np.argmin(same)) if not np.all(same) else common
+    tail = min(tail, common - first)
+
+    lo = math.inf
+    hi = -math.inf
+    first_moved = not np.array_equal(old_keys[0][:2], new_keys[0][:2])
+    last_moved = not np.array_equal(old_keys[-1][:2], new_keys[-1][:2])
+    for keys in (old_keys, new_keys):
+        if first > 0:
+            lo = min(lo, keys[first - 1][0])
+        else:
+            lo = min(lo, -math.inf if first_moved else keys[0][0])
+        if tail > 0:
+            hi = max(hi, keys[len(keys) - tail][0])
+        else:
+            hi = max(hi, math.inf if last_moved else keys[-1][0])
+    return (lo, hi)
+
+# counts the bone poses stored in an animation
+def count_poses(anim):
+    return int(np.count_nonzero(as_animation_buffer(anim).present))
+
+# compacts a cf for the exported json, returns None if the cf is the identity (not stored)
+def compact_cf(statel):
+    if cf_round:
+        statel = list(map(lambda x: round(x, cf_round_fac), statel)) # compresses result
+
+    # flatten, compresses the resulting json too
+    for i in range(len(statel)):
+        if int(statel[i]) ==  statel[i]:
+            statel[i] = int(statel[i])
+
+    # only store if not identity, compresses the resulting json
+    if statel != identity_cf:
+        return statel
+    return None
+
+# compiles the export plan of a rig from its rest data
+# rest_bones lists a dict per bone: name, parent (name or None), is_transformable and the
+#   transform/transform1/nicetransform matrices as stored on the rig bones
+# the plan lists the transformable bones (export order) followed by parent-only bones, the parent
+#   index of each transformable bone, and the prepared rest matrices for solve_animation_states
+# the z-up -> y-up conversion cancels out in the C0/C1 delta, which then reduces to
+#   bone_transform = pre @ parent_pose.inverted() @ bone_pose @ post
+# with pre = orig_transform.inverted() @ parent nicetransform, post = nicetransform.inverted()
+def compile_export_plan(rest_bones):
+    by_name = {bone['name']: bone for bone in rest_bones}
+    transformable = [bone for bone in rest_bones if bone['is_transformable']]
+    bones = [bone['name'] for bone in transformable]
+    for bone in transformable:
+        if bone['parent'] not in bones:
+            bones.append(bone['parent'])
+
+    parents = []
+    pre = []
+    post = []
+    for bone in transformable:
+        parent = by_name[bone['parent']]
+
+        # compute neutrals after applying C1/transform1
+        orig_base_mat = np.array(bone['transform']) @ np.array(bone['transform1'])
+        parent_orig_base_mat = np.array(parent['transform']) @ np.array(parent['transform1'])
+        orig_transform = np.linalg.inv(parent_orig_base_mat) @ orig_base_mat
+
+        parents.append(bones.index(bone['parent']))
+        pre.append((np.linalg.inv(orig_transform) @ np.array(parent['nicetransform'])).tolist())
+        post.append(np.linalg.inv(np.array(bone['nicetransform'])).tolist())
+
+    return {
+        'count': len(transformable),
+        'bones': bones,
+        'parents': parents,
+        'pre': pre,
+        'post': post,
+    }
+
+# converts a (json) export plan to the arrays used by solve_animation_states
+def load_export_plan(plan):
+    return {
+        'names': plan['bones'][:plan['count']],
+        'parent_idx': np.array(plan['parents'], dtype=np.intp),
+        'pre': np.array(plan['pre'], dtype=np.float64).reshape(-1, 4, 4),
+        'post': np.array(plan['post'], dtype=np.float64).reshape(-1, 4, 4),
+    }
+
+# computes the y-up C0/C1 bone transforms of every plan bone for every sampled frame, (frames x bones x 4 x 4)
+# pose_mats are the pose matrices of the plan bones, (frames x plan bones x 4 x 4)
+def solve_animation_states(pose_mats, prepared):
+    parent_inv = np.linalg.inv(pose_mats[:, prepared['parent_idx']])
+    return prepared['pre'] @ parent_inv @ pose_mats[:, :len(prepared['names'])] @ prepared['post']
+
+# an animation: names is the bone index table, times the (keyframes) keyframe times, cfs the (keyframes x bones x 12)
+#   cfs and present the (keyframes x bones) mask of the stored poses, the cfs of the other poses are ignored (identity,
+#   or interpolated in reduced animations, see build_animation)
+# the encoders and the keyframe reducer work on the arrays, anim['t'] and anim['kfs'] read like the exported json
+#   ({'t', 'kfs': [{'t', 'kf': {bone: cf}}]}) with the keyframe dicts built on access (see AnimationKeyframes),
+#   to_dict builds all of them at once (for json)
+class AnimationBuffer:
+    __slots__ = ('duration', 'names', 'times', 'cfs', 'present')
+
+    def __init__(self, names, times, cfs, duration, present=None):
+        self.names = list(names)
+        self.times = np.asarray(times, dtype=np.float64).reshape(-1)
+        self.cfs = np.asarray(cfs).reshape(len(self.times), len(self.names), 12)
+        self.present = np.ones(self.cfs.shape[:2], dtype=bool) if present is None else np.asarray(present, dtype=bool)
+        self.duration = duration
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, key):
+        if key == 't':
+            return self.duration
+        if key == 'kfs':
+            return AnimationKeyframes(self)
+        raise KeyError(key)
+
+    # keyframe n as {'t', 'kf': {bone: cf}}, cfs compacted like the exported json (see compact_cf)
+    def keyframe(self, n):
+        bones = np.flatnonzero(self.present[n])
+        return {'t': float(self.times[n]), 'kf': {self.names[b]: compact_cf(cf) or list(identity_cf) for b, cf in zip(bones, self.cfs[n, bones].tolist())}}
+
+    # all keyframes as dicts like keyframe, but built from the arrays at once: the stored poses are converted together
+    #   and their integral components made ints like compact_cf does
+    def to_dict(self):
+        frames, bones = np.nonzero(self.present)
+        poses = self.cfs[frames, bones].astype(np.float64)
+        if cf_round:
+            poses = np.array([[round(x, cf_round_fac) for x in pose] for pose in poses.tolist()]).reshape(-1, 12)
+        cfs = poses.tolist()
+        rows, columns = np.nonzero(np.isfinite(poses) & (poses == np.trunc(poses)))
+        for i, j in zip(rows.tolist(), columns.tolist()):
+            cfs[i][j] = int(cfs[i][j])
+        names = [self.names[b] for b in bones.tolist()]
+
+        kfs = []
+        first = 0
+        for t, count in zip(self.times.tolist(), np.count_nonzero(self.present, axis=1).tolist()):
+            kfs.append({'t': t, 'kf': dict(zip(names[first:first + count], cfs[first:first + count]))})
+            first += count
+        return {'t': self.duration, 'kfs': kfs}
+
+# the keyframes of an AnimationBuffer as a sequence of keyframe dicts (see AnimationBuffer.keyframe), built on access
+class AnimationKeyframes:
+    __slots__ = ('anim',)
+
+    def __init__(self, anim):
+        self.anim = anim
+
+    def __len__(self):
+        return len(self.anim)
+
+    def __getitem__(self, n):
+        indices = range(len(self.anim))[n]
+        if isinstance(indices, range):
+            return [self.anim.keyframe(i) for i in indices]
+        return self.anim.keyframe(indices)
+
+    def __iter__(self):
+        return (self.anim.keyframe(n) for n in range(len(self.anim)))
+
+# an animation as AnimationBuffer, converts the json structure (e.g. decoded json or read_keyframe_sequence), keeps AnimationBuffers
+def as_animation_buffer(anim):
+    if isinstance(anim, AnimationBuffer):
+        return anim
+    names = animation_bone_names(anim)
+    index_of = {name: i for i, name in enumerate(names)}
+    cfs = np.empty((len(anim['kfs']), len(names), 12))
+    cfs[:] = identity_cf
+    present = np.zeros(cfs.shape[:2], dtype=bool)
+    for n, kf in enumerate(anim['kfs']):
+        for name, cf in kf['kf'].items():
+            cfs[n, index_of[name]] = cf
+            present[n, index_of[name]] = True
+    return AnimationBuffer(names, [kf['t'] for kf in anim['kfs']], cfs, anim['t'], present)
+
+# builds the animation from solved cfs, (frames x bones x 12), identity poses are not stored
+# with a keep mask (see reduce_keyframes), dropped poses are left out and kept poses are always stored
+#   (even identity ones, a missing pose is interpolated), frames without any poses are left out
+def build_animation(names, cfs, times, duration, keep=None):
+    cfs = np.asarray(cfs)
+    if cf_round:
+        cfs = np.round(cfs, cf_round_fac)
+    if keep is None:
+        return AnimationBuffer(names, times, cfs, duration, np.any(cfs != identity_cf, axis=-1))
+
+    frames = np.flatnonzero(np.any(keep, axis=-1))
+    return AnimationBuffer(names, np.asarray(times, dtype=np.float64)[frames], cfs[frames], duration, keep[frames])
+
+# bakes sampled pose matrices into the exported animation
+# reduce_tolerance: optional (studs, degrees) tolerance for dropping keyframes, see reduce_keyframes
+def bake(plan, pose_mats, frames, frame_start, frame_end, fps, reduce_tolerance=None):
+    with timed('matrix_math'):
+        prepared = load_export_plan(plan)
+        cfs = mats_to_cfs(solve_animation_states(np.asarray(pose_mats, dtype=np.float64), prepared))
+        times = [(i - frame_start) / fps for i in frames]
+
+        keep = None
+        if reduce_tolerance is not None:
+            keep = reduce_keyframes(cfs, times, *reduce_tolerance)
+
+    with timed('build_keyframes'):
+        return build_animation(prepared['names'], cfs, times, (frame_end - frame_start) / fps, keep)
+
+# numpy layout of a single pose in the binary format
+def binary_pose_dtype(half_positions):
+    return np.dtype([('quat', '<f4', 4), ('pos', '<f2' if half_positions else '<f4', 3)])
+
+# lists the bones of an animation in order of appearance
+def animation_bone_names(anim):
+    if isinstance(anim, AnimationBuffer):
+        if not len(anim):
+            return []
+        first = np.argmax(anim.present, axis=0)
+        return [anim.names[b] for b in np.argsort(first, kind='stable') if anim.present[first[b], b]]
+    names = []
+    seen = set()
+    for kf in anim['kfs']:
+        for name in kf['kf']:
+            if name not in seen:
+                seen.add(name)
+                names.append(name)
+    return names
+
+# packs the binary header (everything up to the first keyframe)
+def pack_header(duration, names, kf_count, half_positions):
+    out = bytearray(struct.pack('<4sBBf', binary_magic, binary_version, binary_flag_half_positions if half_positions else 0, duration))
+    out += struct.pack('<H', len(names))
+    for name in names:
+        encoded_name = name.encode('utf-8')
+        out += struct.pack('<B', len(encoded_name)) + encoded_name
+    out += struct.pack('<I', kf_count)
+    return bytes(out)
+
+# the stored poses of an animation (AnimationBuffer) in file order, by keyframe and then by header index (index_of maps
+#   bone names to it), returns the (poses) header index and (poses x 12) cf of every pose, the (keyframes x mask bytes)
+#   bone masks and the (keyframes) pose counts
+def binary_poses(anim, index_of):
+    frames, bones = np.nonzero(anim.present)
+    columns = np.array([index_of.get(name, -1) for name in anim.names], dtype=np.int64)[bones]
+    if np.any(columns < 0):
+        raise ValueError('Bone "{}" is not in the header.'.format(anim.names[bones[np.argmax(columns < 0)]]))
+    order = np.lexsort((columns, frames))
+    frames, bones, columns = frames[order], bones[order], columns[order]
+
+    masks = np.zeros((len(anim), len(index_of)), dtype=bool)
+    masks[frames, columns] = True
+    return columns, anim.cfs[frames, bones], np.packbits(masks, axis=-1, bitorder='little'), np.bincount(frames, minlength=len(anim))
+
+# packs a batch of keyframes (AnimationBuffer), index_of maps bone names to their index in the header
+def pack_keyframes(anim, index_of, half_positions):
+    # poses in file order, converted all at once
+    bones, cfs, masks, counts = binary_poses(anim, index_of)
+    poses = np.empty(len(cfs), dtype=binary_pose_dtype(half_positions))
+    poses['quat'] = mats_to_quats(cfs[:, 3:12].reshape(-1, 3, 3))
+    poses['pos'] = cfs[:, 0:3]
+
+    out = bytearray()
+    offset = 0
+    for t, mask, count in zip(anim.times.tolist(), masks, counts.tolist()):
+        out += struct.pack('<f', t) + mask.tobytes()
+        out += poses[offset:offset + count].tobytes()
+        offset += count
+
+    return bytes(out)
+
+# packs an animation into the binary format (see the top of this file)
+def pack_animation(anim, half_positions=False):
+    anim = as_animation_buffer(anim)
+    names = animation_bone_names(anim)
+    index_of = {name: i for i, name in enumerate(names)}
+    return pack_header(anim.duration, names, len(anim), half_positions) + pack_keyframes(anim, index_of, half_positions)
+
+# reference decoder for pack_animation (and pack_quantized_animation), returns an AnimationBuffer
+def unpack_animation(data):
+    magic, version, flags, duration = struct.unpack_from('<4sBBf', data, 0)
+    if magic != binary_magic:
+        raise ValueError('Not a binary animation.')
+    if version == binary_version_quantized:
+        return unpack_quantized_animation(data)
+    if version != binary_version:
+        raise ValueError('Unsupported binary animation version {:d}.'.format(version))
+    offset = 10
+
+    bone_count, = struct.unpack_from('<H', data, offset)
+    offset += 2
+    names = []
+    for i in range(bone_count):
+        name_len = data[offset]
+        names.append(data[offset + 1:offset + 1 + name_len].decode('utf-8'))
+        offset += 1 + name_len
+
+    kf_count, = struct.unpack_from('<I', data, offset)
+    offset += 4
+    mask_len = (bone_count + 7) // 8
+    pose_dtype = binary_pose_dtype(flags & binary_flag_half_positions)
+
+    times = np.empty(kf_count)
+    present = np.zeros((kf_count, bone_count), dtype=bool)
+    poses = []
+    for n in range(kf_count):
+        times[n], = struct.unpack_from('<f', data, offset)
+        present[n] = np.unpackbits(np.frombuffer(data, dtype=np.uint8, count=mask_len, offset=offset + 4), count=bone_count, bitorder='little')
+        offset += 4 + mask_len
+
+        count = int(np.count_nonzero(present[n]))
+        poses.append(np.frombuffer(data, dtype=pose_dtype, count=count, offset=offset))
+        offset += count * pose_dtype.itemsize
+
+    # the poses are stored in mask order, the order of cfs[present]
+    poses = np.concatenate(poses) if poses else np.empty(0, dtype=pose_dtype)
+    cfs = np.empty((kf_count, bone_count, 12))
+    cfs[:] = identity_cf
+    cfs[present] = np.concatenate((poses['pos'].astype(np.float64), quats_to_mats(poses['quat']).reshape(-1, 9)), axis=-1)
+    return AnimationBuffer(names, times, cfs, duration, present)
+
+# rotation bits and position step of every bone, (bones) arrays
+# precision: [(bone name pattern, rotation bits (8-16), position step)], the first matching rule counts,
+#   other bones get quantize_default_precision
+def quantize_precision(names, precision=None):
+    bits = np.empty(len(names), dtype=np.uint8)
+    steps = np.empty(len(names), dtype=np.float32)
+    for i, name in enumerate(names):
+        bits[i], steps[i] = next(((rule_bits, rule_step) for pattern, rule_bits, rule_step in precision or []
+            if fnmatch.fnmatchcase(name, pattern)), quantize_default_precision)
+    return np.clip(bits, 8, 16), steps
+
+# smallest-three quantization of cfs, (n x 12) cfs, (n) bits and steps -> (n) dropped component, (n x 3) rotation, (n x 3) position
+def quantize_cfs(cfs, bits, steps):
+    quats = mats_to_quats(cfs[:, 3:12].reshape(-1, 3, 3))
+    dropped = np.argmax(np.abs(quats), axis=-1)
+    quats *= np.where(np.take_along_axis(quats, dropped[:, None], axis=-1) < 0, -1, 1)
+    kept = np.array([[j for j in range(4) if j != i] for i in range(4)])[dropped]
+    scales = (2. ** (bits.astype(np.float64) - 1) - 1) * math.sqrt(2)
+    rots = np.clip(np.round(np.take_along_axis(quats, kept, axis=-1) * scales[:, None]), -32767, 32767).astype(np.int64)
+    positions = np.round(cfs[:, 0:3] / steps.astype(np.float64)[:, None]).astype(np.int64)
+    return dropped.astype(np.uint8), rots, positions
+
+# reverses quantize_cfs, -> (n x 12) cfs
+def dequantize_cfs(dropped, rots, positions, bits, steps):
+    scales = (2. ** (bits.astype(np.float64) - 1) - 1) * math.sqrt(2)
+    others = rots / scales[:, None]
+    quats = np.empty((len(dropped), 4))
+    kept = np.array([[j for j in range(4) if j != i] for i in range(4)])[dropped]
+    np.put_along_axis(quats, kept, others, axis=-1)
+    np.put_along_axis(quats, dropped[:, None].astype(np.int64), np.sqrt(np.maximum(1 - np.sum(others * others, axis=-1), 0))[:, None], axis=-1)
+    quats /= np.linalg.norm(quats, axis=-1, keepdims=True)
+    return np.concatenate((positions * steps.astype(np.float64)[:, None], quats_to_mats(quats).reshape(-1, 9)), axis=-1)
+
+# packs the quantized binary header, precision see quantize_precision
+def pack_quantized_header(duration, names, kf_count, precision=None):
+    bits, steps = quantize_precision(names, precision)
+    out = bytearray(struct.pack('<4sBBf', binary_magic, binary_version_quantized, 0, duration))
+    out += struct.pack('<H', len(names))
+    for name, bone_bits, step in zip(names, bits, steps):
+        encoded_name = name.encode('utf-8')
+        out += struct.pack('<B', len(encoded_name)) + encoded_name + struct.pack('<Bf', bone_bits, step)
+    out += struct.pack('<I', kf_count)
+    return bytes(out)
+
+# delta state of the quantized format, the last stored pose of every bone
+def new_quantize_state(bone_count):
+    return {
+        'dropped': np.full(bone_count, -1),
+        'rots': np.zeros((bone_count, 3), dtype=np.int64),
+        'positions': np.zeros((bone_count, 3), dtype=np.int64),
+    }
+
+# packs a batch of keyframes (AnimationBuffer) in the quantized format, state (see new_quantize_state) carries the
+#   previous poses over to the next batch, bits and steps per bone index as stored in the header
+def pack_quantized_keyframes(anim, index_of, bits, steps, state):
+    bones, cfs, masks, counts = binary_poses(anim, index_of)
+    dropped, rots, positions = quantize_cfs(cfs, bits[bones], steps[bones])
+
+    # the previous pose of every pose: the one before it in this batch (same bone) or the one in the state
+    order = np.argsort(bones, kind='stable')
+    first = np.ones(len(bones), dtype=bool)
+    first[1:] = bones[order][1:] != bones[order][:-1]
+    prev = np.empty(len(bones), dtype=np.int64)
+    prev[order[~first]] = order[np.flatnonzero(~first) - 1]
+    from_state = order[first]
+    prev_dropped = np.empty(len(bones), dtype=np.int64)
+    prev_rots = np.empty_like(rots)
+    prev_positions = np.empty_like(positions)
+    prev_dropped[from_state] = state['dropped'][bones[from_state]]
+    prev_rots[from_state] = state['rots'][bones[from_state]]
+    prev_positions[from_state] = state['positions'][bones[from_state]]
+    chained = order[~first]
+    prev_dropped[chained] = dropped[prev[chained]]
+    prev_rots[chained] = rots[prev[chained]]
+    prev_positions[chained] = positions[prev[chained]]
+
+    rot_deltas = np.where((prev_dropped == dropped)[:, None], rots - prev_rots, rots).astype(np.int16)
+    position_deltas = (positions - prev_positions).astype(np.int32)
+
+    last = order[np.r_[first[1:], True]]
+    state['dropped'][bones[last]] = dropped[last]
+    state['rots'][bones[last]] = rots[last]
+    state['positions'][bones[last]] = positions[last]
+
+    out = bytearray()
+    offset = 0
+    for t, mask, count in zip(anim.times.tolist(), masks, counts.tolist()):
+        end = offset + count
+        out += struct.pack('<f', t) + mask.tobytes()
+        out += dropped[offset:end].tobytes() + rot_deltas[offset:end].astype('<i2').tobytes() + position_deltas[offset:end].astype('<i4').tobytes()
+        offset = end
+
+    return bytes(out)
+
+# packs an animation into the quantized binary format (see the top of this file)
+def pack_quantized_animation(anim, precision=None):
+    anim = as_animation_buffer(anim)
+    names = animation_bone_names(anim)
+    index_of = {name: i for i, name in enumerate(names)}
+    bits, steps = quantize_precision(names, precision)
+    return (pack_quantized_header(anim.duration, names, len(anim), precision)
+        + pack_quantized_keyframes(anim, index_of, bits, steps, new_quantize_state(len(names))))
+
+# reference decoder for pack_quantized_animation, returns an AnimationBuffer
+def unpack_quantized_animation(data):
+    magic, version, flags, duration = struct.unpack_from('<4sBBf', data, 0)
+    offset = 10
+
+    bone_count, = struct.unpack_from('<H', data, offset)
+    offset += 2
+    names = []
+    bits = np.empty(bone_count, dtype=np.uint8)
+    steps = np.empty(bone_count, dtype=np.float32)
+    for i in range(bone_count):
+        name_len = data[offset]
+        names.append(data[offset + 1:offset + 1 + name_len].decode('utf-8'))
+        bits[i], steps[i] = struct.unpack_from('<Bf', data, offset + 1 + name_len)
+        offset += 1 + name_len + 5
+
+    kf_count, = struct.unpack_from('<I', data, offset)
+    offset += 4
+    mask_len = (bone_count + 7) // 8
+    state = new_quantize_state(bone_count)
+
+    times = np.empty(kf_count)
+    present = np.zeros((kf_count, bone_count), dtype=bool)
+    cfs = np.empty((kf_count, bone_count, 12))
+    cfs[:] = identity_cf
+    for n in range(kf_count):
+        times[n], = struct.unpack_from('<f', data, offset)
+        present[n] = np.unpackbits(np.frombuffer(data, dtype=np.uint8, count=mask_len, offset=offset + 4), count=bone_count, bitorder='little')
+        offset += 4 + mask_len
+
+        indices = np.flatnonzero(present[n])
+        count = len(indices)
+        dropped = np.frombuffer(data, dtype=np.uint8, count=count, offset=offset).astype(np.int64)
+        rot_deltas = np.frombuffer(data, dtype='<i2', count=count * 3, offset=offset + count).reshape(-1, 3)
+        position_deltas = np.frombuffer(data, dtype='<i4', count=count * 3, offset=offset + count * 7).reshape(-1, 3)
+        offset += count * 19
+
+        # undo the deltas with the same wrap around as the encoder
+        same = (state['dropped'][indices] == dropped)[:, None]
+        rots = np.where(same, (state['rots'][indices] + rot_deltas).astype(np.int16), rot_deltas).astype(np.int64)
+        positions = (state['positions'][indices] + position_deltas).astype(np.int32).astype(np.int64)
+        state['dropped'][indices] = dropped
+        state['rots'][indices] = rots
+        state['positions'][indices] = positions
+
+        cfs[n, indices] = dequantize_cfs(dropped, rots, positions, bits[indices], steps[indices])
+
+    return AnimationBuffer(names, times, cfs, duration, present)
+
+# largest position (studs) and rotation (degrees) difference between the poses of two animations with the same keyframes,
+#   e.g. an animation and its decoded quantized version, poses missing on one side count as identity
+# returns {'position', 'angle', 'bones': {bone: {'position', 'angle'}}}
+def compare_animations(reference, decoded):
+    reference = as_animation_buffer(reference)
+    decoded = as_animation_buffer(decoded)
+    if len(reference) != len(decoded):
+        raise ValueError('The animations have different keyframes ({:d} and {:d}).'.format(len(reference), len(decoded)))
+    names = list(dict.fromkeys(animation_bone_names(reference) + animation_bone_names(decoded)))
+    index_of = {name: i for i, name in enumerate(names)}
+    def collect_cfs(anim):
+        cfs = np.empty((len(anim), len(names), 12))
+        cfs[:] = identity_cf
+        for b, name in enumerate(anim.names):
+            if name in index_of:
+                cfs[:, index_of[name]] = np.where(anim.present[:, b, None], anim.cfs[:, b], identity_cf)
+        return cfs
+    cfs0 = collect_cfs(reference)
+    cfs1 = collect_cfs(decoded)
+
+    positions = np.linalg.norm(cfs0[..., 0:3] - cfs1[..., 0:3], axis=-1).max(axis=0, initial=0)
+    quats0 = mats_to_quats(cfs0[..., 3:12].reshape(cfs0.shape[:-1] + (3, 3)))
+    quats1 = mats_to_quats(cfs1[..., 3:12].reshape(cfs1.shape[:-1] + (3, 3)))
+    angles = np.degrees(quat_angles(quats0, quats1)).max(axis=0, initial=0)
+    return {
+        'position': float(positions.max(initial=0)),
+        'angle': float(angles.max(initial=0)),
+        'bones': {name: {'position': float(position), 'angle': float(angle)} for name, position, angle in zip(names, positions, angles)},
+    }
+
+# encodes an animation for the Roblox plugin (base64 of the zlib compressed json or binary data)
+# precision: quantization rules of the QUANTIZED format, see quantize_precision
+def encode_animation(anim, export_format='JSON', precision=None):
+    with timed('encode'):
+        anim = as_animation_buffer(anim)
+        if export_format == 'JSON':
+            encoded = json.dumps(anim.to_dict(), separators=(',',':')).encode()
+        elif export_format == 'QUANTIZED':
+            encoded = pack_quantized_animation(anim, precision)
+        else:
+            encoded = pack_animation(anim, export_format == 'BINARY16')
+    with timed('compress'):
+        return (base64.b64encode(zlib.compress(encoded, quantized_zlib_level if export_format == 'QUANTIZED' else 9))).decode('utf-8')
+
+# yields the (unencoded) payload of an animation piece by piece, json text or binary data
+# kf_batches is any iterable of keyframe batches (AnimationBuffers), for the binary format the bone names and
+#   keyframe count have to be known up front
+def iter_payload_chunks(duration, names, kf_count, kf_batches, export_format='JSON', precision=None):
+    if export_format == 'JSON':
+        yield '{"t":' + json.dumps(duration) + ',"kfs":['
+        first = True
+        for kfs in kf_batches:
+            if len(kfs):
+                with timed('encode'):
+                    chunk = ('' if first else ',') + json.dumps(kfs.to_dict()['kfs'], separators=(',',':'))[1:-1]
+                yield chunk
+                first = False
+        yield ']}'
+    elif export_format == 'QUANTIZED':
+        index_of = {name: i for i, name in enumerate(names)}
+        bits, steps = quantize_precision(names, precision)
+        state = new_quantize_state(len(names))
+        yield pack_quantized_header(duration, names, kf_count, precision)
+        for kfs in kf_batches:
+            with timed('encode'):
+                chunk = pack_quantized_keyframes(kfs, index_of, bits, steps, state)
+            yield chunk
+    else:
+        half_positions = export_format == 'BINARY16'
+        index_of = {name: i for i, name in enumerate(names)}
+        yield pack_header(duration, names, kf_count, half_positions)
+        for kfs in kf_batches:
+            with timed('encode'):
+                chunk = pack_keyframes(kfs, index_of, half_positions)
+            yield chunk
+
+# incremental encode_animation, compresses payload chunks as they come and yields the base64 text
+def iter_encoded_chunks(payload_chunks, level=9):
+    compressor = zlib.compressobj(level)
+    pending = b''
+    for chunk in payload_chunks:
+        with timed('compress'):
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            pending += compressor.compress(chunk)
+
+            # base64 works on 3 byte groups, keep the rest for the next chunk
+            cut = len(pending) - len(pending) % 3
+            text = base64.b64encode(pending[:cut]).decode('utf-8')
+            pending = pending[cut:]
+        if text:
+            yield text
+
+    with timed('compress'):
+        pending += compressor.flush()
+        text = base64.b64encode(pending).decode('utf-8')
+    yield text
+
+# writes encoded text chunks to a file, or to numbered segment files (name.001.txt, ...) of at most
+#   segment_size characters that have to be concatenated again by the importer, returns the written paths
+def write_encoded_chunks(filepath, text_chunks, segment_size=0):
+    if not segment_size:
+        with open(filepath, 'w') as f:
+            for text in text_chunks:
+                with timed('file_io'):
+                    f.write(text)
+        return [filepath]
+
+    root, ext = os.path.splitext(filepath)
+    paths = []
+    f = None
+    space = 0
+    try:
+        for text in text_chunks:
+            while text:
+                with timed('file_io'):
+                    if space == 0:
+                        if f:
+                            f.close()
+                        paths.append('{}.{:03d}{}'.format(root, len(paths) + 1, ext or '.txt'))
+                        f = open(paths[-1], 'w')
+                        space = segment_size
+                    f.write(text[:space])
+                written = min(space, len(text))
+                text = text[written:]
+                space -= written
+    finally:
+        if f:
+            f.close()
+    return paths
+
+# bakes batches of sampled pose matrices (see bake), yields an AnimationBuffer per batch
+def iter_bake(plan, pose_batches, frames, frame_start, fps):
+    prepared = load_export_plan(plan)
+    offset = 0
+    for pose_mats in pose_batches:
+        with timed('matrix_math'):
+            cfs = mats_to_cfs(solve_animation_states(np.asarray(pose_mats, dtype=np.float64), prepared))
+            times = [(i - frame_start) / fps for i in frames[offset:offset + len(cfs)]]
+            offset += len(cfs)
+        with timed('build_keyframes'):
+            kfs = build_animation(prepared['names'], cfs, times, 0)
+        yield kfs
+
+# bakes batches of sampled pose matrices straight into (segmented) files, without ever holding the
+#   whole animation, returns the written paths
+def stream_bake(filepath, plan, pose_batches, frames, frame_start, frame_end, fps, export_format='JSON', segment_size=0, precision=None):
+    kf_batches = iter_bake(plan, pose_batches, frames, frame_start, fps)
+    payload = iter_payload_chunks((frame_end - frame_start) / fps, plan['bones'][:plan['count']], len(frames), kf_batches, export_format, precision)
+    return write_encoded_chunks(filepath, iter_encoded_chunks(payload, quantized_zlib_level if export_format == 'QUANTIZED' else 9), segment_size)
+
+# reverses encode_animation (any format), returns an AnimationBuffer
+def decode_animation(text):
+    data = zlib.decompress(base64.b64decode(text))
+    if data[:len(binary_magic)] == binary_magic:
+        return unpack_animation(data)
+    return as_animation_buffer(json.loads(data.decode('utf-8')))
+
+# splits the sampled frames of several bakes over shard_count workers, returns per worker a list of
+#   (bake index, frames) shards, every shard is a contiguous run of the frames of one bake
+# bakes are split into as few shards as needed to keep the workers evenly loaded, but no shard (of a bake that
+#   long) and no worker gets less than min_shard_frames frames (fewer workers are used instead)
+def shard_frames(frame_lists, shard_count, min_shard_frames=1):
+    frame_lists = [list(frames) for frames in frame_lists]
+    shard_count = max(shard_count, 1)
+    min_shard_frames = max(min_shard_frames, 1)
+    total = sum(len(frames) for frames in frame_lists)
+    target = max(math.ceil(total / shard_count), 1)
+
+    shards = []
+    for n, frames in enumerate(frame_lists):
+        pieces = max(min(math.ceil(len(frames) / target), len(frames) // min_shard_frames), 1)
+        bounds = np.linspace(0, len(frames), pieces + 1).round().astype(int)
+        shards += [(n, frames[lo:hi]) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+    # largest shards first, each to the least loaded worker
+    worker_count = min(shard_count, len(shards), max(total // min_shard_frames, 1))
+    workers = [[] for i in range(worker_count)]
+    loads = [0] * len(workers)
+    for shard in sorted(shards, key=lambda shard: -len(shard[1])):
+        i = loads.index(min(loads))
+        workers[i].append(shard)
+        loads[i] += len(shard[1])
+    return workers
+
+# merges animations baked from disjoint frame shards of one animation (see shard_frames), in timestamp order
+def merge_animations(parts):
+    parts = [as_animation_buffer(part) for part in parts]
+    names = list(dict.fromkeys(name for part in parts for name in part.names))
+    index_of = {name: i for i, name in enumerate(names)}
+    times = np.concatenate([part.times for part in parts])
+    cfs = np.empty((len(times), len(names), 12))
+    cfs[:] = identity_cf
+    present = np.zeros(cfs.shape[:2], dtype=bool)
+    offset = 0
+    for part in parts:
+        columns = [index_of[name] for name in part.names]
+        cfs[offset:offset + len(part), columns] = part.cfs
+        present[offset:offset + len(part), columns] = part.present
+        offset += len(part)
+
+    order = np.argsort(times, kind='stable')
+    return AnimationBuffer(names, times[order], cfs[order], max(part.duration for part in parts), present[order])
+
+# writes bake samples to a .npz file
+def save_samples(filepath, plan, pose_mats, frames, frame_start, frame_end, fps):
+    np.savez_compressed(filepath,
+        plan=json.dumps(plan, separators=(',',':')),
+        pose_mats=np.asarray(pose_mats, dtype=np.float32),
+        frames=np.asarray(frames, dtype=np.int64),
+        frame_range=np.array([frame_start, frame_end], dtype=np.int64),
+        fps=np.float64(fps))
+
+# reads bake samples written by save_samples, returns the keyword arguments of bake
+def load_samples(filepath):
+    with np.load(filepath) as data:
+        return {
+            'plan': json.loads(str(data['plan'])),
+            'pose_mats': data['pose_mats'],
+            'frames': data['frames'].tolist(),
+            'frame_start': int(data['frame_range'][0]),
+            'frame_end': int(data['frame_range'][1]),
+            'fps': float(data['fps']),
+        }
+
+## KEYFRAME SEQUENCES ##
+
+# the pose tree of a rig definition (the 'rig' of the rig metadata), depth-first with children in definition order
+# returns {'bones' (bone = joint names, the names of the animation poses), 'names' (part names, the Pose names), 'parents' (index, -1 for the root)}
+def pose_tree(rig):
+    bones = []
+    names = []
+    parents = []
+    stack = [(rig, -1)]
+    while stack:
+        rigsubdef, parent = stack.pop()
+        bones.append(rigsubdef['jname'])
+        names.append(rigsubdef.get('pname', rigsubdef['jname']))
+        parents.append(parent)
+        stack.extend((child, len(bones) - 1) for child in reversed(rigsubdef['children']))
+    return {'bones': bones, 'names': names, 'parents': parents}
+
+# indices (tree order) of the Poses written for a keyframe: its stored poses and all of their ancestors
+# raises ValueError for poses of bones that are not in the tree
+def keyframe_pose_indices(kf, index_of, parents):
+    needed = set()
+    for bone in kf['kf']:
+        if bone not in index_of:
+            raise ValueError('Bone "{}" is not part of the rig.'.format(bone))
+        i = index_of[bone]
+        while i >= 0 and i not in needed:
+            needed.add(i)
+            i = parents[i]
+    return sorted(needed)
+
+# stores the interpolated pose of animated ancestors missing on keyframes with a stored descendant pose, for reduced
+#   animations (see build_animation) whose missing poses are interpolated, so that the placeholder Poses written for
+#   them (see iter_rbxmx_chunks) don't turn into identity keys, before the first/after the last pose the pose is held
+def fill_pose_parents(anim, tree):
+    anim = as_animation_buffer(anim)
+    index_of = {bone: i for i, bone in enumerate(tree['bones'])}
+    for b in np.flatnonzero(np.any(anim.present, axis=0)):
+        if anim.names[b] not in index_of:
+            raise ValueError('Bone "{}" is not part of the rig.'.format(anim.names[b]))
+
+    # the tree poses written for every keyframe, the stored ones and their ancestors (children come after their parents)
+    columns = [index_of.get(name) for name in anim.names]
+    needed = np.zeros((len(anim), len(tree['bones'])), dtype=bool)
+    for b, i in enumerate(columns):
+        if i is not None:
+            needed[:, i] |= anim.present[:, b]
+    for i in reversed(range(len(tree['bones']))):
+        if tree['parents'][i] >= 0:
+            needed[:, tree['parents'][i]] |= needed[:, i]
+
+    cfs = anim.cfs.astype(np.float64)
+    present = anim.present.copy()
+    for b, i in enumerate(columns):
+        keys = np.flatnonzero(anim.present[:, b])
+        if i is None or len(keys) == 0:
+            continue
+        times = anim.times[keys]
+        for n in np.flatnonzero(needed[:, i] & ~anim.present[:, b]):
+            t = anim.times[n]
+            hi = min(np.searchsorted(times, t), len(times) - 1)
+            lo = max(hi - 1, 0)
+            alpha = np.clip((t - times[lo]) / (times[hi] - times[lo]) if hi > lo else 0, 0, 1)
+            cf0, cf1 = cfs[keys[lo], b], cfs[keys[hi], b]
+            quat0, quat1 = mats_to_quats(np.array([cf0[3:12], cf1[3:12]]).reshape(2, 3, 3))
+            rot = quats_to_mats(slerp_quats(quat0, quat1, [alpha]))[0]
+            cfs[n, b] = np.concatenate((cf0[0:3] + (cf1[0:3] - cf0[0:3]) * alpha, rot.ravel()))
+            present[n, b] = True
+    return AnimationBuffer(anim.names, anim.times, cfs, anim.duration, present)
+
+# yields the .rbxmx (Roblox XML model) text of a KeyframeSequence piece by piece, one piece per keyframe batch
+# kf_batches is any iterable of keyframe batches (AnimationBuffers), the Poses of every keyframe are nested like the parts of the rig,
+#   identity poses are not stored in the keyframes (see build_animation) and only written as placeholders (identity
+#   CFrame, Weight 0) for ancestors of stored poses
+def iter_rbxmx_chunks(kf_batches, tree, name, loop=False, priority=animation_priorities['Action']):
+    index_of = {bone: i for i, bone in enumerate(tree['bones'])}
+    referents = iter(range(1, 1 << 62))
+    yield ('<roblox xmlns:xmime="http://www.w3.org/2005/05/xmlmime" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
+        ' xsi:noNamespaceSchemaLocation="http://www.roblox.com/roblox.xsd" version="4">\n<External>null</External>\n<External>nil</External>\n'
+        '<Item class="KeyframeSequence" referent="RBX0"><Properties><bool name="Loop">{}</bool><string name="Name">{}</string>'
+        '<token name="Priority">{:d}</token></Properties>\n').format('true' if loop else 'false', xml_escape(name), priority)
+
+    for kfs in kf_batches:
+        with timed('encode'):
+            lines = []
+            for kf in kfs['kfs']:
+                lines.append('<Item class="Keyframe" referent="RBX{:X}"><Properties><string name="Name">Keyframe</string>'
+                    '<float name="Time">{:.9g}</float></Properties>\n'.format(next(referents), kf['t']))
+                open_poses = []
+                for i in keyframe_pose_indices(kf, index_of, tree['parents']):
+                    while open_poses and open_poses[-1] != tree['parents'][i]:
+                        open_poses.pop()
+                        lines.append('</Item>\n')
+                    bone = tree['bones'][i]
+                    cf = kf['kf'].get(bone, identity_cf)
+                    lines.append('<Item class="Pose" referent="RBX{:X}"><Properties><CoordinateFrame name="CFrame">{}</CoordinateFrame>'
+                        '<token name="EasingDirection">0</token><token name="EasingStyle">0</token><string name="Name">{}</string>'
+                        '<float name="Weight">{:d}</float></Properties>\n'.format(next(referents),
+                        ''.join('<{0}>{1:.9g}</{0}>'.format(tag, x) for tag, x in zip(rbxmx_cframe_tags, cf)),
+                        xml_escape(tree['names'][i]), bone in kf['kf']))
+                    open_poses.append(i)
+                lines.append('</Item>\n' * (len(open_poses) + 1))
+            chunk = ''.join(lines)
+        yield chunk
+    yield '</Item>\n</roblox>\n'
+
+# roblox binary format helpers: ints/floats are stored big-endian with their bytes interleaved (all first bytes, then all
+#   second bytes, ...), ints zigzag encoded, floats with the sign moved to the lowest bit, referents as differences
+def rbxm_interleave(words):
+    return np.asarray(words, dtype='>u4').view(np.uint8).reshape(-1, 4).T.tobytes()
+
+def rbxm_deinterleave(data, count):
+    return np.frombuffer(data, np.uint8, count * 4).reshape(4, count).T.copy().view('>u4').ravel().astype(np.int64)
+
+def rbxm_pack_ints(values):
+    values = np.asarray(values, dtype=np.int64)
+    return rbxm_interleave(((values << 1) ^ (values >> 31)) & 0xFFFFFFFF)
+
+def rbxm_unpack_ints(data, count):
+    words = rbxm_deinterleave(data, count)
+    return (words >> 1) ^ -(words & 1)
+
+def rbxm_pack_floats(values):
+    bits = np.asarray(values, dtype='<f4').view('<u4').astype(np.int64)
+    return rbxm_interleave(((bits << 1) | (bits >> 31)) & 0xFFFFFFFF)
+
+def rbxm_unpack_floats(data, count):
+    bits = rbxm_deinterleave(data, count)
+    return ((bits >> 1) | ((bits & 1) << 31)).astype('<u4').view('<f4').astype(np.float64)
+
+def rbxm_pack_string(text):
+    data = text.encode('utf-8')
+    return struct.pack('<I', len(data)) + data
+
+def rbxm_chunk(name, data):
+    return name + struct.pack('<III', 0, len(data), 0) + data
+
+# packs a KeyframeSequence as a .rbxm (Roblox binary model) file, same contents as iter_rbxmx_chunks
+# the binary format stores every property of all instances of a class together, so it needs all keyframes up front,
+#   the chunks are written uncompressed
+def pack_rbxm(kfs, tree, name, loop=False, priority=animation_priorities['Action']):
+    index_of = {bone: i for i, bone in enumerate(tree['bones'])}
+    parents = [-1]
+    times = []
+    keyframe_refs = []
+    pose_refs = []
+    pose_cfs = []
+    pose_names = []
+    pose_weights = []
+    with timed('encode'):
+        for kf in kfs:
+            keyframe_refs.append(len(parents))
+            times.append(kf['t'])
+            parents.append(0)
+            pose_ref_of = {}
+            for i in keyframe_pose_indices(kf, index_of, tree['parents']):
+                bone = tree['bones'][i]
+                pose_ref_of[i] = len(parents)
+                pose_refs.append(len(parents))
+                parents.append(pose_ref_of.get(tree['parents'][i], keyframe_refs[-1]))
+                pose_cfs.append(kf['kf'].get(bone, identity_cf))
+                pose_names.append(tree['names'][i])
+                pose_weights.append(1 if bone in kf['kf'] else 0)
+
+        classes = [
+            ('Keyframe', keyframe_refs, [
+                ('Name', 0x01, b''.join(rbxm_pack_string('Keyframe') for ref in keyframe_refs)),
+                ('Time', 0x04, rbxm_pack_floats(times)),
+            ]),
+            ('KeyframeSequence', [0], [
+                ('Loop', 0x02, bytes([loop])),
+                ('Name', 0x01, rbxm_pack_string(name)),
+                ('Priority', 0x12, rbxm_interleave([priority])),
+            ]),
+            ('Pose', pose_refs, [
+                ('CFrame', 0x10, rbxm_pack_cframes(pose_cfs)),
+                ('EasingDirection', 0x12, rbxm_interleave(np.zeros(len(pose_refs)))),
+                ('EasingStyle', 0x12, rbxm_interleave(np.zeros(len(pose_refs)))),
+                ('Name', 0x01, b''.join(rbxm_pack_string(pose_name) for pose_name in pose_names)),
+                ('Weight', 0x04, rbxm_pack_floats(pose_weights)),
+            ]),
+        ]
+
+        chunks = [rbxm_magic + struct.pack('<Hii', 0, len(classes), len(parents)) + bytes(8)]
+        for class_id, (class_name, refs, props) in enumerate(classes):
+            chunks.append(rbxm_chunk(b'INST', struct.pack('<I', class_id) + rbxm_pack_string(class_name) + struct.pack('<BI', 0, len(refs))
+                + rbxm_pack_ints(np.diff(refs, prepend=0))))
+        for class_id, (class_name, refs, props) in enumerate(classes):
+            for prop_name, type_id, values in props:
+                chunks.append(rbxm_chunk(b'PROP', struct.pack('<I', class_id) + rbxm_pack_string(prop_name) + bytes([type_id]) + values))
+        refs = np.arange(len(parents))
+        chunks.append(rbxm_chunk(b'PRNT', struct.pack('<BI', 0, len(parents)) + rbxm_pack_ints(np.diff(refs, prepend=0))
+            + rbxm_pack_ints(np.diff(parents, prepend=0))))
+        chunks.append(rbxm_chunk(b'END\0', b'</roblox>'))
+        return b''.join(chunks)
+
+# CFrame property values: per value a rotation id (0 = full matrix) and 9 x f32 rotation, then the positions as
+#   interleaved x, y and z float arrays
+def rbxm_pack_cframes(cfs):
+    cfs = np.array(cfs, dtype='<f4').reshape(-1, 12)
+    rotations = np.zeros(len(cfs), dtype=[('id', 'u1'), ('rot', '<f4', 9)])
+    rotations['rot'] = cfs[:, 3:12]
+    return rotations.tobytes() + b''.join(rbxm_pack_floats(cfs[:, axis]) for axis in range(3))
+
+def rbxm_unpack_cframes(data, count):
+    rotations = np.frombuffer(data, dtype=[('id', 'u1'), ('rot', '<f4', 9)], count=count)
+    if np.any(rotations['id']):
+        raise ValueError('Only full CFrame rotations are supported.')
+    offset = rotations.nbytes
+    positions = [rbxm_unpack_floats(data[offset + axis * count * 4:], count) for axis in range(3)]
+    return np.concatenate((np.stack(positions, axis=-1), rotations['rot'].astype(np.float64)), axis=-1).tolist()
+
+# writes a KeyframeSequence to a .rbxmx (streamed, see iter_rbxmx_chunks) or .rbxm (see pack_rbxm) file, by extension
+def write_keyframe_sequence(filepath, kf_batches, tree, name, loop=False, priority=animation_priorities['Action']):
+    if filepath.lower().endswith('.rbxm'):
+        data = pack_rbxm([kf for kfs in kf_batches for kf in kfs['kfs']], tree, name, loop, priority)
+        with timed('file_io'):
+            with open(filepath, 'wb') as f:
+                f.write(data)
+        return
+
+    with open(filepath, 'w', encoding='utf-8') as f:
+        for text in iter_rbxmx_chunks(kf_batches, tree, name, loop, priority):
+            with timed('file_io'):
+                f.write(text)
+
+# instances of a .rbxmx file, [(class name, {property: value}, parent index or -1)] in file order
+# reads the properties written by iter_rbxmx_chunks (bool, string, token, float and CoordinateFrame values)
+def parse_rbxmx(data):
+    instances = []
+    def visit(item, parent):
+        props = {}
+        properties = item.find('Properties')
+        for prop in (properties if properties is not None else []):
+            if prop.tag == 'CoordinateFrame':
+                props[prop.get('name')] = [float(prop.find(tag).text) for tag in rbxmx_cframe_tags]
+            elif prop.tag == 'bool':
+                props[prop.get('name')] = prop.text == 'true'
+            elif prop.tag in ('float', 'token', 'int'):
+                props[prop.get('name')] = float(prop.text) if prop.tag == 'float' else int(prop.text)
+            else:
+                props[prop.get('name')] = prop.text or ''
+        instances.append((item.get('class'), props, parent))
+        parent = len(instances) - 1
+        for child in item.findall('Item'):
+            visit(child, parent)
+    for item in ElementTree.fromstring(data).findall('Item'):
+        visit(item, -1)
+    return instances
+
+# instances of a (uncompressed) .rbxm file, same as parse_rbxmx
+def parse_rbxm(data):
+    if data[:len(rbxm_magic)] != rbxm_magic:
+        raise ValueError('Not a Roblox binary model file.')
+    offset = len(rbxm_magic) + 18
+    class_names = {}
+    class_refs = {}
+    props = {}
+    parent_of = {}
+    while offset < len(data):
+        chunk_name = data[offset:offset + 4]
+        compressed, size = struct.unpack_from('<II', data, offset + 4)
+        if compressed:
+            raise ValueError('Compressed chunks are not supported.')
+        chunk = data[offset + 16:offset + 16 + size]
+        offset += 16 + size
+
+        if chunk_name == b'INST':
+            class_id, name_length = struct.unpack_from('<II', chunk)
+            class_names[class_id] = chunk[8:8 + name_length].decode('utf-8')
+            count, = struct.unpack_from('<I', chunk, 9 + name_length)
+            class_refs[class_id] = np.cumsum(rbxm_unpack_ints(chunk[13 + name_length:], count)).tolist()
+        elif chunk_name == b'PROP':
+            class_id, name_length = struct.unpack_from('<II', chunk)
+            prop_name = chunk[8:8 + name_length].decode('utf-8')
+            type_id = chunk[8 + name_length]
+            values = chunk[9 + name_length:]
+            refs = class_refs[class_id]
+            if type_id == 0x01:
+                decoded = []
+                for ref in refs:
+                    length, = struct.unpack_from('<I', values)
+                    decoded.append(values[4:4 + length].decode('utf-8'))
+                    values = values[4 + length:]
+            elif type_id == 0x02:
+                decoded = [bool(value) for value in values[:len(refs)]]
+            elif type_id == 0x04:
+                decoded = rbxm_unpack_floats(values, len(refs)).tolist()
+            elif type_id == 0x12:
+                decoded = rbxm_deinterleave(values, len(refs)).tolist()
+            elif type_id == 0x10:
+                decoded = rbxm_unpack_cframes(values, len(refs))
+            else:
+                continue
+            for ref, value in zip(refs, decoded):
+                props.setdefault(ref, {})[prop_name] = value
+        elif chunk_name == b'PRNT':
+            count, = struct.unpack_from('<I', chunk, 1)
+            children = np.cumsum(rbxm_unpack_ints(chunk[5:], count))
+            parents = np.cumsum(rbxm_unpack_ints(chunk[5 + count * 4:], count))
+            parent_of.update(zip(children.tolist(), parents.tolist()))
+        elif chunk_name == b'END\0':
+            break
+
+    refs = sorted(ref for class_refs_ in class_refs.values() for ref in class_refs_)
+    class_of = {ref: class_names[class_id] for class_id, class_refs_ in class_refs.items() for ref in class_refs_}
+    index_of = {ref: i for i, ref in enumerate(refs)}
+    return [(class_of[ref], props.get(ref, {}), index_of.get(parent_of.get(ref, -1), -1)) for ref in refs]
+
+# reads the first KeyframeSequence of a .rbxmx/.rbxm file back into an animation, for checking exported files
+# returns {'name', 'loop', 'priority', 't' (time of the last keyframe), 'kfs'}, poses are named after their Pose (part
+#   names, see pose_tree) and placeholder Poses (Weight 0) are left out
+def read_keyframe_sequence(filepath):
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    instances = parse_rbxm(data) if data[:len(rbxm_magic)] == rbxm_magic else parse_rbxmx(data)
+
+    sequence = next((i for i, (class_name, props, parent) in enumerate(instances) if class_name == 'KeyframeSequence'), None)
+    if sequence is None:
+        raise ValueError('No KeyframeSequence found.')
+    keyframe_of = {}
+    kfs = []
+    for i, (class_name, props, parent) in enumerate(instances):
+        if class_name == 'Keyframe' and parent == sequence:
+            keyframe_of[i] = len(kfs)
+            kfs.append({'t': props.get('Time', 0.), 'kf': {}})
+        elif class_name == 'Pose' and parent in keyframe_of:
+            keyframe_of[i] = keyframe_of[parent]
+            if props.get('Weight', 1):
+                kfs[keyframe_of[i]]['kf'][props.get('Name', '')] = props.get('CFrame', identity_cf)
+
+    kfs.sort(key=lambda kf: kf['t'])
+    props = instances[sequence][1]
+    return {
+        'name': props.get('Name', ''),
+        'loop': props.get('Loop', False),
+        'priority': props.get('Priority', animation_priorities['Action']),
+        't': kfs[-1]['t'] if kfs else 0.,
+        'kfs': kfs,
+    }
+
+## PROFILING ##
+
+# times a scope, calls and wall time add up per scope name in timings (clear it to start over)
+# scopes are not meant to be nested, so together they tell where the time went (frame evaluation, math, encoding, I/O, ...)
+@contextlib.contextmanager
+def timed(scope):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry = timings.setdefault(scope, [0, 0.])
+        entry[0] += 1
+        entry[1] += time.perf_counter() - start
+
+# report of the scopes timed since timings was cleared, for a run that took seconds in total
+# {'seconds', 'scopes': {scope: {'calls', 'seconds', 'share'}} (slowest first, 'other' is the untimed rest),
+#  'functions': the slowest functions by cumulative time if a cProfile.Profile of the run is given}
+def get_timings_report(seconds, profiler=None, top=25):
+    scopes = sorted(timings.items(), key=lambda item: -item[1][1])
+    other = max(seconds - sum(scope_seconds for calls, scope_seconds in timings.values()), 0)
+    report = {
+        'seconds': seconds,
+        'scopes': {scope: {'calls': calls, 'seconds': scope_seconds, 'share': scope_seconds / seconds if seconds else 0}
+            for scope, (calls, scope_seconds) in scopes + [('other', (1, other))]},
+    }
+
+    if profiler is not None:
+        stats = pstats.Stats(profiler).stats
+        report['functions'] = [{
+            'function': '{}:{:d}({})'.format(os.path.basename(filename), line, name),
+            'calls': calls,
+            'own_seconds': own_seconds,
+            'seconds': cumulative_seconds,
+        } for (filename, line, name), (primitive_calls, calls, own_seconds, cumulative_seconds, callers)
+            in sorted(stats.items(), key=lambda item: -item[1][3])[:top]]
+    return report
+
+## RIG LAYOUT ##
+
+# Blender's edit bone orientation (vec_roll_to_mat3), bone directions and rolls -> bone rotation matrices, (n x 3), (n) -> (n x 3 x 3)
+# the columns are the bone x, y (= direction) and z axes
+def bone_roll_mats(dirs, rolls):
+    dirs = dirs / np.linalg.norm(dirs, axis=-1, keepdims=True)
+    x, y, z = dirs[:, 0], dirs[:, 1], dirs[:, 2]
+
+    # rotation from +y onto the direction, with a fallback near -y
+    theta = 1 + y
+    theta_alt = x * x + z * z
+    regular = (theta > 6.1e-3) | (theta_alt > 2.5e-4 ** 2)
+    theta = np.where(theta > 6.1e-3, theta, theta_alt * .5 + theta_alt * theta_alt * .125)
+    theta = np.where(regular, theta, 1)
+    bases = np.stack((
+        np.stack((1 - x * x / theta, x, -x * z / theta), axis=-1),
+        np.stack((-x, y, -z), axis=-1),
+        np.stack((-x * z / theta, z, 1 - z * z / theta), axis=-1),
+    ), axis=-2)
+    bases[~regular] = np.diag([-1., -1., 1.])
+
+    # roll around the direction
+    c, s = np.cos(rolls), np.sin(rolls)
+    rolled = c[:, None, None] * np.identity(3) + (1 - c)[:, None, None] * dirs[:, :, None] * dirs[:, None, :]
+    rolled += s[:, None, None] * np.stack((
+        np.stack((np.zeros_like(x), -z, y), axis=-1),
+        np.stack((z, np.zeros_like(x), -x), axis=-1),
+        np.stack((-y, x, np.zeros_like(x)), axis=-1),
+    ), axis=-2)
+    return rolled @ bases
+
+# Blender's EditBone.align_roll, rolls that point the bone z axes towards the given axes, (n x 3), (n x 3) -> (n)
+# bones without length or pointing along their axis get no roll
+def align_bone_rolls(dirs, axes):
+    lengths = np.linalg.norm(dirs, axis=-1)
+    dirs = dirs / np.maximum(lengths, 1e-30)[:, None]
+    dots = np.einsum('ij,ij->i', axes, dirs)
+    z_axes = bone_roll_mats(np.where(lengths[:, None] > 0, dirs, [0, 1, 0]), np.zeros(len(dirs)))[:, :, 2]
+    projected = axes - dirs * dots[:, None]
+    crossed = np.cross(z_axes, projected)
+    rolls = np.arctan2(np.linalg.norm(crossed, axis=-1), np.einsum('ij,ij->i', z_axes, projected))
+    rolls = np.where(np.einsum('ij,ij->i', crossed, dirs) < 0, -rolls, rolls)
+    return np.where((lengths <= 1.1920929e-07) | (np.abs(dots) >= 1 - 1.1920929e-07), 0, rolls)
+
+# lays out the bones of a rig definition (the 'rig' of the rig metadata) without Blender, the bones are
+#   listed parents first (depth-first, children in definition order), to_blender is the y-up -> z-up matrix
+# returns {'names', 'parents' (index, -1 for the root), 'aux', and (bones x ...) arrays 'heads', 'tails', 'rolls',
+#   'matrices' (edit bone matrices), 'transforms', 'transforms0', 'transforms1', 'nicetransforms'}, the nicetransform
+#   maps the C0/C1 joint matrix onto the bone matrix, which is oriented in a more friendly way unless rigging_type is 'RAW'
+# 'LOCAL_AXIS_EXTEND' extends bones like 'LOCAL_YAXIS_EXTEND', 'CONNECT' extends them to their only child
+def layout_rig_bones(rig, rigging_type, to_blender):
+    defs = []
+    parents = []
+    first_child = [] # index of the first child, -1 without children
+    stack = [(rig, -1)]
+    while stack:
+        rigsubdef, parent = stack.pop()
+        if parent >= 0 and first_child[parent] < 0:
+            first_child[parent] = len(defs)
+        parents.append(parent)
+        first_child.append(-1)
+        defs.append(rigsubdef)
+        stack.extend((child, len(defs) - 1) for child in reversed(rigsubdef['children']))
+
+    count = len(defs)
+    is_root = np.array(['jointtransform0' not in rigsubdef for rigsubdef in defs])
+    cfs = np.array([(rigsubdef['transform'], rigsubdef.get('jointtransform0', identity_cf), rigsubdef.get('jointtransform1', identity_cf))
+        for rigsubdef in defs], dtype=np.float64).reshape(count, 3, 12)
+    mats, mats0, mats1 = np.moveaxis(cfs_to_mats(cfs), 1, 0)
+
+    joint_mats = to_blender @ mats
+    o_trans = to_blender @ (mats @ mats1)
+    heads = o_trans[:, :3, 3]
+    bone_dirs = joint_mats[:, :3, 2]
+    real_tails = heads + o_trans[:, :3, 1] * np.where(is_root, .01, .25)[:, None]
+    tails = real_tails.copy()
+
+    if rigging_type != 'RAW':
+        # bones with a single child reach towards its joint (= its head), others point away from their own joint
+        single = np.array([len(rigsubdef['children']) == 1 for rigsubdef in defs]) & ~is_root
+        next_joints = heads[np.where(single, first_child, np.arange(count))]
+        if rigging_type == 'CONNECT':
+            extended = next_joints
+        else:
+            real_dirs = (real_tails - heads) / np.linalg.norm(real_tails - heads, axis=-1, keepdims=True)
+            extended = heads + real_dirs * np.einsum('ij,ij->i', real_dirs, next_joints - heads)[:, None]
+        extended = np.where(single[:, None], extended, heads + (heads - joint_mats[:, :3, 3]) * -2)
+
+        # no "nice" configuration if the bone gets too short
+        nice = ~is_root & (np.linalg.norm(extended - heads, axis=-1) >= .01)
+        tails[nice] = extended[nice]
+
+    rolls = align_bone_rolls(tails - heads, bone_dirs)
+    matrices = np.tile(np.identity(4), (count, 1, 1))
+    matrices[:, :3, :3] = bone_roll_mats(tails - heads, rolls)
+    matrices[:, :3, 3] = heads
+
+    return {
+        'names': [rigsubdef['jname'] for rigsubdef in defs],
+        'parents': parents,
+        'aux': [rigsubdef['aux'] for rigsubdef in defs],
+        'heads': heads,
+        'tails': tails,
+        'rolls': rolls,
+        'matrices': matrices,
+        'transforms': mats,
+        'transforms0': mats0,
+        'transforms1': mats1,
+        'nicetransforms': np.linalg.inv(o_trans) @ matrices,
+    }
+
+## RIG METADATA ##
+
+# collects the rig metadata chunks from object names in one pass, returns (metadata json text, names of the metadata objects)
+# raises ValueError if there are no chunks, chunks are missing or one index has different chunks
+def extract_rig_meta(names):
+    chunks = {}
+    meta_names = []
+    for name in names:
+        match = meta_name_pattern.match(name)
+        if match:
+            index = int(match.group(1))
+            if chunks.setdefault(index, match.group(2)) != match.group(2):
+                raise ValueError('Rig metadata chunk {:d} appears more than once, with different contents.'.format(index))
+            meta_names.append(name)
+
+    if not chunks:
+        raise ValueError('No rig metadata found.')
+    missing = sorted(set(range(1, max(chunks) + 1)) - set(chunks))
+    if missing or 0 in chunks:
+        raise ValueError('Rig metadata chunks are missing or out of range: {}.'.format(', '.join(str(i) for i in missing or [0])))
+
+    encoded = ''.join(chunks[i] for i in range(1, len(chunks) + 1)).replace('0', '=')
+    return base64.b32decode(encoded, True).decode('utf-8'), meta_names
+
+# object/group names of a .obj file (file order, without repeats), without importing it
+def read_obj_names(filepath):
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    names = dict.fromkeys(match.decode('utf-8', 'replace').strip() for match in obj_name_pattern.findall(data))
+    return list(names)
+
+## BONE NAMES ##
+
+# spellings of (side-less) bone names used by auto_match_bones, preferred ones first
+#   (Rigify numbers its spine: spine is the hips, spine003 the chest and spine006 the head)
+bone_name_aliases = {
+    'lowertorso': ['lowertorso', 'hips', 'pelvis', 'hip', 'spine'],
+    'uppertorso': ['uppertorso', 'chest', 'upperchest', 'spine2', 'spine03', 'spine003', 'spine3', 'spine1', 'spine'],
+    'head': ['head', 'spine006'],
+    'upperarm': ['upperarm', 'arm', 'uparm'],
+    'lowerarm': ['lowerarm', 'forearm', 'lowarm', 'elbow'],
+    'hand': ['hand', 'wrist'],
+    'upperleg': ['upperleg', 'upleg', 'thigh'],
+    'lowerleg': ['lowerleg', 'leg', 'calf', 'shin', 'knee'],
+    'foot': ['foot', 'ankle'],
+}
+bone_name_sides = {'left': 'L', 'l': 'L', 'right': 'R', 'r': 'R'}
+bone_name_noise = {'bip', 'def', 'jnt', 'mixamorig'} # tokens that say nothing about the bone
+bone_name_tokens = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+')
+
+# splits a bone name into its side ('L', 'R' or '') and a lowercase side-less name without namespaces and separators
+def parse_bone_name(name):
+    tokens = [token.lower() for token in bone_name_tokens.findall(re.split(r'[:|]', name)[-1])]
+    side = ''
+    for token in tokens:
+        if token in bone_name_sides:
+            side = bone_name_sides[token]
+            break
+    tokens = [token for token in tokens if token not in bone_name_sides and token not in bone_name_noise]
+    if len(tokens) > 1 and tokens[0].isdigit(): # 'Bip01 L Thigh'
+        tokens = tokens[1:]
+    return side, ''.join(tokens)
+
+# matches target bone names to (unused) source bone names by known spellings, then by closest spelling, {target: source}
+def auto_match_bones(target_names, source_names):
+    sources = {name: parse_bone_name(name) for name in source_names}
+    matches = {}
+    for target_name in target_names:
+        side, part = parse_bone_name(target_name)
+        aliases = bone_name_aliases.get(part, [part])
+        candidates = [(aliases.index(source_part), len(name), name) for name, (source_side, source_part) in sources.items()
+            if source_side == side and source_part in aliases]
+        if candidates:
+            source_name = min(candidates)[2]
+        else:
+            spellings = {source_part: name for name, (source_side, source_part) in sources.items() if source_side == side}
+            close = difflib.get_close_matches(part, spellings.keys(), n=1, cutoff=.8)
+            if not close:
+                continue
+            source_name = spellings[close[0]]
+        matches[target_name] = source_name
+        del sources[source_name]
+    return matches
+
+## COMMAND LINE ##
+
+# 'PATTERN:BITS:STEP' -> a quantize_precision rule
+def parse_precision_rule(text):
+    try:
+        pattern, bits, step = text.rsplit(':', 2)
+        return (pattern, int(bits), float(step))
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected PATTERN:BITS:STEP, got "{}"'.format(text))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rbx Animations bake core, bakes animations outside of Blender.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    bake_cmd = commands.add_parser('bake', help="bake a samples file (exported by the addon) into an encoded animation")
+    bake_cmd.add_argument('samples', help="samples file (.npz)")
+    bake_cmd.add_argument('-o', '--output', help="output file (default: stdout)")
+    bake_cmd.add_argument('--json', action='store_true', help="write the plain json instead of the encoded animation")
+    bake_cmd.add_argument('--format', choices=export_formats, default='JSON', help="encoding of the animation (default: %(default)s)")
+    bake_cmd.add_argument('--precision', action='append', type=parse_precision_rule, metavar='PATTERN:BITS:STEP',
+        help="QUANTIZED precision of the bones matching PATTERN (rotation bits 8-16, position step in studs), can be repeated, first match counts")
+    bake_cmd.add_argument('--segment-size', type=int, default=0, help="split the output file into numbered segments of this many characters (requires -o)")
+    bake_cmd.add_argument('--reduce', action='store_true', help="drop keyframes that can be interpolated")
+    bake_cmd.add_argument('--reduce-position', type=float, default=.001, help="position tolerance for --reduce, in studs (default: %(default)s)")
+    bake_cmd.add_argument('--reduce-angle', type=float, default=.1, help="angle tolerance for --reduce, in degrees (default: %(default)s)")
+
+    decode_cmd = commands.add_parser('decode', help="decode an encoded animation (any format) back to json")
+    decode_cmd.add_argument('animation', nargs='+', help="encoded animation file (or all of its segments, in order)")
+    decode_cmd.add_argument('-o', '--output', help="output file (default: stdout)")
+
+    error_cmd = commands.add_parser('error', help="largest pose difference between two encoded animations (e.g. JSON and QUANTIZED) or KeyframeSequence files")
+    error_cmd.add_argument('reference', help="encoded reference animation file (or .rbxmx/.rbxm file)")
+    error_cmd.add_argument('animation', help="encoded animation file (or .rbxmx/.rbxm file) to compare")
+    error_cmd.add_argument('--bones', action='store_true', help="also list the difference per bone")
+
+    keyframes_cmd = commands.add_parser('keyframes', help="bake a samples file into a KeyframeSequence model file (.rbxmx or .rbxm)")
+    keyframes_cmd.add_argument('samples', help="samples file (.npz)")
+    keyframes_cmd.add_argument('--meta', required=True, help="rig metadata of the rig (json, see the meta command)")
+    keyframes_cmd.add_argument('-o', '--output', required=True, help="output file (.rbxmx, or .rbxm for the binary format)")
+    keyframes_cmd.add_argument('--name', help="name of the KeyframeSequence (default: the output file name)")
+    keyframes_cmd.add_argument('--loop', action='store_true', help="make the animation loop")
+    keyframes_cmd.add_argument('--priority', choices=animation_priorities, default='Action', help="animation priority (default: %(default)s)")
+    keyframes_cmd.add_argument('--reduce', action='store_true', help="drop keyframes that can be interpolated")
+    keyframes_cmd.add_argument('--reduce-position', type=float, default=.001, help="position tolerance for --reduce, in studs (default: %(default)s)")
+    keyframes_cmd.add_argument('--reduce-angle', type=float, default=.1, help="angle tolerance for --reduce, in degrees (default: %(default)s)")
+
+    meta_cmd = commands.add_parser('meta', help="print the rig metadata of a .obj file exported by the rig exporter")
+    meta_cmd.add_argument('obj', help="rig file (.obj)")
+    meta_cmd.add_argument('-o', '--output', help="output file (default: stdout)")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'bake':
+        reduce_tolerance = (args.reduce_position, args.reduce_angle) if args.reduce else None
+        anim = bake(**load_samples(args.samples), reduce_tolerance=reduce_tolerance)
+
+        if args.segment_size:
+            if not args.output or args.json:
+                parser.error('--segment-size requires -o and an encoded output')
+            payload = iter_payload_chunks(anim.duration, animation_bone_names(anim), len(anim), [anim], args.format, args.precision)
+            paths = write_encoded_chunks(args.output, iter_encoded_chunks(payload, quantized_zlib_level if args.format == 'QUANTIZED' else 9), args.segment_size)
+            print('Baked {:d} keyframes ({:.2f} seconds, {:d} poses) to {:d} segments ({}).'.format(len(anim['kfs']), anim['t'], count_poses(anim), len(paths), ', '.join(paths)), file=sys.stderr)
+            return 0
+
+        result = json.dumps(anim.to_dict(), separators=(',',':')) if args.json else encode_animation(anim, args.format, args.precision)
+
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(result)
+            print('Baked {:d} keyframes ({:.2f} seconds, {:d} poses) to {}.'.format(len(anim['kfs']), anim['t'], count_poses(anim), args.output), file=sys.stderr)
+        else:
+            sys.stdout.write(result)
+
+    elif args.command == 'error':
+        anims = []
+        try:
+            for path in (args.reference, args.animation):
+                if path.lower().endswith(('.rbxmx', '.rbxm')):
+                    anims.append(read_keyframe_sequence(path))
+                else:
+                    with open(path) as f:
+                        anims.append(decode_animation(f.read().strip()))
+            error = compare_animations(*anims)
+        except ValueError as e:
+            parser.error(str(e))
+
+        print('Largest difference: {:.6f} studs, {:.4f} degrees.'.format(error['position'], error['angle']))
+        if args.bones:
+            for name, bone_error in error['bones'].items():
+                print('  {}: {:.6f} studs, {:.4f} degrees'.format(name, bone_error['position'], bone_error['angle']))
+
+    elif args.command == 'keyframes':
+        with open(args.meta) as f:
+            tree = pose_tree(json.load(f)['rig'])
+        samples = load_samples(args.samples)
+        name = args.name or os.path.splitext(os.path.basename(args.output))[0]
+        try:
+            if args.reduce:
+                anim = fill_pose_parents(bake(**samples, reduce_tolerance=(args.reduce_position, args.reduce_angle)), tree)
+                write_keyframe_sequence(args.output, [anim], tree, name, args.loop, animation_priorities[args.priority])
+            else:
+                kf_batches = iter_bake(samples['plan'], [samples['pose_mats']], samples['frames'], samples['frame_start'], samples['fps'])
+                write_keyframe_sequence(args.output, kf_batches, tree, name, args.loop, animation_priorities[args.priority])
+        except ValueError as e:
+            parser.error(str(e))
+        print('Wrote KeyframeSequence "{}" ({:d} frames) to {}.'.format(name, len(samples['frames']), args.output), file=sys.stderr)
+
+    elif args.command == 'meta':
+        try:
+            meta = extract_rig_meta(read_obj_names(args.obj))[0]
+        except ValueError as e:
+            parser.error(str(e))
+
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(meta)
+        else:
+            sys.stdout.write(meta)
+
+    elif args.command == 'decode':
+        text = ''
+        for path in args.animation:
+            with open(path) as f:
+                text += f.read().strip()
+        anim = decode_animation(text)
+        result = json.dumps(anim.to_dict(), separators=(',',':'))
+
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(result)
+        else:
+            sys.stdout.write(result)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
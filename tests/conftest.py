@@ -0,0 +1,53 @@
+import os, sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import RbxAnimationsCore as core
+
+# part of the R15 rig definition written by the rig exporter (the 'rig' of the rig metadata)
+def rig_def(name, transform, joint0=None, joint1=None, children=()):
+    rigsubdef = {'jname': name, 'pname': name, 'aux': [name], 'transform': [*transform, 1, 0, 0, 0, 1, 0, 0, 0, 1], 'children': list(children)}
+    if joint0:
+        rigsubdef['jointtransform0'] = [*joint0, 1, 0, 0, 0, 1, 0, 0, 0, 1]
+        rigsubdef['jointtransform1'] = [*joint1, 1, 0, 0, 0, 1, 0, 0, 0, 1]
+    return rigsubdef
+
+@pytest.fixture
+def rig():
+    return rig_def('HumanoidRootPart', (0, 3.1924, 0), children=[
+        rig_def('LowerTorso', (0, 2.3924, 0), (0, -1, 0), (0, -.2, 0), children=[
+            rig_def('LeftUpperLeg', (-.5, 1.721, 0), (-.5, -.2, 0), (0, .4714, 0)),
+            rig_def('UpperTorso', (0, 3.4414, 0), (0, .2, 0), (0, -.849, 0), children=[
+                rig_def('RightUpperArm', (1.4721, 3.62, 0), (.9716, .5975, 0), (-.5005, .4189, 0), children=[
+                    rig_def('RightLowerArm', (1.4721, 2.9903, 0), (0, -.355, 0), (0, .2747, 0)),
+                ]),
+                rig_def('Head', (0, 4.7818, .0003), (0, .849, 0), (0, -.4913, -.0003)),
+            ]),
+        ]),
+    ])
+
+@pytest.fixture
+def tree(rig):
+    return core.pose_tree(rig)
+
+# random unit quaternions (w, x, y, z), (shape x 4)
+def random_quats(rng, shape):
+    quats = rng.normal(size=tuple(shape) + (4,))
+    return quats / np.linalg.norm(quats, axis=-1, keepdims=True)
+
+# (shape x 12) cfs from quaternions and positions
+def make_cfs(quats, positions):
+    quats = np.asarray(quats, dtype=np.float64)
+    rots = core.quats_to_mats(quats.reshape(-1, 4)).reshape(quats.shape[:-1] + (9,))
+    return np.concatenate((np.asarray(positions, dtype=np.float64), rots), axis=-1)
+
+# a sampled animation of the rig bones (30 fps) with random poses, some poses are not stored
+@pytest.fixture
+def animation(tree):
+    rng = np.random.default_rng(7)
+    frames, bones = 24, len(tree['bones'])
+    cfs = make_cfs(random_quats(rng, (frames, bones)), rng.uniform(-2, 2, (frames, bones, 3)))
+    present = rng.random((frames, bones)) < .7
+    present[0] = True
+    return core.AnimationBuffer(tree['bones'], np.arange(frames) / 30, cfs, (frames - 1) / 30, present)
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+import RbxAnimationsCore as core
+from conftest import random_quats
+
+@pytest.mark.parametrize('order', ['XYZ', 'XZY', 'YXZ', 'YZX', 'ZXY', 'ZYX'])
+def test_eulers_to_mats(order):
+    bpy = pytest.importorskip('bpy')
+    from mathutils import Euler
+    eulers = np.random.default_rng(1).uniform(-4, 4, (10, 3))
+    np.testing.assert_allclose(core.eulers_to_mats(eulers, order), [Euler(euler, order).to_matrix() for euler in eulers], atol=1e-6)
+
+def test_eulers_to_mats_single_axis():
+    # the first axis of the order is applied first
+    x, z = core.eulers_to_mats([[np.pi / 2, 0, 0], [0, 0, np.pi / 2]])
+    np.testing.assert_allclose(core.eulers_to_mats([np.pi / 2, 0, np.pi / 2], 'XYZ'), z @ x, atol=1e-12)
+    np.testing.assert_allclose(core.eulers_to_mats([np.pi / 2, 0, np.pi / 2], 'ZYX'), x @ z, atol=1e-12)
+    np.testing.assert_allclose(x @ [0, 1, 0], [0, 0, 1], atol=1e-12)
+
+def test_axis_angles_to_quats():
+    bpy = pytest.importorskip('bpy')
+    from mathutils import Quaternion
+    axis_angles = np.random.default_rng(2).uniform(-4, 4, (10, 4))
+    # the same rotations, Blender may return the quaternion of the other sign
+    quats = core.axis_angles_to_quats(axis_angles)
+    np.testing.assert_allclose(np.linalg.norm(quats, axis=-1), 1)
+    np.testing.assert_allclose(core.quats_to_mats(quats), [Quaternion(axis_angle[1:], axis_angle[0]).to_matrix() for axis_angle in axis_angles], atol=1e-6)
+
+def test_axis_angles_zero_axis():
+    # like Blender, a zero axis rotates around y
+    np.testing.assert_allclose(core.axis_angles_to_quats([[1, 0, 0, 0]]), core.axis_angles_to_quats([[1, 0, 1, 0]]))
+
+def test_quats_mats_round_trip():
+    quats = random_quats(np.random.default_rng(3), (50,))
+    np.testing.assert_allclose(np.abs(np.sum(core.mats_to_quats(core.quats_to_mats(quats)) * quats, axis=-1)), 1)
+
+# a chain of three bones with random keys, one rotation mode per bone
+def make_armature(bpy, rotation_modes=('QUATERNION', 'ZXY', 'AXIS_ANGLE')):
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    ao = bpy.data.objects.new('Armature', bpy.data.armatures.new('Armature'))
+    bpy.context.scene.collection.objects.link(ao)
+    bpy.context.view_layer.objects.active = ao
+    bpy.ops.object.mode_set(mode='EDIT')
+    parent = None
+    for n in range(len(rotation_modes)):
+        bone = ao.data.edit_bones.new('Bone{}'.format(n))
+        bone.head = (n * .3, 0, n)
+        bone.tail = (n * .3 + .2, .1, n + 1)
+        bone.roll = n
+        bone.parent = parent
+        parent = bone
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    rng = np.random.default_rng(6)
+    for bone, rotation_mode in zip(ao.pose.bones, rotation_modes):
+        bone.rotation_mode = rotation_mode
+        for frame in (1, 7, 15):
+            bone.location = rng.uniform(-1, 1, 3)
+            bone.scale = rng.uniform(.5, 1.5, 3)
+            bone.rotation_quaternion = random_quats(rng, ())
+            bone.rotation_euler = rng.uniform(-3, 3, 3)
+            bone.rotation_axis_angle = rng.uniform(-3, 3, 4)
+            for prop in ('location', 'scale', 'rotation_quaternion' if rotation_mode == 'QUATERNION' else 'rotation_axis_angle' if rotation_mode == 'AXIS_ANGLE' else 'rotation_euler'):
+                bone.keyframe_insert(prop, frame=frame)
+    return ao
+
+def test_sample_from_action():
+    bpy = pytest.importorskip('bpy')
+    import RbxAnimations as addon
+    ao = make_armature(bpy)
+    assert addon.get_action_sampling_blocker(ao) is None
+    plan = {'bones': ['Bone2', 'Bone0']}
+    frames = [1, 3, 7, 12, 20]
+    mats = addon.sample_pose_matrices_from_action(ao, frames, plan)
+    for n, frame in enumerate(frames):
+        bpy.context.scene.frame_set(frame)
+        np.testing.assert_allclose(mats[n], [ao.pose.bones[name].matrix for name in plan['bones']], atol=1e-5)
+
+def test_sampling_blockers():
+    bpy = pytest.importorskip('bpy')
+    import RbxAnimations as addon
+    ao = make_armature(bpy)
+    ao.data.bones['Bone1'].use_inherit_rotation = False
+    assert addon.get_action_sampling_blocker(ao) == 'non-default parenting of Bone1'
+    ao.pose.bones['Bone0'].constraints.new('COPY_LOCATION')
+    assert addon.get_action_sampling_blocker(ao) == 'constraints on Bone0'
+    ao.animation_data.action_influence = .5
+    assert addon.get_action_sampling_blocker(ao) == 'action blending'
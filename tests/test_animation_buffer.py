@@ -0,0 +1,92 @@
+import base64
+import json
+import zlib
+import numpy as np
+import pytest
+
+import RbxAnimationsCore as core
+from conftest import make_cfs, random_quats
+
+def test_keyframe_dicts(animation):
+    assert animation['t'] == animation.duration and len(animation['kfs']) == len(animation)
+    for n, kf in enumerate(animation['kfs']):
+        assert kf['t'] == animation.times[n]
+        assert list(kf['kf']) == [name for name, present in zip(animation.names, animation.present[n]) if present]
+        for name, cf in kf['kf'].items():
+            np.testing.assert_allclose(cf, animation.cfs[n, animation.names.index(name)])
+    assert animation['kfs'][-1] == animation.keyframe(len(animation) - 1)
+    assert animation['kfs'][2:5] == [animation.keyframe(n) for n in range(2, 5)]
+    with pytest.raises(KeyError):
+        animation['frames']
+
+def test_stored_identity_poses_are_copies(animation):
+    # kept identity poses of reduced animations are stored, changing one doesn't change identity_cf
+    animation.cfs[0, 0] = core.identity_cf
+    cf = animation.keyframe(0)['kf'][animation.names[0]]
+    assert cf == core.identity_cf
+    cf[0] = 5
+    assert core.identity_cf[0] == 0 and animation.keyframe(0)['kf'][animation.names[0]][0] == 0
+
+def test_to_dict(animation):
+    # built at once like the keyframes one by one, integral components are ints like compact_cf makes them
+    animation.cfs[1, :2] = core.identity_cf
+    animation.present[1, :2] = True
+    animation.cfs[2, :, 0:3] = (-0., 2., -3.)
+    anim = animation.to_dict()
+    assert anim == {'t': animation.duration, 'kfs': [animation.keyframe(n) for n in range(len(animation))]}
+    assert json.dumps(anim) == json.dumps({'t': animation.duration, 'kfs': list(animation['kfs'])})
+    assert json.dumps(anim['kfs'][1]['kf']).startswith('{"HumanoidRootPart": [0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1]')
+    assert json.loads(zlib.decompress(base64.b64decode(core.encode_animation(animation)))) == anim
+
+def test_to_dict_without_poses(animation):
+    animation.present[:] = False
+    assert animation.to_dict() == {'t': animation.duration, 'kfs': [{'t': t, 'kf': {}} for t in animation.times.tolist()]}
+    assert core.AnimationBuffer(animation.names, [], np.empty((0, len(animation.names), 12)), 0).to_dict() == {'t': 0, 'kfs': []}
+
+def test_as_animation_buffer(animation):
+    assert core.as_animation_buffer(animation) is animation
+    anim = core.as_animation_buffer(json.loads(json.dumps(animation.to_dict())))
+    assert anim.duration == animation.duration
+    np.testing.assert_array_equal(anim.times, animation.times)
+    # bones in order of appearance, poses that are not stored are the identity
+    assert anim.names == core.animation_bone_names(animation)
+    columns = [animation.names.index(name) for name in anim.names]
+    np.testing.assert_array_equal(anim.present, animation.present[:, columns])
+    np.testing.assert_allclose(anim.cfs[anim.present], animation.cfs[:, columns][anim.present])
+    np.testing.assert_array_equal(anim.cfs[~anim.present], np.broadcast_to(core.identity_cf, anim.cfs[~anim.present].shape))
+    assert anim.to_dict() == animation.to_dict()
+
+def test_build_animation_skips_identity_poses(tree):
+    rng = np.random.default_rng(9)
+    cfs = make_cfs(random_quats(rng, (5, len(tree['bones']))), rng.normal(size=(5, len(tree['bones']), 3)))
+    cfs[:, 2] = core.identity_cf
+    cfs[3] = core.identity_cf
+    anim = core.build_animation(tree['bones'], cfs, np.arange(5) / 30, 4 / 30)
+    assert len(anim) == 5 and not anim.present[:, 2].any() and not anim.present[3].any()
+    assert anim['kfs'][3] == {'t': 3 / 30, 'kf': {}}
+
+    # kept poses are stored even if they are the identity, frames without kept poses are left out
+    keep = np.zeros(cfs.shape[:2], dtype=bool)
+    keep[[0, 4]] = True
+    keep[3, 2] = True
+    anim = core.build_animation(tree['bones'], cfs, np.arange(5) / 30, 4 / 30, keep)
+    np.testing.assert_array_equal(anim.times, np.array([0, 3, 4]) / 30)
+    np.testing.assert_array_equal(anim.present, keep[[0, 3, 4]])
+    assert anim['kfs'][1]['kf'] == {tree['bones'][2]: core.identity_cf}
+
+def test_merge_buffers_and_dicts(animation):
+    # parts in any order, as buffers or decoded json, the longest duration wins
+    first = core.AnimationBuffer(animation.names, animation.times[:8], animation.cfs[:8], 1, animation.present[:8])
+    second = core.AnimationBuffer(animation.names, animation.times[8:], animation.cfs[8:], animation.duration, animation.present[8:])
+    merged = core.merge_animations([second.to_dict(), first])
+    assert merged.duration == max(1, animation.duration)
+    np.testing.assert_array_equal(merged.times, animation.times)
+    assert merged.to_dict()['kfs'] == animation.to_dict()['kfs']
+
+def test_merge_keeps_time_order_of_equal_times(animation):
+    # shards never overlap, but a frame baked twice stays in part order
+    first = core.AnimationBuffer(animation.names, animation.times[:3], animation.cfs[:3], animation.duration, animation.present[:3])
+    second = core.AnimationBuffer(animation.names, animation.times[2:3], animation.cfs[5:6], animation.duration, animation.present[5:6])
+    merged = core.merge_animations([first, second])
+    np.testing.assert_array_equal(merged.times, animation.times[[0, 1, 2, 2]])
+    np.testing.assert_array_equal(merged.cfs[3], animation.cfs[5])
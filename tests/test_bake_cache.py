@@ -0,0 +1,100 @@
+import json
+import os
+import numpy as np
+import pytest
+
+bpy = pytest.importorskip('bpy')
+import RbxAnimations as addon
+
+rig_blend = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Rig15ik.blend')
+
+# the rig of Rig15ik.blend with the head keyed at frames 1, 20, 40 and 60, keyframe edits are tracked like with the add-on
+@pytest.fixture
+def ao():
+    bpy.ops.wm.open_mainfile(filepath=rig_blend)
+    addon.bake_cache.clear()
+    ao = addon.find_rig(None)
+    bone = ao.pose.bones['Head']
+    for frame, x in ((1, 0), (20, .3), (40, -.3), (60, 0)):
+        bone.location.x = x
+        bone.keyframe_insert('location', index=0, frame=frame)
+    # editing a key doesn't move the handles of its neighbours
+    for key in ao.animation_data.action.fcurves.find(bone.path_from_id('location'), index=0).keyframe_points:
+        key.handle_left_type = key.handle_right_type = 'FREE'
+    bpy.app.handlers.depsgraph_update_post.append(addon.on_depsgraph_update)
+    yield ao
+    bpy.app.handlers.depsgraph_update_post.remove(addon.on_depsgraph_update)
+
+# a second rig of the same metadata, named other_name, generated next to the one of the file
+def add_rig(ao, other_name):
+    meta_obj = addon.get_rig_meta_object(ao).copy()
+    meta_obj.name = addon.get_rig_meta_name(other_name)
+    meta = json.loads(meta_obj['RigMeta'])
+    meta['rigName'] = other_name
+    meta_obj['RigMeta'] = json.dumps(meta)
+    if 'RigParts' in meta_obj:
+        del meta_obj['RigParts']
+    bpy.context.scene.collection.objects.link(meta_obj)
+    bpy.context.view_layer.objects.active = meta_obj
+    return addon.create_rig('LOCAL_YAXIS_EXTEND', meta_obj)
+
+def edit_key(ao, frame, value):
+    fcurve = ao.animation_data.action.fcurves.find(ao.pose.bones['Head'].path_from_id('location'), index=0)
+    key = next(key for key in fcurve.keyframe_points if key.co[0] == frame)
+    key.co[1] = value
+    fcurve.update()
+    bpy.context.evaluated_depsgraph_get().update()
+
+def edit_rest_pose(ao):
+    bpy.context.view_layer.objects.active = ao
+    bpy.ops.object.mode_set(mode='EDIT')
+    ao.data.edit_bones[0].tail.z += .1
+    bpy.ops.object.mode_set(mode='OBJECT')
+    bpy.context.evaluated_depsgraph_get().update()
+
+# a bone channel the action doesn't key
+def unkeyed_bone(ao):
+    keyed = {fcurve.data_path for fcurve in ao.animation_data.action.fcurves}
+    return next(bone for bone in ao.pose.bones if bone.path_from_id('location') not in keyed)
+
+def test_resamples_edited_range(ao):
+    assert len(addon.sample_animation(True, ao)['frames']) == addon.bake_cache[ao.name]['resampled'] == 60
+    assert addon.sample_animation(True, ao) and addon.bake_cache[ao.name]['resampled'] == 0
+    edit_key(ao, 40, .5)
+    samples = addon.sample_animation(True, ao)
+    # the curve changes between the neighbouring keys
+    assert addon.bake_cache[ao.name]['resampled'] == 41
+    np.testing.assert_array_equal(samples['pose_mats'], addon.sample_animation(False, ao)['pose_mats'])
+
+def test_edits_reach_every_rig(ao):
+    other = add_rig(ao, 'Other')
+    for rig in (ao, other):
+        addon.sample_animation(True, rig)
+    edit_key(ao, 40, .5)
+    # the other rig bakes first, the edit is still seen by the edited one
+    addon.sample_animation(True, other)
+    samples = addon.sample_animation(True, ao)
+    assert addon.bake_cache[ao.name]['resampled'] == 41
+    np.testing.assert_array_equal(samples['pose_mats'], addon.sample_animation(False, ao)['pose_mats'])
+
+def test_unkeyed_edits_resample_everything(ao):
+    addon.sample_animation(True, ao)
+    unkeyed_bone(ao).location.z += .2
+    samples = addon.sample_animation(True, ao)
+    assert addon.bake_cache[ao.name]['resampled'] == 60
+    np.testing.assert_array_equal(samples['pose_mats'], addon.sample_animation(False, ao)['pose_mats'])
+
+def test_constraint_edits_resample_everything(ao):
+    addon.sample_animation(True, ao)
+    next(constraint for bone in ao.pose.bones for constraint in bone.constraints if constraint.type == 'IK').influence = .5
+    addon.sample_animation(True, ao)
+    assert addon.bake_cache[ao.name]['resampled'] == 60
+
+def test_rest_pose_edit_drops_samples(ao):
+    other = add_rig(ao, 'Other')
+    for rig in (ao, other):
+        addon.sample_animation(True, rig)
+    edit_rest_pose(other)
+    assert other.name not in addon.bake_cache and ao.name in addon.bake_cache
+    edit_rest_pose(ao)
+    assert ao.name not in addon.bake_cache
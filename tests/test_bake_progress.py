@@ -0,0 +1,59 @@
+import os
+import numpy as np
+import pytest
+
+bpy = pytest.importorskip('bpy')
+import RbxAnimations as addon
+import RbxAnimationsCore as core
+
+rig_blend = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Rig15ik.blend')
+
+@pytest.fixture
+def progress():
+    yield addon.bake_progress
+    addon.bake_progress.clear()
+
+@pytest.fixture
+def ao():
+    bpy.ops.wm.open_mainfile(filepath=rig_blend)
+    scene = bpy.context.scene
+    scene.frame_end = scene.frame_start + 9
+    scene.frame_set(scene.frame_start + 3)
+    return addon.find_rig(None)
+
+def test_progress(progress):
+    progress.update(stage='Sampling', done=0, total=40, start=100.)
+    assert addon.get_bake_progress() == (0., 'Sampling...')
+    # 10 frames took 2 seconds, 30 are left
+    progress.update(done=10, sampled=102.)
+    assert addon.get_bake_progress() == (.25, 'Sampling 10/40 frames, 6 s left')
+    progress.update(done=40, sampled=108.)
+    assert addon.get_bake_progress() == (1., 'Sampling 40/40 frames, 0 s left')
+    progress['stage'] = 'Encoding'
+    assert addon.get_bake_progress() == (1., 'Encoding...')
+
+def test_steps(ao):
+    steps = addon.iter_sample_animation(False, ao, 4)
+    progress = []
+    while True:
+        try:
+            progress.append(next(steps))
+        except StopIteration as e:
+            samples = e.value
+            break
+    assert progress == [(4, 10), (8, 10), (10, 10)]
+    assert bpy.context.scene.frame_current == bpy.context.scene.frame_start + 3
+    np.testing.assert_array_equal(samples['pose_mats'], addon.sample_animation(False, ao)['pose_mats'])
+
+def test_cancelled_steps_restore_frame(ao):
+    steps = addon.iter_sample_animation(False, ao, 4)
+    next(steps)
+    steps.close()
+    assert bpy.context.scene.frame_current == bpy.context.scene.frame_start + 3
+
+def test_encode_samples(ao):
+    samples = addon.sample_animation(False, ao)
+    anim, encoded, error = addon.encode_samples(samples)
+    assert error is None and core.decode_animation(encoded).to_dict() == anim.to_dict()
+    anim, encoded, error = addon.encode_samples(samples, export_format='QUANTIZED')
+    assert error == core.compare_animations(anim, core.decode_animation(encoded)) and error['angle'] < 1
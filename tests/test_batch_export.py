@@ -0,0 +1,50 @@
+import json
+import os
+import pytest
+
+bpy = pytest.importorskip('bpy')
+import RbxAnimations as addon
+import RbxAnimationsCore as core
+
+rig_blend = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Rig15ik.blend')
+
+# the rig of Rig15ik.blend with head actions over frames 1-frame_end (the names clash once cleaned up) and an object action
+@pytest.fixture
+def ao():
+    bpy.ops.wm.open_mainfile(filepath=rig_blend)
+    ao = addon.find_rig(None)
+    bone = ao.pose.bones['Head']
+    for name, frame_end in (('Wave/1', 8), ('Wave?1', 5), ('wave*1', 12)):
+        points = bpy.data.actions.new(name).fcurves.new(bone.path_from_id('location'), index=0).keyframe_points
+        points.insert(1, 0)
+        points.insert(frame_end, .2)
+    bpy.data.actions.new('Door').fcurves.new('location', index=2).keyframe_points.insert(1, 0)
+    return ao
+
+def test_manifest(tmp_path, ao):
+    manifest = addon.batch_export(str(tmp_path), 'wave*', 'BINARY16', 1, ao=ao)
+    assert manifest == json.loads((tmp_path / 'manifest.json').read_text())
+    meta = json.loads(addon.get_rig_meta_object(ao)['RigMeta'])
+    assert (manifest['rig'], manifest['format'], manifest['fps']) == (meta['rigName'], 'BINARY16', bpy.context.scene.render.fps)
+
+    # sorted by action name, a file each, without clashes
+    entries = manifest['animations']
+    assert [entry['action'] for entry in entries] == ['Wave/1', 'Wave?1', 'wave*1']
+    assert [entry['file'] for entry in entries] == ['Wave_1.txt', 'Wave_1_.txt', 'wave_1__.txt']
+    assert sorted(os.listdir(tmp_path)) == sorted(['manifest.json'] + [entry['file'] for entry in entries])
+    for entry, frame_end in zip(entries, (8, 5, 12)):
+        assert (entry['frame_start'], entry['frame_end']) == (1, frame_end)
+        encoded = (tmp_path / entry['file']).read_text()
+        anim = core.decode_animation(encoded)
+        assert entry['payload_size'] == len(encoded)
+        assert entry['duration'] == pytest.approx(anim['t']) and anim['t'] == pytest.approx((frame_end - 1) / manifest['fps'])
+        assert entry['keyframes'] == len(anim['kfs']) == frame_end and entry['poses'] == core.count_poses(anim)
+
+def test_actions_bake_separately(tmp_path, ao):
+    manifest = addon.batch_export(str(tmp_path), 'WAVE/1', 'JSON', 1, ao=ao)
+    assert [entry['action'] for entry in manifest['animations']] == ['Wave/1']
+    anim = core.decode_animation((tmp_path / 'Wave_1.txt').read_text())
+    expected = addon.bake_action_frames(ao, addon.get_export_plan(ao), 'Wave/1', list(range(1, 9)), 1, 8, manifest['fps'])
+    assert anim.to_dict() == expected.to_dict()
+    # the rig keeps its own action
+    assert ao.animation_data.action.name == '__RigAction.001'
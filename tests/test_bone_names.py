@@ -0,0 +1,57 @@
+import pytest
+
+import RbxAnimationsCore as core
+
+r15_bones = ['LowerTorso', 'UpperTorso', 'Head'] + [side + part for side in ('Left', 'Right') for part in ('UpperArm', 'LowerArm', 'Hand', 'UpperLeg', 'LowerLeg', 'Foot')]
+
+# bone names of the rigs of other tools, with the bones of the R15 rig they should drive
+mixamo_bones = ['mixamorig:' + name for name in ['Hips', 'Spine', 'Spine1', 'Spine2', 'Neck', 'Head', 'HeadTop_End'] + [side + part for side in ('Left', 'Right')
+    for part in ('Shoulder', 'Arm', 'ForeArm', 'Hand', 'HandIndex1', 'UpLeg', 'Leg', 'Foot', 'ToeBase')]]
+unreal_bones = ['root', 'pelvis', 'spine_01', 'spine_02', 'spine_03', 'neck_01', 'head'] + [part + '_' + side for side in 'lr'
+    for part in ('clavicle', 'upperarm', 'lowerarm', 'hand', 'thigh', 'calf', 'foot', 'ball')]
+rigify_bones = ['DEF-spine'] + ['DEF-spine.{:03d}'.format(i) for i in range(1, 7)] + ['DEF-' + part + '.' + side for side in 'LR'
+    for part in ('shoulder', 'upper_arm', 'upper_arm.001', 'forearm', 'forearm.001', 'hand', 'thigh', 'thigh.001', 'shin', 'shin.001', 'foot', 'toe')]
+biped_bones = ['Bip01', 'Bip01 Pelvis', 'Bip01 Spine', 'Bip01 Spine1', 'Bip01 Spine2', 'Bip01 Neck', 'Bip01 Head'] + ['Bip01 {} {}'.format(side, part) for side in 'LR'
+    for part in ('Clavicle', 'UpperArm', 'Forearm', 'Hand', 'Thigh', 'Calf', 'Foot', 'Toe0')]
+
+def expected_matches(torso, limbs):
+    matches = dict(zip(['LowerTorso', 'UpperTorso', 'Head'], torso))
+    for side in ('Left', 'Right'):
+        matches.update({side + part: name.format(side=side, s=side[0], l=side[0].lower()) for part, name in zip(('UpperArm', 'LowerArm', 'Hand', 'UpperLeg', 'LowerLeg', 'Foot'), limbs)})
+    return matches
+
+@pytest.mark.parametrize('name, parsed', [
+    ('LeftUpperArm', ('L', 'upperarm')),
+    ('UpperTorso', ('', 'uppertorso')),
+    ('mixamorig:LeftForeArm', ('L', 'forearm')),
+    ('mixamorig1|RightUpLeg', ('R', 'upleg')),
+    ('upperarm_l', ('L', 'upperarm')),
+    ('spine_03', ('', 'spine03')),
+    ('DEF-upper_arm.L', ('L', 'upperarm')),
+    ('DEF-forearm.R.001', ('R', 'forearm001')),
+    ('Bip01 L Thigh', ('L', 'thigh')),
+    ('Bip01 R UpperArm', ('R', 'upperarm')),
+    ('Bip01', ('', '01')),
+])
+def test_parse_bone_name(name, parsed):
+    assert core.parse_bone_name(name) == parsed
+
+@pytest.mark.parametrize('source_bones, expected', [
+    (mixamo_bones, expected_matches(['mixamorig:Hips', 'mixamorig:Spine2', 'mixamorig:Head'],
+        ['mixamorig:{side}Arm', 'mixamorig:{side}ForeArm', 'mixamorig:{side}Hand', 'mixamorig:{side}UpLeg', 'mixamorig:{side}Leg', 'mixamorig:{side}Foot'])),
+    (unreal_bones, expected_matches(['pelvis', 'spine_03', 'head'], ['upperarm_{l}', 'lowerarm_{l}', 'hand_{l}', 'thigh_{l}', 'calf_{l}', 'foot_{l}'])),
+    (rigify_bones, expected_matches(['DEF-spine', 'DEF-spine.003', 'DEF-spine.006'],
+        ['DEF-upper_arm.{s}', 'DEF-forearm.{s}', 'DEF-hand.{s}', 'DEF-thigh.{s}', 'DEF-shin.{s}', 'DEF-foot.{s}'])),
+    (biped_bones, expected_matches(['Bip01 Pelvis', 'Bip01 Spine2', 'Bip01 Head'],
+        ['Bip01 {s} UpperArm', 'Bip01 {s} Forearm', 'Bip01 {s} Hand', 'Bip01 {s} Thigh', 'Bip01 {s} Calf', 'Bip01 {s} Foot'])),
+], ids=['mixamo', 'unreal', 'rigify', 'biped'])
+def test_auto_match(source_bones, expected):
+    assert core.auto_match_bones(r15_bones, source_bones) == expected
+
+def test_auto_match_uses_sources_once():
+    assert core.auto_match_bones(['LeftHand', 'Hand', 'LeftWrist'], ['hand_l', 'Hand']) == {'LeftHand': 'hand_l', 'Hand': 'Hand'}
+
+def test_auto_match_close_spellings():
+    # unknown spellings match the closest source name of the same side
+    assert core.auto_match_bones(['LeftUpperArm', 'RightTail'], ['Left_UpperArms', 'Tail_R', 'Tail_L']) == {'LeftUpperArm': 'Left_UpperArms', 'RightTail': 'Tail_R'}
+    assert core.auto_match_bones(['LeftUpperArm'], ['RightUpperArm', 'Shoulder_L']) == {}
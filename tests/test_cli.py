@@ -0,0 +1,98 @@
+import json
+import numpy as np
+import pytest
+
+import RbxAnimationsCore as core
+from conftest import make_cfs, random_quats
+from test_rig_meta import meta_names
+
+# the rest data of the rig bones like the add-on reads it from the armature, with the nice bone orientations left out
+def rest_bones(rig, parent=None):
+    bones = [{
+        'name': rig['jname'],
+        'parent': parent,
+        'is_transformable': 'jointtransform0' in rig,
+        'transform': core.cf_to_mat(rig['transform']).tolist(),
+        'transform1': core.cf_to_mat(rig.get('jointtransform1', core.identity_cf)).tolist(),
+        'nicetransform': np.identity(4).tolist(),
+    }]
+    for child in rig['children']:
+        bones += rest_bones(child, rig['jname'])
+    return bones
+
+# bake samples of the rig, frames 1-12 of a 24 fps scene
+@pytest.fixture
+def samples(tmp_path, rig):
+    rng = np.random.default_rng(11)
+    plan = core.compile_export_plan(rest_bones(rig))
+    pose_mats = core.cfs_to_mats(make_cfs(random_quats(rng, (12, len(plan['bones']))), rng.uniform(-1, 1, (12, len(plan['bones']), 3))))
+    path = str(tmp_path / 'samples.npz')
+    core.save_samples(path, plan, pose_mats, list(range(1, 13)), 1, 12, 24)
+    return path
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+def test_bake_to_stdout(samples, capsys):
+    assert core.main(['bake', samples]) == 0
+    anim = core.decode_animation(capsys.readouterr().out)
+    assert anim.to_dict() == core.bake(**core.load_samples(samples)).to_dict()
+
+def test_bake_json_and_reduce(tmp_path, samples):
+    core.main(['bake', samples, '--json', '-o', str(tmp_path / 'anim.json')])
+    core.main(['bake', samples, '--json', '--reduce', '--reduce-angle', '360', '--reduce-position', '100', '-o', str(tmp_path / 'reduced.json')])
+    anim, reduced = read_json(tmp_path / 'anim.json'), read_json(tmp_path / 'reduced.json')
+    assert anim['t'] == pytest.approx(11 / 24) and len(anim['kfs']) == 12
+    # with tolerances this large only the first and the last keyframe are left
+    assert [kf['t'] for kf in reduced['kfs']] == [anim['kfs'][0]['t'], anim['kfs'][-1]['t']]
+
+@pytest.mark.parametrize('export_format', core.export_formats)
+def test_bake_and_decode(tmp_path, samples, export_format):
+    core.main(['bake', samples, '--json', '-o', str(tmp_path / 'anim.json')])
+    core.main(['bake', samples, '--format', export_format, '-o', str(tmp_path / 'anim.txt')])
+    core.main(['decode', str(tmp_path / 'anim.txt'), '-o', str(tmp_path / 'decoded.json')])
+    error = core.compare_animations(read_json(tmp_path / 'anim.json'), read_json(tmp_path / 'decoded.json'))
+    assert error['position'] < .01 and error['angle'] < .1
+
+def test_bake_segments(tmp_path, samples, capsys):
+    core.main(['bake', samples, '--segment-size', '100', '-o', str(tmp_path / 'anim.txt')])
+    paths = sorted(str(path) for path in tmp_path.glob('anim*.txt'))
+    assert len(paths) > 1
+    core.main(['decode', *paths])
+    assert json.loads(capsys.readouterr().out) == core.bake(**core.load_samples(samples)).to_dict()
+
+def test_bake_segments_without_output(samples):
+    with pytest.raises(SystemExit):
+        core.main(['bake', samples, '--segment-size', '100'])
+
+def test_error(tmp_path, samples, capsys):
+    core.main(['bake', samples, '-o', str(tmp_path / 'anim.txt')])
+    core.main(['bake', samples, '--format', 'QUANTIZED', '--precision', 'Head:8:.1', '-o', str(tmp_path / 'quantized.txt')])
+    capsys.readouterr()
+    core.main(['error', str(tmp_path / 'anim.txt'), str(tmp_path / 'quantized.txt'), '--bones'])
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].startswith('Largest difference: ')
+    bones = {line.split(':')[0].strip(): line for line in lines[1:]}
+    plan = core.load_samples(samples)['plan']
+    assert sorted(bones) == sorted(plan['bones'][:plan['count']])
+
+def test_keyframes(tmp_path, rig, samples):
+    (tmp_path / 'meta.json').write_text(json.dumps({'rigName': 'R15', 'parts': [], 'rig': rig}))
+    core.main(['keyframes', samples, '--meta', str(tmp_path / 'meta.json'), '-o', str(tmp_path / 'Walk.rbxm'), '--loop'])
+    error = core.compare_animations(core.bake(**core.load_samples(samples)), core.read_keyframe_sequence(str(tmp_path / 'Walk.rbxm')))
+    assert error['position'] < 1e-4 and error['angle'] < 1e-3
+
+def test_meta(tmp_path, rig, capsys):
+    meta = json.dumps({'rigName': 'R15', 'parts': ['Head'], 'rig': rig})
+    lines = []
+    for name in ['Head'] + meta_names(meta):
+        lines += ['o ' + name, 'v 0 0 0', 'f 1 1 1']
+    (tmp_path / 'rig.obj').write_text('\n'.join(lines))
+    core.main(['meta', str(tmp_path / 'rig.obj')])
+    assert capsys.readouterr().out == meta
+
+def test_meta_without_metadata(tmp_path):
+    (tmp_path / 'rig.obj').write_text('o Head\nv 0 0 0\n')
+    with pytest.raises(SystemExit):
+        core.main(['meta', str(tmp_path / 'rig.obj')])
@@ -0,0 +1,87 @@
+import math
+import numpy as np
+import pytest
+
+import RbxAnimationsCore as core
+
+# (keys x 8) keyframes like RbxAnimations.snapshot_action_keys: frame, value, left and right handle, interpolation, flags
+def make_keys(frames, values):
+    frames = np.asarray(frames, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    return np.column_stack((frames, values, frames - 2, values, frames + 2, values, np.zeros(len(frames)), np.zeros(len(frames))))
+
+@pytest.fixture
+def keys():
+    return make_keys([0, 10, 20, 30, 40], [0, 1, 0, -1, 0])
+
+def test_unchanged(keys):
+    assert core.keyframe_dirty_range(keys, keys.copy()) is None
+    assert core.keyframe_dirty_range(np.empty((0, 8)), np.empty((0, 8))) is None
+
+def test_changed_value(keys):
+    new_keys = keys.copy()
+    new_keys[2, 1] = .5
+    assert core.keyframe_dirty_range(keys, new_keys) == (10, 30)
+
+@pytest.mark.parametrize('column', [2, 3, 4, 5, 6])
+def test_changed_handle_or_interpolation(keys, column):
+    # either handle (or the interpolation) of a key shapes the curve between both of its neighbours
+    new_keys = keys.copy()
+    new_keys[2, column] += .25
+    assert core.keyframe_dirty_range(keys, new_keys) == (10, 30)
+
+def test_changed_neighbouring_keys(keys):
+    new_keys = keys.copy()
+    new_keys[1, 1] = 2
+    new_keys[2, 5] = .5
+    assert core.keyframe_dirty_range(keys, new_keys) == (0, 30)
+
+def test_changed_first_key(keys):
+    # the constant extrapolation before the first key changes with it
+    new_keys = keys.copy()
+    new_keys[0, 1] = 1
+    assert core.keyframe_dirty_range(keys, new_keys) == (-math.inf, 10)
+
+def test_changed_first_key_handle(keys):
+    # the extrapolation doesn't depend on the handles
+    new_keys = keys.copy()
+    new_keys[0, 4:6] = (3, 1)
+    assert core.keyframe_dirty_range(keys, new_keys) == (0, 10)
+
+def test_changed_last_key(keys):
+    new_keys = keys.copy()
+    new_keys[-1, 1] = 1
+    assert core.keyframe_dirty_range(keys, new_keys) == (30, math.inf)
+
+def test_inserted_key(keys):
+    new_keys = np.insert(keys, 2, make_keys([15], [3]), axis=0)
+    assert core.keyframe_dirty_range(keys, new_keys) == (10, 20)
+
+def test_deleted_key(keys):
+    assert core.keyframe_dirty_range(keys, np.delete(keys, 2, axis=0)) == (10, 30)
+
+def test_moved_key(keys):
+    # the range covers the old and the new position of the key
+    new_keys = keys.copy()
+    new_keys[2, [0, 2, 4]] += 6
+    assert core.keyframe_dirty_range(keys, new_keys) == (10, 30)
+    new_keys = np.delete(keys, 1, axis=0)
+    new_keys = np.insert(new_keys, 3, make_keys([35], [1]), axis=0)
+    lo, hi = core.keyframe_dirty_range(keys, new_keys)
+    assert lo <= 0 and hi >= 40
+
+def test_added_or_removed_all_keys(keys):
+    assert core.keyframe_dirty_range(np.empty((0, 8)), keys) == (-math.inf, math.inf)
+    assert core.keyframe_dirty_range(keys, np.empty((0, 8))) == (-math.inf, math.inf)
+
+def test_frames_outside_the_range_unchanged(keys):
+    # linear interpolation of the keys, the curve only changes inside the dirty range
+    rng = np.random.default_rng(11)
+    frames = np.arange(-10, 51)
+    for i in range(50):
+        new_keys = keys.copy()
+        changed = rng.choice(len(keys), rng.integers(1, 3), replace=False)
+        new_keys[changed, 1] += rng.normal(size=len(changed))
+        lo, hi = core.keyframe_dirty_range(keys, new_keys)
+        outside = (frames < lo) | (frames > hi)
+        np.testing.assert_array_equal(np.interp(frames, keys[:, 0], keys[:, 1])[outside], np.interp(frames, new_keys[:, 0], new_keys[:, 1])[outside])
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import RbxAnimationsCore as core
+
+# position and rotation matrix tolerances of every format, BINARY16 rounds positions up to 2 studs to 1/1024
+tolerances = {'JSON': (1e-12, 1e-12), 'BINARY32': (1e-6, 1e-6), 'BINARY16': (1e-3, 1e-6)}
+
+# the animation split into keyframe batches of size keyframes, like the sampler hands them over
+def batches(anim, size):
+    return [core.AnimationBuffer(anim.names, anim.times[lo:lo + size], anim.cfs[lo:lo + size], anim.duration, anim.present[lo:lo + size])
+        for lo in range(0, len(anim), size)]
+
+def encode_streamed(anim, export_format, size):
+    payload = core.iter_payload_chunks(anim.duration, core.animation_bone_names(anim), len(anim), batches(anim, size), export_format)
+    return core.iter_encoded_chunks(payload, core.quantized_zlib_level if export_format == 'QUANTIZED' else 9)
+
+@pytest.mark.parametrize('export_format', ['JSON', 'BINARY32', 'BINARY16'])
+def test_round_trip(animation, export_format):
+    decoded = core.decode_animation(core.encode_animation(animation, export_format))
+
+    assert decoded.duration == pytest.approx(animation.duration)
+    np.testing.assert_allclose(decoded.times, animation.times, atol=1e-7)
+    columns = [decoded.names.index(name) for name in animation.names]
+    np.testing.assert_array_equal(decoded.present[:, columns], animation.present)
+    position_tolerance, rotation_tolerance = tolerances[export_format]
+    cfs = decoded.cfs[:, columns][animation.present]
+    np.testing.assert_allclose(cfs[:, 0:3], animation.cfs[animation.present][:, 0:3], atol=position_tolerance)
+    np.testing.assert_allclose(cfs[:, 3:12], animation.cfs[animation.present][:, 3:12], atol=rotation_tolerance)
+
+@pytest.mark.parametrize('export_format', ['JSON', 'BINARY32', 'BINARY16'])
+def test_round_trip_identity_poses(tree, export_format):
+    cfs = np.tile(np.array(core.identity_cf, dtype=np.float64), (3, len(tree['bones']), 1))
+    cfs[1, 2, 0:3] = (1, 2, 3)
+    anim = core.build_animation(tree['bones'], cfs, [0, .5, 1], 1)
+    decoded = core.decode_animation(core.encode_animation(anim, export_format))
+
+    # identity poses are not stored, keyframes without any poses still are
+    assert len(decoded) == 3
+    assert decoded.names == [tree['bones'][2]]
+    np.testing.assert_array_equal(decoded.present[:, 0], [False, True, False])
+    np.testing.assert_allclose(decoded.cfs[1, 0], cfs[1, 2], atol=1e-6)
+
+@pytest.mark.parametrize('export_format', core.export_formats)
+@pytest.mark.parametrize('size', [1, 5, 100])
+def test_streamed_equals_encoded(animation, export_format, size):
+    assert ''.join(encode_streamed(animation, export_format, size)) == core.encode_animation(animation, export_format)
+
+@pytest.mark.parametrize('export_format', core.export_formats)
+@pytest.mark.parametrize('segment_size', [0, 7, 97, 1 << 20])
+def test_segmented_files(tmp_path, animation, export_format, segment_size):
+    encoded = core.encode_animation(animation, export_format)
+    paths = core.write_encoded_chunks(str(tmp_path / 'animation.txt'), encode_streamed(animation, export_format, 5), segment_size)
+
+    texts = []
+    for path in paths:
+        with open(path) as f:
+            texts.append(f.read())
+    assert ''.join(texts) == encoded
+    if segment_size:
+        assert paths == [str(tmp_path / 'animation.{:03d}.txt'.format(i + 1)) for i in range(len(paths))]
+        assert all(len(text) == segment_size for text in texts[:-1]) and 0 < len(texts[-1]) <= segment_size
+    else:
+        assert paths == [str(tmp_path / 'animation.txt')]
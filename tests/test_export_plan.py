@@ -0,0 +1,76 @@
+import numpy as np
+
+import RbxAnimationsCore as core
+from conftest import make_cfs, random_quats
+
+# y-up -> z-up, like bpy_extras.io_utils.axis_conversion(from_forward='Z', from_up='Y', to_forward='-Y', to_up='Z')
+transform_to_blender = np.array([[1, 0, 0, 0], [0, 0, -1, 0], [0, 1, 0, 0], [0, 0, 0, 1]], dtype=np.float64)
+
+def random_mats(rng, count):
+    return core.cfs_to_mats(make_cfs(random_quats(rng, (count,)), rng.uniform(-2, 2, (count, 3))))
+
+# a root with a chain of transformable bones and a branch
+def random_rest_bones(rng):
+    parents = [None, 'Root', 'Bone1', 'Bone2', 'Bone1']
+    mats = random_mats(rng, 3 * len(parents))
+    return [{
+        'name': 'Root' if parent is None else 'Bone{}'.format(n),
+        'parent': parent,
+        'is_transformable': parent is not None,
+        'transform': mats[3 * n].tolist(),
+        'transform1': np.identity(4).tolist() if parent is None else mats[3 * n + 1].tolist(),
+        'nicetransform': mats[3 * n + 2].tolist(),
+    } for n, parent in enumerate(parents)]
+
+# the per-bone C0/C1 delta as serialize_animation_state computed it with mathutils
+def baseline_state(rest_bones, pose_mats):
+    by_name = {bone['name']: bone for bone in rest_bones}
+    names = [bone['name'] for bone in rest_bones]
+    back_trans = np.linalg.inv(transform_to_blender)
+    state = {}
+    for bone in rest_bones:
+        if not bone['is_transformable']:
+            continue
+        parent = by_name[bone['parent']]
+        cur_obj_transform = back_trans @ (pose_mats[names.index(bone['name'])] @ np.linalg.inv(bone['nicetransform']))
+        parent_obj_transform = back_trans @ (pose_mats[names.index(parent['name'])] @ np.linalg.inv(parent['nicetransform']))
+        orig_base_mat = back_trans @ (np.array(bone['transform']) @ np.array(bone['transform1']))
+        parent_orig_base_mat = back_trans @ (np.array(parent['transform']) @ np.array(parent['transform1']))
+        orig_transform = np.linalg.inv(parent_orig_base_mat) @ orig_base_mat
+        cur_transform = np.linalg.inv(parent_obj_transform) @ cur_obj_transform
+        state[bone['name']] = np.linalg.inv(orig_transform) @ cur_transform
+    return state
+
+def test_plan_layout():
+    rest_bones = random_rest_bones(np.random.default_rng(1))
+    plan = core.compile_export_plan(rest_bones)
+    # transformable bones first, then the parent-only root
+    assert plan['count'] == 4 and plan['bones'] == ['Bone1', 'Bone2', 'Bone3', 'Bone4', 'Root']
+    assert plan['parents'] == [4, 0, 1, 0]
+
+def test_solve_matches_baseline():
+    rng = np.random.default_rng(3)
+    rest_bones = random_rest_bones(rng)
+    plan = core.compile_export_plan(rest_bones)
+    names = [bone['name'] for bone in rest_bones]
+    pose_mats = np.stack([random_mats(rng, len(rest_bones)) for frame in range(6)])
+    # the plan reads the pose matrices in its own bone order
+    states = core.solve_animation_states(pose_mats[:, [names.index(name) for name in plan['bones']]], core.load_export_plan(plan))
+    for frame in range(len(pose_mats)):
+        baseline = baseline_state(rest_bones, pose_mats[frame])
+        for n, name in enumerate(plan['bones'][:plan['count']]):
+            np.testing.assert_allclose(states[frame, n], baseline[name], atol=1e-9)
+
+def test_bake_matches_baseline():
+    rng = np.random.default_rng(5)
+    rest_bones = random_rest_bones(rng)
+    plan = core.compile_export_plan(rest_bones)
+    names = [bone['name'] for bone in rest_bones]
+    pose_mats = np.stack([random_mats(rng, len(rest_bones)) for frame in range(4)])
+    anim = core.bake(plan, pose_mats[:, [names.index(name) for name in plan['bones']]], [1, 2, 3, 4], 1, 4, 30)
+    assert anim['t'] == 3 / 30 and len(anim['kfs']) == 4
+    for frame, kf in enumerate(anim['kfs']):
+        baseline = baseline_state(rest_bones, pose_mats[frame])
+        assert kf['t'] == frame / 30 and list(kf['kf']) == plan['bones'][:plan['count']]
+        for name, cf in kf['kf'].items():
+            np.testing.assert_allclose(cf, core.mat_to_cf(baseline[name]), atol=1e-3)
@@ -0,0 +1,64 @@
+import types
+import numpy as np
+import pytest
+
+bpy = pytest.importorskip('bpy')
+from mathutils import Matrix
+import RbxAnimations as addon
+import RbxAnimationsCore as core
+from conftest import random_quats
+
+@pytest.fixture
+def action():
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    action = bpy.data.actions.new('Action')
+    fcurve = action.fcurves.new('location', index=1)
+    for frame, value in ((1, 0), (5, 1), (10, 0)):
+        fcurve.keyframe_points.insert(frame, value)
+    key = fcurve.keyframe_points[1]
+    key.handle_left_type = key.handle_right_type = 'FREE'
+    key.interpolation = 'LINEAR'
+    key.handle_left = (4, 1.5)
+    fcurve.update()
+    return action
+
+def read_keys(fcurve):
+    return [(tuple(key.co), tuple(key.handle_left), key.handle_left_type, key.interpolation) for key in fcurve.keyframe_points]
+
+def test_new_fcurve(action):
+    addon.write_fcurve_keys(action, 'rotation_euler', 2, 'Bone', [3, 1, 2], [.3, .1, .2])
+    fcurve = action.fcurves.find('rotation_euler', index=2)
+    assert fcurve.group.name == 'Bone'
+    assert [tuple(key.co) for key in fcurve.keyframe_points] == [(1, pytest.approx(.1)), (2, pytest.approx(.2)), (3, pytest.approx(.3))]
+
+def test_merge_with_existing_keys(action):
+    fcurve = action.fcurves.find('location', index=1)
+    defaults = read_keys(fcurve)[0][2:]
+    addon.write_fcurve_keys(action, 'location', 1, None, [5.001, 7], [2, 3])
+    keys = read_keys(fcurve)
+    assert [key[0] for key in keys] == [(1, 0), (pytest.approx(5.001), 2), (7, 3), (10, 0)]
+    # the replaced key keeps its settings with its handles moved along, the new one gets the defaults
+    assert keys[1][1] == (pytest.approx(4.001), pytest.approx(2.5)) and keys[1][2:] == ('FREE', 'LINEAR')
+    assert keys[2][2:] == defaults
+
+def test_decompose_basis_matrices():
+    rng = np.random.default_rng(2)
+    mats = core.compose_mats(rng.normal(size=(6, 3)), core.quats_to_mats(random_quats(rng, (6,))), rng.uniform(.5, 2, (6, 3)))
+    for rotation_mode in ('QUATERNION', 'AXIS_ANGLE', 'XYZ', 'ZXY'):
+        channels = addon.decompose_basis_matrices(types.SimpleNamespace(rotation_mode=rotation_mode), mats)
+        for n, mat in enumerate(mats):
+            location, quat, scale = Matrix(mat.tolist()).decompose()
+            np.testing.assert_allclose(channels['location'][n], location, atol=1e-6)
+            np.testing.assert_allclose(channels['scale'][n], scale, atol=1e-6)
+            if rotation_mode == 'QUATERNION':
+                assert abs(np.dot(channels['rotation_quaternion'][n], quat)) == pytest.approx(1)
+            elif rotation_mode == 'AXIS_ANGLE':
+                np.testing.assert_allclose(core.axis_angles_to_quats(channels['rotation_axis_angle'][n]), quat * np.sign(np.dot(quat, core.axis_angles_to_quats(channels['rotation_axis_angle'][n]))), atol=1e-6)
+            else:
+                np.testing.assert_allclose(core.eulers_to_mats(channels['rotation_euler'][n], rotation_mode), quat.to_matrix(), atol=1e-6)
+
+def test_quaternion_keys_stay_continuous():
+    quats = core.axis_angles_to_quats(np.column_stack((np.linspace(0, 6, 30), np.tile([1, 2, 3], (30, 1)))))
+    mats = core.compose_mats(np.zeros((30, 3)), core.quats_to_mats(quats), np.ones((30, 3)))
+    rotations = addon.decompose_basis_matrices(types.SimpleNamespace(rotation_mode='QUATERNION'), mats)['rotation_quaternion']
+    assert np.all(np.sum(rotations[1:] * rotations[:-1], axis=-1) > 0)
@@ -0,0 +1,62 @@
+import json
+import os
+import numpy as np
+import pytest
+
+bpy = pytest.importorskip('bpy')
+import RbxAnimations as addon
+import RbxAnimationsCore as core
+
+rig_blend = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Rig15ik.blend')
+
+# the IK rig of Rig15ik.blend and a bake of its frames solved by the constraints
+@pytest.fixture
+def ik_rig():
+    bpy.ops.wm.open_mainfile(filepath=rig_blend)
+    ao = addon.find_rig(None)
+    scene = bpy.context.scene
+    scene.frame_end = scene.frame_start + 11
+    jobs = [{'action': None, 'frame_start': scene.frame_start, 'frame_end': scene.frame_end}]
+    return ao, jobs, addon.parallel_bake(jobs, 1, ao=ao)[0]
+
+def assert_same_bake(expected, anim):
+    error = core.compare_animations(expected, anim)
+    assert error['position'] < 1e-4 and error['angle'] < .01
+
+# saves a copy of the file in baked IK mode, with the constraints of the rig muted by the cache
+def save_baked_ik(ao, path):
+    addon.bake_ik_cache(ao)
+    assert 'IKCacheMuted' in ao and any(constraint.mute for bone in ao.pose.bones for constraint in bone.constraints)
+    bpy.ops.wm.save_as_mainfile(filepath=path, copy=True)
+
+def test_cache_bakes_like_constraints(ik_rig):
+    ao, jobs, expected = ik_rig
+    addon.bake_ik_cache(ao)
+    anim = addon.parallel_bake(jobs, 1, ao=ao)[0]
+    addon.clear_ik_cache(ao)
+    assert not any(constraint.mute for bone in ao.pose.bones for constraint in bone.constraints)
+    assert_same_bake(expected, anim)
+
+def test_worker_restores_constraints(ik_rig, tmp_path):
+    # bake workers open the file without the add-on and its load handler
+    ao, jobs, expected = ik_rig
+    blend_path, tasks_path, result_path = str(tmp_path / 'bake.blend'), str(tmp_path / 'tasks.json'), str(tmp_path / 'result.json')
+    rig_name, plan = ao.name, addon.get_export_plan(ao)
+    save_baked_ik(ao, blend_path)
+    with open(tasks_path, 'w') as f:
+        json.dump({'rig': rig_name, 'plan': plan, 'fps': bpy.context.scene.render.fps, 'reduce_tolerance': None, 'jobs': jobs,
+            'shards': [[0, list(range(jobs[0]['frame_start'], jobs[0]['frame_end'] + 1))]]}, f)
+    addon.run_bake_worker(blend_path, tasks_path, result_path)
+    assert not any(constraint.mute for bone in bpy.data.objects[rig_name].pose.bones for constraint in bone.constraints)
+    with open(result_path) as f:
+        (n, text), = json.load(f)
+    assert_same_bake(expected, core.decode_animation(text))
+
+def test_command_line_restores_constraints(ik_rig, tmp_path):
+    ao, jobs, expected = ik_rig
+    blend_path = str(tmp_path / 'bake.blend')
+    save_baked_ik(ao, blend_path)
+    assert addon.main(['bake', blend_path, '--workers', '1', '-o', str(tmp_path)]) == 0
+    assert 'IKCacheMuted' not in addon.find_rig(None)
+    with open(str(tmp_path / 'animation.txt')) as f:
+        assert_same_bake(expected, core.decode_animation(f.read()))
@@ -0,0 +1,113 @@
+import struct
+import numpy as np
+import pytest
+
+import RbxAnimationsCore as core
+
+# the Poses of every Keyframe of parsed instances (see parse_rbxmx), {keyframe index: [(instance index, props, parent)]}
+def keyframe_poses(instances):
+    keyframe_of = {}
+    poses = {}
+    for i, (class_name, props, parent) in enumerate(instances):
+        if class_name == 'Keyframe':
+            keyframe_of[i] = i
+            poses[i] = []
+        elif class_name == 'Pose':
+            keyframe_of[i] = keyframe_of[parent]
+            poses[keyframe_of[i]].append((i, props, parent))
+    return poses
+
+@pytest.mark.parametrize('ext', ['.rbxmx', '.rbxm'])
+def test_round_trip(tmp_path, animation, tree, ext):
+    path = str(tmp_path / ('animation' + ext))
+    core.write_keyframe_sequence(path, [animation], tree, 'Walk', loop=True, priority=core.animation_priorities['Movement'])
+    sequence = core.read_keyframe_sequence(path)
+
+    assert (sequence['name'], sequence['loop'], sequence['priority']) == ('Walk', True, core.animation_priorities['Movement'])
+    assert len(sequence['kfs']) == len(animation)
+    for n, kf in enumerate(sequence['kfs']):
+        assert kf['t'] == pytest.approx(animation.times[n], abs=1e-6)
+        stored = np.flatnonzero(animation.present[n])
+        assert sorted(kf['kf']) == sorted(tree['names'][tree['bones'].index(animation.names[b])] for b in stored)
+        for b in stored:
+            np.testing.assert_allclose(kf['kf'][animation.names[b]], animation.cfs[n, b], atol=1e-5)
+
+@pytest.mark.parametrize('ext', ['.rbxmx', '.rbxm'])
+def test_pose_nesting(tmp_path, animation, tree, ext):
+    path = str(tmp_path / ('animation' + ext))
+    core.write_keyframe_sequence(path, [animation], tree, 'Walk')
+    with open(path, 'rb') as f:
+        data = f.read()
+    instances = core.parse_rbxm(data) if ext == '.rbxm' else core.parse_rbxmx(data)
+
+    assert [class_name for class_name, props, parent in instances if parent == -1] == ['KeyframeSequence']
+    parent_of = {name: tree['names'][parent] if parent >= 0 else None for name, parent in zip(tree['names'], tree['parents'])}
+    for n, poses in enumerate(keyframe_poses(instances).values()):
+        names = [props['Name'] for i, props, parent in poses]
+        assert len(names) == len(set(names))
+        for i, props, parent in poses:
+            # nested like the parts of the rig, the root Pose directly under the Keyframe
+            if parent_of[props['Name']] is None:
+                assert instances[parent][0] == 'Keyframe'
+            else:
+                assert instances[parent][0] == 'Pose' and instances[parent][1]['Name'] == parent_of[props['Name']]
+
+            # placeholders (Weight 0, identity) only for ancestors of stored poses
+            b = animation.names.index(props['Name'])
+            if animation.present[n, b]:
+                assert props['Weight'] == 1
+            else:
+                assert props['Weight'] == 0
+                np.testing.assert_allclose(props['CFrame'], core.identity_cf)
+                assert any(parent_of[instances[j][1]['Name']] == props['Name'] for j, child_props, child_parent in poses if child_parent == i)
+
+def test_rbxmx_streamed_in_batches(tmp_path, animation, tree):
+    whole = str(tmp_path / 'whole.rbxmx')
+    batched = str(tmp_path / 'batched.rbxmx')
+    core.write_keyframe_sequence(whole, [animation], tree, 'Walk')
+    batches = [core.AnimationBuffer(animation.names, animation.times[lo:lo + 5], animation.cfs[lo:lo + 5], animation.duration, animation.present[lo:lo + 5])
+        for lo in range(0, len(animation), 5)]
+    core.write_keyframe_sequence(batched, batches, tree, 'Walk')
+    with open(whole, 'rb') as f0, open(batched, 'rb') as f1:
+        assert f0.read() == f1.read()
+
+def test_rbxm_chunk_layout(animation, tree):
+    data = core.pack_rbxm(list(animation['kfs']), tree, 'Walk')
+    assert data.startswith(core.rbxm_magic)
+    version, class_count, instance_count = struct.unpack_from('<Hii', data, len(core.rbxm_magic))
+    assert version == 0
+    assert data[len(core.rbxm_magic) + 10:len(core.rbxm_magic) + 18] == bytes(8)
+
+    chunks = []
+    offset = len(core.rbxm_magic) + 18
+    while offset < len(data):
+        name = data[offset:offset + 4]
+        compressed, size, reserved = struct.unpack_from('<III', data, offset + 4)
+        assert (compressed, reserved) == (0, 0)
+        chunks.append((name, data[offset + 16:offset + 16 + size]))
+        offset += 16 + size
+    assert offset == len(data)
+
+    # all INST chunks, then all PROP chunks, a single PRNT chunk and the END chunk
+    names = [name for name, chunk in chunks]
+    inst_count = names.count(b'INST')
+    assert names == [b'INST'] * inst_count + [b'PROP'] * (len(names) - inst_count - 2) + [b'PRNT', b'END\0']
+    assert chunks[-1][1] == b'</roblox>'
+
+    classes = {}
+    for name, chunk in chunks[:inst_count]:
+        class_id, name_length = struct.unpack_from('<II', chunk)
+        assert chunk[8 + name_length] == 0 # not a service
+        classes[class_id] = (chunk[8:8 + name_length].decode(), struct.unpack_from('<I', chunk, 9 + name_length)[0])
+    assert sorted(classes) == list(range(class_count))
+    stored = int(np.count_nonzero(animation.present))
+    counts = {class_name: count for class_name, count in classes.values()}
+    assert counts['KeyframeSequence'] == 1 and counts['Keyframe'] == len(animation) and counts['Pose'] >= stored
+    assert sum(counts.values()) == instance_count
+
+    # every PROP chunk belongs to a declared class, PRNT lists every instance
+    for name, chunk in chunks[inst_count:-2]:
+        assert struct.unpack_from('<I', chunk)[0] in classes
+    prnt = chunks[-2][1]
+    assert prnt[0] == 0 and struct.unpack_from('<I', prnt, 1)[0] == instance_count
+    assert len(prnt) == 5 + instance_count * 8
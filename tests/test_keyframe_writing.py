@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+import RbxAnimationsCore as core
+from conftest import random_quats
+
+def test_decompose_reverses_compose():
+    rng = np.random.default_rng(4)
+    locations = rng.normal(size=(20, 3))
+    rots = core.quats_to_mats(random_quats(rng, (20,)))
+    scales = rng.uniform(.5, 2, (20, 3))
+    decomposed = core.decompose_mats(core.compose_mats(locations, rots, scales))
+    for value, expected in zip(decomposed, (locations, rots, scales)):
+        np.testing.assert_allclose(value, expected, atol=1e-12)
+
+def test_decompose_mirrored():
+    # like Matrix.decompose, mirroring flips the sign of every scale and keeps the rotation proper
+    mat = core.compose_mats(np.zeros(3), core.quats_to_mats(np.array([.5, .5, .5, .5])), np.array([1, 2, -3]))
+    locations, rots, scales = core.decompose_mats(mat[None])
+    np.testing.assert_allclose(np.linalg.det(rots), [1])
+    np.testing.assert_allclose(scales, [[-1, -2, -3]])
+    np.testing.assert_allclose(core.compose_mats(locations, rots, scales), mat[None], atol=1e-12)
+
+def test_decompose_zero_scale():
+    mat = core.compose_mats(np.array([1, 2, 3]), np.identity(3), np.array([0, 1, 1]))
+    locations, rots, scales = core.decompose_mats(mat)
+    assert np.all(np.isfinite(rots))
+    np.testing.assert_allclose(scales, [0, 1, 1])
+
+def test_continuous_quats():
+    rng = np.random.default_rng(8)
+    # slow rotation with the sign of random keys flipped
+    quats = core.axis_angles_to_quats(np.column_stack((np.linspace(0, 6, 30), np.tile([1, 2, 3], (30, 1)))))
+    signs = np.where(rng.random(30) < .5, -1, 1)
+    continuous = core.continuous_quats(quats * signs[:, None])
+    np.testing.assert_allclose(continuous, quats * signs[0], atol=1e-12)
+    assert core.continuous_quats(quats[:1]).shape == (1, 4) and core.continuous_quats(np.empty((0, 4))).shape == (0, 4)
+
+def test_match_keyframes():
+    old_frames = [10, 1, 5, 20.005]
+    np.testing.assert_array_equal(core.match_keyframes(old_frames, [1, 2, 5.009, 10.02, 20, 30]), [1, -1, 2, -1, 3, -1])
+    np.testing.assert_array_equal(core.match_keyframes([], [1, 2]), [-1, -1])
+    assert len(core.match_keyframes(old_frames, [])) == 0
+
+def test_match_keyframes_nearest():
+    # every new key replaces the nearest old key, old keys between new ones are not replaced
+    np.testing.assert_array_equal(core.match_keyframes([3, 3.004, 3.008], [3.007, 3.0015]), [2, 0])
@@ -0,0 +1,68 @@
+import os
+import numpy as np
+import pytest
+
+bpy = pytest.importorskip('bpy')
+import RbxAnimations as addon
+from test_bake_cache import add_rig, edit_rest_pose
+
+rig_blend = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Rig15ik.blend')
+
+# the rig of Rig15ik.blend with a second rig, edits of the armatures are tracked like with the add-on
+@pytest.fixture
+def rigs():
+    bpy.ops.wm.open_mainfile(filepath=rig_blend)
+    ao = addon.find_rig(None)
+    rigs = ao, add_rig(ao, 'Other')
+    addon.invalidate_matrix_cache()
+    bpy.app.handlers.depsgraph_update_post.append(addon.on_depsgraph_update)
+    yield rigs
+    bpy.app.handlers.depsgraph_update_post.remove(addon.on_depsgraph_update)
+
+def cached_armatures():
+    return {key[0] for key in addon.matrix_cache}
+
+def test_hits_and_misses(rigs):
+    ao, other = rigs
+    bone = ao.data.bones['Head']
+    stats = addon.get_matrix_cache_stats()
+    mat = addon.get_bone_matrix(bone, 'parent_offset_inv')
+    # the inverse is computed from the cached matrices it is made of
+    np.testing.assert_allclose(mat, np.linalg.inv(np.array(bone.parent.matrix_local.inverted() @ bone.matrix_local)), atol=1e-6)
+    assert addon.get_bone_matrix(bone, 'parent_offset_inv') is mat and not mat.flags.writeable
+    after = addon.get_matrix_cache_stats()
+    # parent_offset_inv, parent_offset, the parent's rest_inv and rest, the bone's rest
+    assert after['misses'] - stats['misses'] == 5 and after['hits'] - stats['hits'] == 1 and after['entries'] == 5
+
+def test_invalidate_one_armature(rigs):
+    ao, other = rigs
+    for rig in rigs:
+        addon.get_bone_matrix(rig.data.bones['Head'], 'rest')
+    addon.invalidate_matrix_cache(other.data)
+    assert cached_armatures() == {ao.data.as_pointer()}
+    addon.invalidate_matrix_cache()
+    assert not addon.matrix_cache
+
+def test_rest_pose_edit_invalidates(rigs):
+    ao, other = rigs
+    for rig in rigs:
+        addon.get_bone_matrix(rig.data.bones[0], 'rest')
+    edit_rest_pose(other)
+    assert cached_armatures() == {ao.data.as_pointer()}
+    # read again from the edited rest pose
+    np.testing.assert_allclose(addon.get_bone_matrix(other.data.bones[0], 'rest'), other.data.bones[0].matrix_local)
+
+def test_rebuild_invalidates(rigs):
+    ao, other = rigs
+    meta_obj = addon.get_rig_meta_object(other)
+    for bone in other.data.bones:
+        addon.get_bone_matrix(bone, 'rest')
+    # the new armature may reuse the memory of the removed one, only matrices of the new bones are cached
+    rebuilt = addon.create_rig('LOCAL_YAXIS_EXTEND', meta_obj)
+    pointer = rebuilt.data.as_pointer()
+    assert cached_armatures() == {pointer}
+    for (key_pointer, name, kind), mat in addon.matrix_cache.items():
+        bone = rebuilt.data.bones[name]
+        np.testing.assert_allclose(mat, np.linalg.inv(addon.bone_matrix_readers[kind[:-4]](bone)) if kind.endswith('_inv') else addon.bone_matrix_readers[kind](bone), atol=1e-6)
+    addon.remove_rig(meta_obj)
+    assert not addon.matrix_cache
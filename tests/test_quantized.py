@@ -0,0 +1,98 @@
+import math
+import numpy as np
+import pytest
+
+import RbxAnimationsCore as core
+from conftest import make_cfs, random_quats
+
+# largest position (studs) and angle (degrees) error of a bone quantized with bits and step: half a step on every
+#   axis, half a quantization step h on the three stored quaternion components and up to 3h on the dropped (largest)
+#   one, which is rebuilt from them, the angle is twice the quaternion's
+def error_bounds(bits, step):
+    h = .5 / ((2 ** (bits - 1) - 1) * math.sqrt(2))
+    return math.sqrt(3) * step / 2 * 1.001, math.degrees(2 * math.sqrt(12) * h) * 1.001
+
+def round_trip(anim, precision=None):
+    return core.unpack_animation(core.pack_quantized_animation(anim, precision))
+
+# a single bone animation with the given (frames x 4) quaternions and (frames x 3) positions
+def bone_animation(quats, positions):
+    cfs = make_cfs(np.asarray(quats)[:, None], np.asarray(positions)[:, None])
+    return core.AnimationBuffer(['Head'], np.arange(len(cfs)) / 30, cfs, (len(cfs) - 1) / 30)
+
+def test_error_bounds(animation):
+    error = core.compare_animations(animation, round_trip(animation))
+    position_bound, angle_bound = error_bounds(*core.quantize_default_precision)
+    assert 0 < error['position'] <= position_bound
+    assert 0 < error['angle'] <= angle_bound
+    assert position_bound < 9e-4 and angle_bound < .02
+
+def test_error_bounds_precision_rules(animation):
+    precision = [('Right*', 8, .01), ('Head', 16, .0001)]
+    decoded = round_trip(animation, precision)
+    bits, steps = core.quantize_precision(decoded.names, precision)
+    error = core.compare_animations(animation, decoded)
+    for name, bone_bits, step in zip(decoded.names, bits, steps):
+        position_bound, angle_bound = error_bounds(int(bone_bits), float(step))
+        assert error['bones'][name]['position'] <= position_bound
+        assert error['bones'][name]['angle'] <= angle_bound
+    assert error['bones']['RightLowerArm']['angle'] > error['bones']['Head']['angle']
+
+def test_stored_poses_and_times(animation):
+    decoded = round_trip(animation)
+    columns = [decoded.names.index(name) for name in animation.names]
+    np.testing.assert_array_equal(decoded.present[:, columns], animation.present)
+    np.testing.assert_allclose(decoded.times, animation.times, atol=1e-7)
+    assert decoded.duration == pytest.approx(animation.duration)
+
+def test_negative_w():
+    # w < 0, also as the largest component, and every other component as the largest negative one
+    quats = np.array([[-.9, .3, .2, .1], [-.6, .5, -.4, .3], [.1, -.9, .3, .2], [.2, .1, -.9, .3], [.3, .2, .1, -.9], [-1, 0, 0, 0]])
+    quats /= np.linalg.norm(quats, axis=-1, keepdims=True)
+    cfs = make_cfs(quats, np.zeros((len(quats), 3)))
+    bits = np.full(len(cfs), 14, dtype=np.uint8)
+    steps = np.full(len(cfs), .001, dtype=np.float32)
+
+    dropped, rots, positions = core.quantize_cfs(cfs, bits, steps)
+    np.testing.assert_array_equal(dropped, [0, 0, 1, 2, 3, 0])
+    angles = np.degrees(core.quat_angles(quats, core.mats_to_quats(core.dequantize_cfs(dropped, rots, positions, bits, steps)[:, 3:12].reshape(-1, 3, 3))))
+    assert np.all(angles <= error_bounds(14, .001)[1])
+
+    anim = bone_animation(quats, np.zeros((len(quats), 3)))
+    assert core.compare_animations(anim, round_trip(anim))['angle'] <= error_bounds(14, .001)[1]
+
+@pytest.mark.parametrize('bits', [8, 14, 16])
+def test_dropped_component_changes(bits):
+    # a full turn around a tilted axis, the largest component moves from w to x, y and z and back
+    angles = np.linspace(0, 2 * math.pi, 61)
+    axis = np.array([1, 2, 3]) / math.sqrt(14)
+    quats = np.concatenate((np.cos(angles / 2)[:, None], np.sin(angles / 2)[:, None] * axis), axis=-1)
+    anim = bone_animation(quats, np.zeros((len(quats), 3)))
+    precision = [('*', bits, .001)]
+
+    dropped = core.quantize_cfs(anim.cfs[:, 0], np.full(len(anim), bits, dtype=np.uint8), np.full(len(anim), .001, dtype=np.float32))[0]
+    assert set(dropped.tolist()) >= {0, 3} and np.count_nonzero(np.diff(dropped)) >= 2
+    assert core.compare_animations(anim, round_trip(anim, precision))['angle'] <= error_bounds(bits, .001)[1]
+
+def test_rotation_deltas_wrap():
+    # with 16 bits, components jumping between about -32767 and 32767 need more than 16 bits as a difference
+    quats = np.array([[.8, .6, 0, 0], [.8, -.6, 0, 0]] * 3)
+    anim = bone_animation(quats, np.zeros((len(quats), 3)))
+    assert core.compare_animations(anim, round_trip(anim, [('*', 16, .001)]))['angle'] <= error_bounds(16, .001)[1]
+
+def test_position_deltas_overflow_int32():
+    # differences of 4e9 position steps don't fit in an int32 (the positions themselves do)
+    positions = np.array([[2e6, -2e6, 0], [-2e6, 2e6, 1], [2e6, -2e6, -2e6], [0, 0, 0]])
+    assert np.abs(np.diff(positions, axis=0)).max() / .001 > 2 ** 31
+    quats = random_quats(np.random.default_rng(1), (len(positions),))
+    anim = bone_animation(quats, positions)
+
+    decoded = round_trip(anim)
+    np.testing.assert_allclose(decoded.cfs[:, 0, 0:3], positions, atol=.001)
+    assert core.compare_animations(anim, decoded)['angle'] <= error_bounds(*core.quantize_default_precision)[1]
+
+def test_state_carried_over_batches(animation):
+    payload = core.iter_payload_chunks(animation.duration, core.animation_bone_names(animation), len(animation),
+        [core.AnimationBuffer(animation.names, animation.times[n:n + 1], animation.cfs[n:n + 1], animation.duration, animation.present[n:n + 1])
+        for n in range(len(animation))], 'QUANTIZED')
+    assert b''.join(payload) == core.pack_quantized_animation(animation)
@@ -0,0 +1,88 @@
+import math
+import numpy as np
+import pytest
+
+import RbxAnimationsCore as core
+from conftest import make_cfs, random_quats
+
+# quaternions of a turn by angles (radians) around axis
+def turn(axis, angles):
+    axis = np.asarray(axis, dtype=np.float64) / np.linalg.norm(axis)
+    angles = np.asarray(angles, dtype=np.float64)
+    return np.concatenate((np.cos(angles / 2)[:, None], np.sin(angles / 2)[:, None] * axis), axis=-1)
+
+# largest position and angle (degrees) error of the dropped poses, interpolated between the kept ones like the importer does
+def reduction_error(cfs, times, keep):
+    quats = core.mats_to_quats(cfs[..., 3:12].reshape(cfs.shape[:-1] + (3, 3)))
+    pos_err = angle_err = 0.
+    for b in range(cfs.shape[1]):
+        kept = np.flatnonzero(keep[:, b])
+        for n in np.flatnonzero(~keep[:, b]):
+            hi = kept[np.searchsorted(kept, n)]
+            lo = kept[np.searchsorted(kept, n) - 1]
+            alpha = (times[n] - times[lo]) / (times[hi] - times[lo])
+            position = cfs[lo, b, 0:3] + (cfs[hi, b, 0:3] - cfs[lo, b, 0:3]) * alpha
+            pos_err = max(pos_err, np.linalg.norm(position - cfs[n, b, 0:3]))
+            angle_err = max(angle_err, math.degrees(core.quat_angles(core.slerp_quats(quats[lo, b], quats[hi, b], [alpha]), quats[n, b])[0]))
+    return pos_err, angle_err
+
+def test_linear_channel_keeps_end_keys():
+    times = np.arange(40) / 30
+    positions = np.array([1, -2, .5]) + np.array([3, 1, -2]) * times[:, None]
+    cfs = make_cfs(turn([1, 2, 3], times * 2)[:, None], positions[:, None])
+    keep = core.reduce_keyframes(cfs, times, .001, .01)
+    np.testing.assert_array_equal(np.flatnonzero(keep[:, 0]), [0, len(times) - 1])
+
+def test_constant_channel_keeps_end_keys():
+    cfs = np.tile(np.array(core.identity_cf, dtype=np.float64), (10, 2, 1))
+    keep = core.reduce_keyframes(cfs, np.arange(10) / 30, .001, .01)
+    np.testing.assert_array_equal(keep, np.isin(np.arange(10), [0, 9])[:, None].repeat(2, axis=1))
+
+def test_corner_is_kept():
+    # up at a constant speed until frame 12, then down again
+    times = np.arange(31) / 30
+    heights = np.minimum(times, times[12] * 2 - times)
+    cfs = make_cfs(turn([0, 1, 0], np.zeros(31))[:, None], np.stack((np.zeros(31), heights, np.zeros(31)), axis=-1)[:, None])
+    keep = core.reduce_keyframes(cfs, times, .001, .01)
+    np.testing.assert_array_equal(np.flatnonzero(keep[:, 0]), [0, 12, 30])
+
+def test_rotation_corner_is_kept():
+    times = np.arange(21) / 30
+    angles = np.where(np.arange(21) < 8, np.arange(21), 16 - np.arange(21)) * .1
+    cfs = make_cfs(turn([1, 0, 0], angles)[:, None], np.zeros((21, 1, 3)))
+    keep = core.reduce_keyframes(cfs, times, .001, .01)
+    np.testing.assert_array_equal(np.flatnonzero(keep[:, 0]), [0, 8, 20])
+
+@pytest.mark.parametrize('tolerance', [(.001, .01), (.05, 1), (1, 10)])
+def test_dropped_poses_within_tolerance(tolerance):
+    rng = np.random.default_rng(3)
+    frames, bones = 60, 4
+    times = np.sort(rng.uniform(0, 2, frames))
+    # smooth motion with some noise
+    angles = np.sin(times)[:, None] * rng.uniform(1, 3, bones) + rng.normal(0, .002, (frames, bones))
+    quats = np.stack([turn(rng.normal(size=3), angles[:, b]) for b in range(bones)], axis=1)
+    positions = np.sin(times)[:, None, None] * rng.normal(size=(bones, 3)) + rng.normal(0, .005, (frames, bones, 3))
+    cfs = make_cfs(quats, positions)
+
+    keep = core.reduce_keyframes(cfs, times, *tolerance)
+    assert np.all(keep[0]) and np.all(keep[-1])
+    pos_err, angle_err = reduction_error(cfs, times, keep)
+    assert pos_err <= tolerance[0] + 1e-9 and angle_err <= tolerance[1] + 1e-6
+    if tolerance[0] >= .05:
+        assert np.count_nonzero(keep) < keep.size / 2
+
+def test_short_animations():
+    cfs = make_cfs(random_quats(np.random.default_rng(5), (2, 3)), np.zeros((2, 3, 3)))
+    assert core.reduce_keyframes(cfs[:0], [], .001, .01).shape == (0, 3)
+    assert np.all(core.reduce_keyframes(cfs[:1], [0], .001, .01))
+    assert np.all(core.reduce_keyframes(cfs, [0, 1], .001, .01))
+
+def test_reduced_bake_round_trip():
+    # reduced animations still encode and decode with the kept poses only
+    times = np.arange(40) / 30
+    cfs = make_cfs(turn([0, 0, 1], times)[:, None], (np.array([0, 1, 0]) * times[:, None])[:, None])
+    keep = core.reduce_keyframes(cfs, times, .001, .01)
+    anim = core.build_animation(['Head'], cfs, times, times[-1], keep)
+    assert core.count_poses(anim) == 2
+    decoded = core.decode_animation(core.encode_animation(anim, 'BINARY32'))
+    np.testing.assert_allclose(decoded.times, [0, times[-1]], atol=1e-7)
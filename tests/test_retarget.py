@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+bpy = pytest.importorskip('bpy')
+from mathutils import Matrix
+import RbxAnimations as addon
+from conftest import random_quats
+
+bone_parents = {'HumanoidRootPart': None, 'LowerTorso': 'HumanoidRootPart', 'UpperTorso': 'LowerTorso', 'Head': 'UpperTorso', 'LeftUpperLeg': 'LowerTorso'}
+
+# an armature of the bones above with its own rest pose, the source rig is keyed over frames 1-10
+def make_armature(name, rng, keyed=False):
+    ao = bpy.data.objects.new(name, bpy.data.armatures.new(name))
+    bpy.context.scene.collection.objects.link(ao)
+    bpy.context.view_layer.objects.active = ao
+    bpy.ops.object.mode_set(mode='EDIT')
+    for bone_name, parent in bone_parents.items():
+        bone = ao.data.edit_bones.new(bone_name)
+        head = rng.uniform(-1, 1, 3)
+        bone.head = head
+        bone.tail = head + rng.uniform(.2, .5, 3)
+        bone.roll = rng.uniform(-3, 3)
+        bone.parent = ao.data.edit_bones.get(parent or '')
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    if keyed:
+        for bone in ao.pose.bones:
+            for frame in (1, 4, 10):
+                bone.location = rng.uniform(-.3, .3, 3)
+                bone.rotation_quaternion = random_quats(rng, ())
+                bone.keyframe_insert('location', frame=frame)
+                bone.keyframe_insert('rotation_quaternion', frame=frame)
+    return ao
+
+@pytest.fixture
+def rigs():
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    scene = bpy.context.scene
+    scene.frame_start, scene.frame_end = 1, 10
+    rng = np.random.default_rng(4)
+    return make_armature('Target', rng), make_armature('Source', rng, True)
+
+# the bone bases of a frame like the per-frame recursion set them, parents first from the updated parent pose
+def baseline_bases(target, source, bone_map, frame):
+    bpy.context.scene.frame_set(frame)
+    bases = {}
+    def visit(bone):
+        if bone.parent and bone.name in bone_map:
+            r_mat = bone.bone.matrix_local
+            p_mat = bone.parent.matrix
+            p_r_mat = bone.parent.bone.matrix_local
+            bone.matrix_basis = (p_r_mat.inverted() @ r_mat).inverted() @ (p_mat.inverted() @ source.pose.bones[bone_map[bone.name]].matrix)
+            bpy.context.view_layer.update()
+            bases[bone.name] = Matrix(bone.matrix_basis)
+        for child in bone.children:
+            visit(child)
+    visit(target.pose.bones['HumanoidRootPart'])
+    return bases
+
+def test_matches_per_frame_recursion(rigs):
+    target, source = rigs
+    # the leg stays unmapped, it keeps its basis
+    bone_map = {name: name for name in ('LowerTorso', 'UpperTorso', 'Head')}
+    baseline = {frame: baseline_bases(target, source, bone_map, frame) for frame in (1, 3, 10)}
+    for bone in target.pose.bones:
+        bone.matrix_basis = Matrix()
+
+    addon.copy_anim_state(target, source, bone_map)
+    for frame, bases in baseline.items():
+        bpy.context.scene.frame_set(frame)
+        for name, basis in bases.items():
+            np.testing.assert_allclose(target.pose.bones[name].matrix_basis, basis, atol=1e-4)
+            np.testing.assert_allclose(target.pose.bones[name].matrix, source.pose.bones[name].matrix, atol=1e-4)
+    assert not target.animation_data.action.fcurves.find('pose.bones["LeftUpperLeg"].location')
+
+def test_corrections(rigs):
+    target, source = rigs
+    bone_map = {name: name for name in ('LowerTorso', 'UpperTorso')}
+    correction = np.array(Matrix.Rotation(.5, 4, 'X'))
+    addon.copy_anim_state(target, source, bone_map, {'LowerTorso': correction})
+    bpy.context.scene.frame_set(4)
+    np.testing.assert_allclose(target.pose.bones['LowerTorso'].matrix, np.array(source.pose.bones['LowerTorso'].matrix) @ correction, atol=1e-4)
+    np.testing.assert_allclose(target.pose.bones['UpperTorso'].matrix, source.pose.bones['UpperTorso'].matrix, atol=1e-4)
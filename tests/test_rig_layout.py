@@ -0,0 +1,115 @@
+import copy
+import math
+import numpy as np
+import pytest
+
+import RbxAnimationsCore as core
+
+# y-up -> z-up (bpy_extras.io_utils.axis_conversion(from_forward='Z', from_up='Y', to_forward='-Y', to_up='Z'))
+to_blender = np.array([[1, 0, 0, 0], [0, 0, -1, 0], [0, 1, 0, 0], [0, 0, 0, 1]], dtype=np.float64)
+
+# rotation components of a turn by angle around axis
+def rotation(axis, angle):
+    axis = np.asarray(axis, dtype=np.float64) / np.linalg.norm(axis)
+    quat = np.concatenate(([math.cos(angle / 2)], math.sin(angle / 2) * axis))
+    return core.quats_to_mats(quat[None])[0].ravel().tolist()
+
+# the rig with its parts and joints turned (a different turn for every one), so that the bones get rolls
+def tilt_rig(rig):
+    rig = copy.deepcopy(rig)
+    stack = [rig]
+    i = 0
+    while stack:
+        rigsubdef = stack.pop()
+        rigsubdef['transform'][3:12] = rotation((1, i, 2), .3 * (i + 1))
+        if 'jointtransform0' in rigsubdef:
+            rigsubdef['jointtransform0'][3:12] = rotation((i, 1, -1), .2 * i)
+            rigsubdef['jointtransform1'][3:12] = rotation((2, -1, i), .25 * (i + 1))
+        stack.extend(reversed(rigsubdef['children']))
+        i += 1
+    return rig
+
+# edit bones of the tilted rig as built by Blender (EditBone head, tail and roll after align_roll, recorded with the
+#   recursive load_rigbone that layout_rig_bones replaces), LOCAL_AXIS_EXTEND lays out like LOCAL_YAXIS_EXTEND
+blender_layouts = {
+    'RAW': {
+        'heads': [(0, 0, 3.1924), (0.086384, 0.057747, 2.221511), (-0.706535, -0.202364, 2.093304), (0.306963, 0.443495, 2.785742), (1.30633, -0.630958, 3.639738), (1.430602, -0.161212, 3.208815), (0.024006, 0.282215, 4.38057)],
+        'tails': [(-0.002643, -0.001322, 3.201953), (-0.034322, -0.104622, 2.368365), (-0.81539, -0.418346, 2.156568), (0.253286, 0.199371, 2.78102), (1.326216, -0.872988, 3.580356), (1.522867, -0.369061, 3.104959), (0.170249, 0.135695, 4.24041)],
+        'rolls': [-0.287949, -0.565278, -0.797695, -1.71131, 1.135133, 0.391796, 0.188437],
+    },
+    'LOCAL_YAXIS_EXTEND': {
+        'heads': [(0, 0, 3.1924), (0.086384, 0.057747, 2.221511), (-0.706535, -0.202364, 2.093304), (0.306963, 0.443495, 2.785742), (1.30633, -0.630958, 3.639738), (1.430602, -0.161212, 3.208815), (0.024006, 0.282215, 4.38057)],
+        'tails': [(-0.002643, -0.001322, 3.201953), (-0.086384, -0.057747, 2.563289), (-0.293465, 0.202364, 1.348696), (-0.306963, -0.443495, 4.097058), (1.279084, -0.299351, 3.721098), (1.513598, 0.161212, 2.771785), (-0.024006, -0.282815, 5.183029)],
+        'rolls': [-0.287949, -0.28709, 2.128629, 0.440259, 1.36017, 1.304524, 1.964468],
+    },
+    'CONNECT': {
+        'heads': [(0, 0, 3.1924), (0.086384, 0.057747, 2.221511), (-0.706535, -0.202364, 2.093304), (0.306963, 0.443495, 2.785742), (1.30633, -0.630958, 3.639738), (1.430602, -0.161212, 3.208815), (0.024006, 0.282215, 4.38057)],
+        'tails': [(-0.002643, -0.001322, 3.201953), (-0.086384, -0.057747, 2.563289), (-0.293465, 0.202364, 1.348696), (-0.306963, -0.443495, 4.097058), (1.430602, -0.161212, 3.208815), (1.513598, 0.161212, 2.771785), (-0.024006, -0.282815, 5.183029)],
+        'rolls': [-0.287949, -0.28709, 2.128629, 0.440259, 1.562973, 1.304524, 1.964468],
+    },
+}
+blender_layouts['LOCAL_AXIS_EXTEND'] = blender_layouts['LOCAL_YAXIS_EXTEND']
+
+# bone directions with rolls and the EditBone.matrix Blender gives them (including the fallback near -y),
+#   and the roll EditBone.align_roll gives them for the axes
+bone_dirs = [(0, 1, 0), (0, -1, 0), (.0001, -1, 0), (.003, -1, .002), (1, 0, 0), (1, 2, 3), (-2, .5, -1), (0, 0, -1)]
+bone_rolls = [0, .5, -1, 2, -2.5, 3, 1.2, -.7]
+blender_bone_mats = [
+    [(1, 0, 0), (0, 1, 0), (0, 0, 1)],
+    [(-0.877583, 0, -0.479426), (0, -1, 0), (-0.479426, 0, 0.877583)],
+    [(-0.540302, 0.000046, 0.841471), (0.000046, -1, 0.000084), (0.841471, 0.000084, 0.540302)],
+    [(0.999403, 0.003, 0.034409), (0.003067, -0.999994, -0.001896), (0.034403, 0.002, -0.999406)],
+    [(0, 1, 0), (0.801144, 0, 0.598472), (0.598472, 0, -0.801144)],
+    [(-0.924204, 0.267261, 0.272797), (0.377734, 0.534522, 0.756044), (0.056245, 0.801784, -0.594962)],
+    [(0.42719, -0.872871, 0.235804), (-0.090483, 0.218218, 0.971696), (-0.899623, -0.436436, 0.01424)],
+    [(0.764842, 0, -0.644218), (0.644218, 0, 0.764842), (0, -1, 0)],
+]
+align_axes = [(0, 0, 1), (1, 0, 0), (0, 0, 1), (1, 1, 0), (0, 1, 1), (-1, 0, 2), (0, 1, 0), (0, 1, 0)]
+blender_aligned_rolls = [0, -1.570796, 0, -2.744811, -0.785398, 0, 1.107149, 0]
+
+def test_bone_roll_mats():
+    mats = core.bone_roll_mats(np.array(bone_dirs, dtype=np.float64), np.array(bone_rolls))
+    np.testing.assert_allclose(mats, blender_bone_mats, atol=1e-5)
+
+def test_align_bone_rolls():
+    rolls = core.align_bone_rolls(np.array(bone_dirs, dtype=np.float64), np.array(align_axes, dtype=np.float64))
+    np.testing.assert_allclose(rolls, blender_aligned_rolls, atol=1e-5)
+
+def test_align_bone_rolls_degenerate():
+    # no roll for bones without length or pointing along the axis
+    rolls = core.align_bone_rolls(np.array([(0, 0, 0), (0, 0, 2), (1, 0, 0)], dtype=np.float64), np.array([(1, 0, 0), (0, 0, -1), (1, 0, 0)], dtype=np.float64))
+    np.testing.assert_array_equal(rolls, [0, 0, 0])
+
+@pytest.mark.parametrize('rigging_type', sorted(blender_layouts))
+def test_layout_matches_blender(rig, rigging_type):
+    layout = core.layout_rig_bones(tilt_rig(rig), rigging_type, to_blender)
+    expected = blender_layouts[rigging_type]
+    np.testing.assert_allclose(layout['heads'], expected['heads'], atol=1e-5)
+    np.testing.assert_allclose(layout['tails'], expected['tails'], atol=1e-5)
+    np.testing.assert_allclose(layout['rolls'], expected['rolls'], atol=1e-5)
+
+@pytest.mark.parametrize('rigging_type', sorted(blender_layouts))
+def test_layout_matrices(rig, rigging_type):
+    layout = core.layout_rig_bones(tilt_rig(rig), rigging_type, to_blender)
+    np.testing.assert_allclose(layout['matrices'][:, :3, :3], core.bone_roll_mats(layout['tails'] - layout['heads'], layout['rolls']), atol=1e-12)
+    np.testing.assert_allclose(layout['matrices'][:, :3, 3], layout['heads'], atol=1e-12)
+    # the nicetransform maps the C0/C1 joint matrix onto the bone matrix
+    joints = to_blender @ layout['transforms'] @ layout['transforms1']
+    np.testing.assert_allclose(joints @ layout['nicetransforms'], layout['matrices'], atol=1e-12)
+
+def test_layout_order(rig):
+    layout = core.layout_rig_bones(rig, 'LOCAL_YAXIS_EXTEND', to_blender)
+    assert layout['names'] == ['HumanoidRootPart', 'LowerTorso', 'LeftUpperLeg', 'UpperTorso', 'RightUpperArm', 'RightLowerArm', 'Head']
+    assert layout['parents'] == [-1, 0, 1, 1, 3, 4, 3]
+    assert layout['names'] == core.pose_tree(rig)['bones']
+    assert layout['aux'] == [[name] for name in layout['names']]
+    np.testing.assert_array_equal(layout['transforms0'][0], np.identity(4))
+
+def test_layout_short_bone_keeps_raw_tail(rig):
+    # a leaf whose joint is at its part's origin can't point away from it
+    rig['children'][0]['children'][0]['jointtransform1'][0:3] = (0, 0, 0)
+    raw = core.layout_rig_bones(rig, 'RAW', to_blender)
+    nice = core.layout_rig_bones(rig, 'LOCAL_YAXIS_EXTEND', to_blender)
+    i = nice['names'].index('LeftUpperLeg')
+    np.testing.assert_allclose(nice['tails'][i], raw['tails'][i])
+    assert np.linalg.norm(nice['tails'][i] - nice['heads'][i]) == pytest.approx(.25)
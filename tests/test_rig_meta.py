@@ -0,0 +1,62 @@
+import base64
+import json
+import pytest
+
+import RbxAnimationsCore as core
+
+# object names carrying the metadata like the rig exporter writes them (Meta<index>q1<base32 chunk>q1, padding as 0)
+def meta_names(meta, chunk_size=32):
+    encoded = base64.b32encode(meta.encode('utf-8')).decode('ascii').replace('=', '0')
+    chunks = [encoded[i:i + chunk_size] for i in range(0, len(encoded), chunk_size)]
+    return ['Meta{:d}q1{}q1'.format(i + 1, chunk) for i, chunk in enumerate(chunks)]
+
+@pytest.fixture
+def meta(rig):
+    return json.dumps({'rigName': 'R15', 'parts': ['Head', 'UpperTorso'], 'rig': rig})
+
+def test_decode(meta):
+    names = meta_names(meta)
+    assert len(names) > 10
+    decoded, found = core.extract_rig_meta(names)
+    assert decoded == meta and found == names
+
+def test_decode_mixed_with_parts(meta):
+    # in any order, between the part meshes, with Blender's .001 suffixes and repeated by the .obj groups
+    names = meta_names(meta)
+    imported = ['Head', 'UpperTorso'] + [name + '.001' if i % 3 == 0 else name for i, name in enumerate(reversed(names))] + names[:4] + ['LowerTorso.002']
+    decoded, found = core.extract_rig_meta(imported)
+    assert decoded == meta
+    assert sorted(found) == sorted(name for name in imported if name.startswith('Meta'))
+
+def test_decode_lowercase_and_unicode(rig):
+    meta = json.dumps({'rigName': 'Rïg ☃', 'parts': [], 'rig': rig}, ensure_ascii=False)
+    names = [name[:6] + name[6:].lower() if name.startswith('Meta1') else name for name in meta_names(meta)]
+    assert core.extract_rig_meta(names)[0] == meta
+
+def test_missing_chunk(meta):
+    names = meta_names(meta)
+    with pytest.raises(ValueError, match='missing'):
+        core.extract_rig_meta(names[:3] + names[4:])
+
+def test_conflicting_chunk(meta):
+    names = meta_names(meta)
+    with pytest.raises(ValueError, match='more than once'):
+        core.extract_rig_meta(names + ['Meta2q1AAAAq1.001'])
+
+def test_chunk_zero(meta):
+    with pytest.raises(ValueError):
+        core.extract_rig_meta(['Meta0q1AAAAq1'] + meta_names(meta))
+
+def test_no_metadata():
+    with pytest.raises(ValueError, match='No rig metadata'):
+        core.extract_rig_meta(['Head', 'Metal', 'Meta1q1'])
+
+def test_read_obj_names(tmp_path, meta):
+    names = meta_names(meta)
+    lines = ['# exported rig', 'mtllib rig.mtl']
+    for name in ['Head'] + names + ['Head']:
+        lines += ['o ' + name, 'v 0 0 0', 'g  ' + name, 'f 1 1 1']
+    path = tmp_path / 'rig.obj'
+    path.write_bytes('\r\n'.join(lines).encode('utf-8'))
+    assert core.read_obj_names(str(path)) == ['Head'] + names
+    assert core.extract_rig_meta(core.read_obj_names(str(path)))[0] == meta
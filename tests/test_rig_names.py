@@ -0,0 +1,55 @@
+import json
+import os
+import pytest
+
+bpy = pytest.importorskip('bpy')
+import RbxAnimations as addon
+import RbxAnimationsCore as core
+from test_bake_cache import add_rig
+
+rig_blend = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Rig15ik.blend')
+
+# the rig of Rig15ik.blend (saved before rigs were namespaced, so without a suffix) next to a rig named Other
+@pytest.fixture
+def rigs():
+    bpy.ops.wm.open_mainfile(filepath=rig_blend)
+    scene = bpy.context.scene
+    scene.frame_end = scene.frame_start + 9
+    ao = addon.find_rig(None)
+    return ao, add_rig(ao, 'Other')
+
+def test_names(rigs):
+    ao, other = rigs
+    assert (ao.name, addon.get_rig_meta_object(ao).name) == ('__Rig', '__RigMeta')
+    assert (other.name, other.data.name, addon.get_rig_meta_object(other).name) == ('__Rig_Other', '__RigArm_Other', '__RigMeta_Other')
+    assert addon.get_rig_meta_name('Other') == '__RigMeta_Other'
+    for obj in (other, other.data, addon.get_rig_meta_object(other)):
+        assert addon.get_rig_suffix(obj) == '_Other'
+    assert addon.get_rig_suffix(ao) == addon.get_rig_suffix(bpy.data.objects['__RigMeta']) == ''
+    assert addon.get_rig_object(addon.get_rig_meta_object(other)) == other
+
+def test_rig_lookup(rigs):
+    ao, other = rigs
+    # metadata objects without metadata and other objects starting with the prefix are not rigs
+    bpy.context.scene.collection.objects.link(bpy.data.objects.new(addon.get_rig_meta_name('Empty'), None))
+    bpy.context.scene.collection.objects.link(bpy.data.objects.new('__RigMetaball', None))
+    assert [obj.name for obj in addon.get_rig_metas()] == ['__RigMeta', '__RigMeta_Other']
+    assert addon.get_rigs() == [ao, other]
+    assert addon.find_rig('Other') == other and addon.find_rig(json.loads(bpy.data.objects['__RigMeta']['RigMeta'])['rigName']) == ao
+    with pytest.raises(SystemExit):
+        addon.find_rig('Missing')
+
+def test_rigs_bake_in_one_sweep(rigs):
+    ao, other = rigs
+    bone = other.pose.bones['Head']
+    other.animation_data_create().action = bpy.data.actions.new('OtherAction')
+    for frame, x in ((1, 0), (10, .4)):
+        bone.location.x = x
+        bone.keyframe_insert('location', index=0, frame=frame)
+
+    anims = addon.serialize_rigs()
+    assert list(anims) == [ao, other]
+    for rig in (ao, other):
+        error = core.compare_animations(addon.serialize(ao=rig), anims[rig])
+        assert error['position'] < 1e-4 and error['angle'] < .01
+    assert core.compare_animations(anims[ao], anims[other])['position'] > .1
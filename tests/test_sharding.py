@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+import RbxAnimationsCore as core
+
+cases = [
+    ([range(1, 61)], 4, 1),
+    ([range(1, 61)], 4, 40),
+    ([range(1, 61)], 1, 1),
+    ([range(1, 601)], 7, 1),
+    ([range(1, 11), range(0, 250, 3), range(5, 6), range(100, 140)], 3, 1),
+    ([range(1, 31), range(1, 31), range(1, 31)], 8, 16),
+    ([range(1, 4)], 16, 1),
+    ([range(1, 61), range(0)], 4, 1),
+]
+
+@pytest.mark.parametrize('frame_lists, shard_count, min_shard_frames', cases)
+def test_every_frame_once(frame_lists, shard_count, min_shard_frames):
+    workers = core.shard_frames(frame_lists, shard_count, min_shard_frames)
+    assert 1 <= len(workers) <= shard_count
+    for n, frames in enumerate(frame_lists):
+        sharded = sorted(frame for worker in workers for bake, shard in worker if bake == n for frame in shard)
+        assert sharded == list(frames)
+
+@pytest.mark.parametrize('frame_lists, shard_count, min_shard_frames', cases)
+def test_shards_are_contiguous_runs(frame_lists, shard_count, min_shard_frames):
+    for worker in core.shard_frames(frame_lists, shard_count, min_shard_frames):
+        for bake, shard in worker:
+            frames = list(frame_lists[bake])
+            start = frames.index(shard[0])
+            assert shard and list(shard) == frames[start:start + len(shard)]
+
+@pytest.mark.parametrize('frame_lists, shard_count, min_shard_frames', cases)
+def test_balanced_loads(frame_lists, shard_count, min_shard_frames):
+    workers = core.shard_frames(frame_lists, shard_count, min_shard_frames)
+    loads = [sum(len(shard) for bake, shard in worker) for worker in workers]
+    assert max(loads) - min(loads) <= max(len(shard) for worker in workers for bake, shard in worker)
+    if len(workers) > 1 and all(len(frames) >= min_shard_frames for frames in frame_lists if len(frames)):
+        assert min(loads) >= min_shard_frames
+
+@pytest.mark.parametrize('total, workers', [(999, 1), (1000, 1), (1999, 1), (2000, 2), (8000, 8), (80000, 8)])
+def test_min_shard_frames(total, workers):
+    # starting a worker only pays off from min_shard_frames frames on
+    assert len(core.shard_frames([range(total)], 8, 1000)) == workers
+    assert len(core.shard_frames([range(total // 2), range(total - total // 2)], 8, 1000)) == workers
+
+def test_few_frames_single_worker():
+    assert len(core.shard_frames([range(1, 61)], 8, 100)) == 1
+
+# bakes shards of the animation by slicing it (see RbxAnimations.parallel_bake), the parts in worker order
+def bake_parts(anim, workers):
+    parts = []
+    for worker in workers:
+        for bake, shard in worker:
+            frames = np.array(shard)
+            parts.append(core.AnimationBuffer(anim.names, anim.times[frames], anim.cfs[frames], anim.duration, anim.present[frames]))
+    return parts
+
+@pytest.mark.parametrize('shard_count, min_shard_frames', [(1, 1), (3, 1), (5, 4), (24, 1)])
+def test_merge_restores_animation(animation, shard_count, min_shard_frames):
+    parts = bake_parts(animation, core.shard_frames([range(len(animation))], shard_count, min_shard_frames))
+    merged = core.merge_animations(parts)
+    assert len(merged) == len(animation) and merged.duration == animation.duration
+    np.testing.assert_array_equal(merged.times, animation.times)
+    columns = [merged.names.index(name) for name in animation.names]
+    np.testing.assert_array_equal(merged.present[:, columns], animation.present)
+    np.testing.assert_array_equal(merged.cfs[:, columns][animation.present], animation.cfs[animation.present])
+    assert core.encode_animation(merged) == core.encode_animation(animation)
+
+def test_merge_parts_with_different_bones(animation):
+    # parts baked from other bone subsets or orders, missing bones aren't stored
+    first = core.AnimationBuffer(animation.names[:3], animation.times[:10], animation.cfs[:10, :3], animation.duration, animation.present[:10, :3])
+    second = core.AnimationBuffer(animation.names[::-1], animation.times[10:], animation.cfs[10:, ::-1], animation.duration, animation.present[10:, ::-1])
+    merged = core.merge_animations([second, first])
+    np.testing.assert_array_equal(merged.times, animation.times)
+    columns = [merged.names.index(name) for name in animation.names]
+    expected = animation.present.copy()
+    expected[:10, 3:] = False
+    np.testing.assert_array_equal(merged.present[:, columns], expected)
+    np.testing.assert_array_equal(merged.cfs[:, columns][expected], animation.cfs[expected])
@@ -0,0 +1,65 @@
+import cProfile
+import time
+import pytest
+
+import RbxAnimationsCore as core
+
+@pytest.fixture(autouse=True)
+def timings():
+    core.timings.clear()
+    yield core.timings
+    core.timings.clear()
+
+def test_timed_adds_up(timings):
+    for i in range(3):
+        with core.timed('encode'):
+            time.sleep(.01)
+    with pytest.raises(ValueError):
+        with core.timed('file_io'):
+            raise ValueError()
+    assert timings['encode'][0] == 3 and timings['encode'][1] >= .03
+    # scopes left by an exception count too
+    assert timings['file_io'][0] == 1
+
+def test_report(timings):
+    timings.update({'frame_eval': [10, 2.], 'encode': [1, .5]})
+    report = core.get_timings_report(4.)
+    assert report['seconds'] == 4. and 'functions' not in report
+    assert list(report['scopes']) == ['frame_eval', 'encode', 'other']
+    assert report['scopes']['frame_eval'] == {'calls': 10, 'seconds': 2., 'share': .5}
+    assert report['scopes']['other'] == {'calls': 1, 'seconds': 1.5, 'share': .375}
+
+def test_report_of_empty_run(timings):
+    # scopes timed longer than the run (clock resolution) leave no negative rest
+    timings['encode'] = [1, .2]
+    assert core.get_timings_report(.1)['scopes']['other']['seconds'] == 0
+    assert core.get_timings_report(0)['scopes']['encode']['share'] == 0
+
+def test_report_functions():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    core.get_timings_report(1.)
+    sorted(range(1000), key=lambda x: -x)
+    profiler.disable()
+    functions = core.get_timings_report(1., profiler, top=3)['functions']
+    assert len(functions) == 3
+    assert [function['seconds'] for function in functions] == sorted((function['seconds'] for function in functions), reverse=True)
+    assert any(function['function'].startswith('RbxAnimationsCore.py:') for function in core.get_timings_report(1., profiler)['functions'])
+
+def test_profiled_operator():
+    bpy = pytest.importorskip('bpy')
+    import RbxAnimations as addon
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+
+    class Operator:
+        bl_label = 'Bake'
+        @addon.profiled
+        def execute(self, context):
+            with core.timed('encode'):
+                pass
+            return {'FINISHED'}
+
+    assert Operator().execute(bpy.context) == {'FINISHED'}
+    profile = addon.last_profile
+    assert profile['operator'] == 'Bake' and profile['scopes']['encode']['calls'] == 1 and 'functions' not in profile
+    assert profile['matrix_cache']['hits'] == profile['matrix_cache']['misses'] == 0